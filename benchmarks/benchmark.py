@@ -0,0 +1,191 @@
+# Benchmarks the interpreter on the example programs
+# Copyright 2022 Eli Fox
+#
+# Each run happens in its own process, so peak memory belongs to that program alone. Loading
+# the structure is timed separately from running it.
+
+import argparse, io, json, os, random, subprocess, sys, time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(BENCHMARK_DIR, '..', 'src')
+EXAMPLES_DIR = os.path.join(BENCHMARK_DIR, '..', 'examples')
+sys.path.insert(0, SRC_DIR)
+
+DEFAULT_RESULTS = os.path.join(BENCHMARK_DIR, 'results.json')
+DEFAULT_BASELINE = os.path.join(BENCHMARK_DIR, 'baseline.json')
+DEFAULT_REPEATS = 3
+DEFAULT_THRESHOLD = 10 # Percent
+SEED = 0
+
+# Input for each example. Anything not listed gets no input
+EXAMPLE_INPUTS = {
+    'brainfuck'     : '++++++++[>++++[>++>+++>+++>+<<<<-]>+>+>->>+[<]<-]>>.>---.+++++++..+++.>>.<-.<.+++.------.--------.>>+.!\n',
+    'cat'           : 'The quick brown fox jumps over the lazy dog.\n',
+    'deadfish'      : 'iisiiiisiiiiiiiioiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiiioiiiiiiiooiiio\n',
+    'digitalroot'   : '9876543210987654321\n',
+    'disan'         : '100\n',
+    'factorial'     : '20\n',
+    'gcd'           : '1071 462\n',
+    'primesieve'    : '100\n',
+}
+
+
+# Gets peak memory of this process in KiB, or None where the platform can't say
+def getPeakRss():
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, Linux reports KiB
+    if sys.platform == 'darwin':
+        peak //= 1024
+    return peak
+
+
+# Runs one program in this process and returns its measurements
+def measure(programFile, inputText, accelerate=False):
+    from craftyfunge import CraftyFunge
+    from common import CraftyFungeError
+
+    random.seed(SEED)
+    output = io.StringIO()
+
+    start = time.perf_counter()
+    interp = CraftyFunge(programFile, False, io.StringIO(inputText), output, accelerate=accelerate)
+    parseTime = time.perf_counter() - start
+
+    error = None
+    start = time.perf_counter()
+    try:
+        interp.run()
+    except CraftyFungeError as e:
+        error = e.msg
+    runTime = time.perf_counter() - start
+
+    return {
+        'steps'         : interp.steps,
+        'parseTime'     : parseTime,
+        'runTime'       : runTime,
+        'stepsPerSec'   : interp.steps / runTime if runTime > 0 else None,
+        'peakRss'       : getPeakRss(),
+        'outputLen'     : len(output.getvalue()),
+        'error'         : error,
+    }
+
+
+# Runs one program in a fresh process, so its memory use isn't mixed up with anything else
+def measureInProcess(programFile, inputText, accelerate=False):
+    command = [sys.executable, os.path.abspath(__file__), '--worker', programFile]
+    if accelerate:
+        command.append('-a')
+
+    result = subprocess.run(command, input=inputText, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout)
+
+
+# Runs a program several times, keeping the fastest times and the largest memory use
+def benchmark(programFile, inputText, repeats, accelerate=False):
+    best = None
+    for _ in range(repeats):
+        result = measureInProcess(programFile, inputText, accelerate)
+        if best is None:
+            best = result
+            continue
+
+        if result['steps'] != best['steps']:
+            raise RuntimeError(f'{programFile} took {best["steps"]} steps, then {result["steps"]}.')
+        best['parseTime'] = min(best['parseTime'], result['parseTime'])
+        best['runTime'] = min(best['runTime'], result['runTime'])
+        if result['peakRss'] is not None:
+            best['peakRss'] = max(best['peakRss'], result['peakRss'])
+
+    if best['runTime'] > 0:
+        best['stepsPerSec'] = best['steps'] / best['runTime']
+    return best
+
+
+# Gets the example programs to run, as (name, file, input)
+def getCases(names=None):
+    cases = []
+    for filename in sorted(os.listdir(EXAMPLES_DIR)):
+        name, ext = os.path.splitext(filename)
+        if ext != '.nbt' or (names and name not in names):
+            continue
+        cases.append((name, os.path.join(EXAMPLES_DIR, filename), EXAMPLE_INPUTS.get(name, '')))
+
+    return cases
+
+
+# Compares results to a baseline. Returns a list of messages about anything that got slower
+def compare(results, baseline, threshold):
+    regressions = []
+    for name, result in results.items():
+        old = baseline.get(name)
+        if old is None:
+            continue
+
+        if result['steps'] != old['steps']:
+            regressions.append(f'{name}: took {result["steps"]} steps, baseline took {old["steps"]}')
+
+        for key in ('parseTime', 'runTime'):
+            if old[key] and result[key] > old[key] * (1 + threshold/100):
+                change = (result[key] / old[key] - 1) * 100
+                regressions.append(f'{name}: {key} is {change:.1f}% slower ({old[key]*1000:.2f} ms -> {result[key]*1000:.2f} ms)')
+
+    return regressions
+
+
+def printResults(results):
+    print(f'{"Program":<14}{"Steps":>10}{"Steps/sec":>14}{"Parse (ms)":>12}{"Run (ms)":>12}{"Peak RSS (KiB)":>16}')
+    for name, result in results.items():
+        stepsPerSec = f'{result["stepsPerSec"]:.0f}' if result['stepsPerSec'] else '-'
+        peakRss = result['peakRss'] if result['peakRss'] is not None else '-'
+        print(f'{name:<14}{result["steps"]:>10}{stepsPerSec:>14}{result["parseTime"]*1000:>12.2f}{result["runTime"]*1000:>12.2f}{peakRss:>16}')
+
+
+def parseArgs():
+    parser = argparse.ArgumentParser(description='Benchmark the CraftyFunge interpreter on the example programs.')
+    parser.add_argument('names', nargs='*', metavar='NAME', help='Only run these examples. Defaults to all of them.')
+    parser.add_argument('-r', '--repeats', type=int, default=DEFAULT_REPEATS, help=f'Runs per program, keeping the fastest. Defaults to {DEFAULT_REPEATS}.')
+    parser.add_argument('-o', '--output', default=DEFAULT_RESULTS, help='Where to write the results as JSON. Defaults to "results.json".')
+    parser.add_argument('-b', '--baseline', default=DEFAULT_BASELINE, help='Baseline to compare against. Defaults to "baseline.json".')
+    parser.add_argument('-t', '--threshold', type=float, default=DEFAULT_THRESHOLD, help=f'Percent slower than the baseline that counts as a regression. Defaults to {DEFAULT_THRESHOLD}.')
+    parser.add_argument('--save-baseline', dest='saveBaseline', action='store_true', help='Save the results as the new baseline instead of comparing.')
+    parser.add_argument('-a', dest='accelerate', action='store_true', help='Run with loop acceleration.')
+    parser.add_argument('--worker', metavar='FILE', help=argparse.SUPPRESS)
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parseArgs()
+
+    # Measure a single program, reading its input from stdin
+    if args.worker:
+        print(json.dumps(measure(args.worker, sys.stdin.read(), args.accelerate)))
+        sys.exit()
+
+    results = dict()
+    for name, programFile, inputText in getCases(args.names):
+        results[name] = benchmark(programFile, inputText, args.repeats, args.accelerate)
+    printResults(results)
+
+    outputFile = args.baseline if args.saveBaseline else args.output
+    with open(outputFile, 'w') as f:
+        json.dump(results, f, indent=4)
+    print(f'Results written to {outputFile}')
+
+    if args.saveBaseline or not os.path.isfile(args.baseline):
+        sys.exit()
+
+    with open(args.baseline, 'r') as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print(f'Regressions over {args.threshold}% against {args.baseline}:')
+        for message in regressions:
+            print('  ' + message)
+        sys.exit(1)
+    print(f'No regressions over {args.threshold}% against {args.baseline}.')
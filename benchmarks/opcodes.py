@@ -0,0 +1,231 @@
+# Times each instruction handler on its own
+# Copyright 2022 Eli Fox
+#
+# Each handler is called directly, with the stack, position, and mode it needs set up again before
+# every call. The same calls are made with air in the same loop, so the difference is what the
+# instruction costs over an empty step. That includes dispatch, which is where changes to runStep
+# show up. Runs take turns with their air runs, and the median difference is kept. Results no bigger
+# than the spread between runs are flagged as noise instead of being given.
+
+import argparse, gc, json, os, statistics, sys, tempfile, time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARK_DIR, '..', 'src'))
+
+from common import *
+from craftyfunge import CraftyFunge, writeStructure, emptyList
+from instructions import MODE_ISRS
+
+# Lots of short runs are more likely to catch a quiet moment than a few long ones
+DEFAULT_CALLS = 2000
+DEFAULT_REPEATS = 30
+ROTATE_DEPTHS = [1, 8, 64, 512]
+
+# Where the handlers run, and where setBlock and getBlock point. It's off the ring
+START_POS = (2, 0, 0)
+TARGET_POS = (2, 0, 2)
+
+
+# Input that never runs out
+class EndlessInput():
+    def readline(self):
+        return '12345 67890\n'
+
+
+class NullOutput():
+    def write(self, s):
+        pass
+
+    def flush(self):
+        pass
+
+
+# An instruction to time. Blocks are run one after another from mode, which is how mode switches are
+# timed in pairs, and count how many times the instruction runs in them. Cells are put in the world
+# from START_POS on, for instructions that look at the blocks around them
+class Benchmark():
+    def __init__(self, name, handler, blocks, stack=[], cells=[], mode=Modes.DEFAULT, count=1):
+        self.name = name
+        self.handler = handler
+        self.blocks = blocks
+        self.stack = stack
+        self.cells = cells
+        self.mode = mode
+        self.count = count
+
+
+def getBenchmarks():
+    benchmarks = [
+        # Arithmetic and logic
+        Benchmark('add', 'ModeIsrDefault.add', [ADD], [7, 3]),
+        Benchmark('sub', 'ModeIsrDefault.sub', [SUB], [7, 3]),
+        Benchmark('mult', 'ModeIsrDefault.mult', [MULT], [7, 3]),
+        Benchmark('div', 'ModeIsrDefault.div', [DIV], [7, 3]),
+        Benchmark('mod', 'ModeIsrDefault.mod', [MOD], [7, 3]),
+        Benchmark('exp', 'ModeIsrDefault.exp', [EXP], [7, 3]),
+        Benchmark('neg', 'ModeIsrDefault.neg', [NEG], [3]),
+        Benchmark('logicalNot', 'ModeIsrDefault.logicalNot', [NOT], [3]),
+        Benchmark('greater', 'ModeIsrDefault.greater', [GREATER], [7, 3]),
+        Benchmark('less', 'ModeIsrDefault.less', [LESS], [7, 3]),
+
+        # Motion
+        Benchmark('changeDir', 'ModeIsrDefault.changeDir', [DIR], cells=[(DIR, 'east')]),
+        Benchmark('randDir', 'ModeIsrDefault.randDir', [RANDOM_DIR]),
+        Benchmark('skip', 'ModeIsrDefault.skip', [SKIP]),
+        Benchmark('skipCond', 'ModeIsrDefault.skipCond', [SKIP_COND], [0]),
+        Benchmark('conditional', 'ModeIsrDefault.conditional', [IF], [1], cells=[(IF, 'east')]),
+        Benchmark('goto', 'ModeIsrDefault.goto', [GOTO], list(START_POS)),
+        Benchmark('stop', 'ModeIsrDefault.stop', [STOP]),
+        Benchmark('raiseError', 'ModeIsrDefault.raiseError', [RAISE_ERROR]),
+
+        # Stack
+        Benchmark('dup', 'ModeIsrDefault.dup', [DUP], [3]),
+        Benchmark('popDestroyTop', 'ModeIsrDefault.popDestroyTop', [POP], [3]),
+        Benchmark('clear', 'ModeIsrDefault.clear', [CLEAR], [3]),
+        Benchmark('swap', 'ModeIsrDefault.swap', [SWAP], [7, 3]),
+        Benchmark('pushLen', 'ModeIsrDefault.pushLen', [PUSH_LEN], [1]),
+        Benchmark('pushNum', 'ModeIsrDefault.pushNum', ['red_wool'], [1]),
+        Benchmark('pushPos', 'ModeIsrDefault.pushPos', [PUSH_POS]),
+        Benchmark('pushNextBlock', 'ModeIsrDefault.pushNextBlock', [PUSH_NEXT_BLOCK], cells=[PUSH_NEXT_BLOCK, 'stone']),
+
+        # Input and output
+        Benchmark('outNum', 'ModeIsrDefault.outNum', [OUT_NUM], [3]),
+        Benchmark('outAscii', 'ModeIsrDefault.outAscii', [OUT_ASCII], [65]),
+        Benchmark('outNewline', 'ModeIsrDefault.outNewline', [OUT_NEWLINE]),
+        Benchmark('inNum', 'ModeIsrDefault.inNum', [IN_NUM]),
+        Benchmark('inAscii', 'ModeIsrDefault.inAscii', [IN_ASCII]),
+
+        # World and vars. Positions are popped z first
+        Benchmark('getBlock', 'ModeIsrDefault.getBlock', [GET_BLOCK], list(TARGET_POS)),
+        Benchmark('setBlock', 'ModeIsrDefault.setBlock', [SET_BLOCK], [BLOCK_TO_VALUE['stone']] + list(TARGET_POS)),
+        Benchmark('getVar', 'ModeIsrDefault.getVar', [GET_VAR], [3]),
+        Benchmark('setVar', 'ModeIsrDefault.setVar', [SET_VAR], [7, 3]),
+
+        # Modes. Switching happens in pairs, to come back to default mode
+        Benchmark('tunnel', 'ModeIsrDefault.tunnel + ModeIsrTunnel.tunnel', [TUNNEL, TUNNEL], count=2),
+        Benchmark('tunnel step', 'ModeIsrTunnel.runStep', [ADD], [7, 3], mode=Modes.TUNNEL),
+        Benchmark('inNumLiteral', 'ModeIsrDefault.inNumLiteral + ModeIsrInNumLiteral.inNumLiteral', [IN_NUM_LITERAL, IN_NUM_LITERAL], [1], count=2),
+        Benchmark('literal digit', 'ModeIsrInNumLiteral.pushNum', ['red_concrete'], [12], mode=Modes.IN_NUM_LITERAL),
+        Benchmark('literal neg', 'ModeIsrInNumLiteral.neg', [NEG], [12], mode=Modes.IN_NUM_LITERAL),
+        Benchmark('inStrLiteral', 'ModeIsrDefault.inStrLiteral + ModeIsrInStrLiteral.inStrLiteral', [IN_STR_LITERAL, IN_STR_LITERAL], count=2),
+        Benchmark('string char', 'ModeIsrInStrLiteral.pushCurrBlock', ['red_wool'], cells=['red_wool'], mode=Modes.IN_STR_LITERAL),
+    ]
+
+    # Rotating to various depths of a full stack, both ways
+    for depth in ROTATE_DEPTHS:
+        stack = list(range(1, depth+2))
+        benchmarks.append(Benchmark(f'rotate {depth}', 'ModeIsrDefault.rotate', [ROTATE], stack + [depth]))
+        benchmarks.append(Benchmark(f'rotate -{depth}', 'ModeIsrDefault.rotate', [ROTATE], stack + [-depth]))
+
+    return benchmarks
+
+
+# Lays out a ring: the start, a loop head, the cells, then a lane back to the head
+def makeRing(cells):
+    width = len(cells) + 3
+    size = [width, 1, 3]
+    blocks = emptyList(size)
+    for x in range(width):
+        for z in range(3):
+            blocks[x][0][z] = {'Name': 'air'}
+
+    def place(x, z, block):
+        if isinstance(block, tuple):
+            blocks[x][0][z] = {'Name': block[0], 'Properties': {'facing': block[1]}}
+        else:
+            blocks[x][0][z] = {'Name': block}
+
+    place(0, 0, (START, 'east'))
+    place(1, 0, (DIR, 'east'))
+    for x, block in enumerate(cells):
+        place(x+2, 0, block)
+    place(width-1, 0, (DIR, 'south'))
+    place(width-1, 1, (DIR, 'west'))
+    place(1, 1, (DIR, 'north'))
+    place(*TARGET_POS[::2], 'stone')
+
+    return blocks, size
+
+
+# Seconds to run the blocks some times from the ISR given, setting everything up again each time.
+# Like timeit, garbage collection is turned off while timing
+def timeCalls(interp, isr, blocks, stack, calls):
+    interpStack = interp.stack
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        for _ in range(calls):
+            interpStack.clear()
+            interpStack.extend(stack)
+            interp.pos = list(START_POS)
+            interp.isr = isr
+            for block in blocks:
+                interp.block = block # Number blocks read what to push from here
+                try:
+                    interp.isr.runStep(block)
+                except CraftyFungeError:
+                    pass
+        return time.perf_counter() - start
+    finally:
+        gc.enable()
+
+
+# Nanoseconds per instruction over air, and the noise it was measured with
+def runBenchmark(benchmark, tempDir, calls, repeats):
+    programFile = os.path.join(tempDir, 'ring.nbt')
+    writeStructure(programFile, *makeRing(benchmark.cells))
+    interp = CraftyFunge(programFile, False, EndlessInput(), NullOutput())
+
+    # The ISRs share the interpreter's stack, so it's only ever changed in place
+    isr = MODE_ISRS[benchmark.mode](interp)
+    airIsr = MODE_ISRS[Modes.DEFAULT](interp)
+    air = ['air'] * len(benchmark.blocks)
+
+    # Take turns, so anything else slowing the machine down hits both the same
+    differences = []
+    for _ in range(repeats):
+        elapsed = timeCalls(interp, isr, benchmark.blocks, benchmark.stack, calls)
+        elapsed -= timeCalls(interp, airIsr, air, benchmark.stack, calls)
+        differences.append(elapsed * 1e9 / (calls * benchmark.count))
+
+    # Half the spread of the middle half of the runs
+    quartiles = statistics.quantiles(differences, n=4)
+    return statistics.median(differences), (quartiles[2] - quartiles[0]) / 2
+
+
+def parseArgs():
+    parser = argparse.ArgumentParser(description='Time each CraftyFunge instruction handler.')
+    parser.add_argument('names', nargs='*', metavar='NAME', help='Only run these benchmarks. Defaults to all of them.')
+    parser.add_argument('-n', '--calls', type=int, default=DEFAULT_CALLS, help=f'Calls to each handler per run. Defaults to {DEFAULT_CALLS}.')
+    parser.add_argument('-r', '--repeats', type=int, default=DEFAULT_REPEATS, help=f'Runs per benchmark, keeping the median. Defaults to {DEFAULT_REPEATS}.')
+    parser.add_argument('-o', '--output', default=None, help='Also write the results to this file as JSON.')
+
+    args = parser.parse_args()
+    if args.repeats < 2:
+        parser.error('argument -r/--repeats: at least 2 runs are needed to tell the noise')
+    return args
+
+
+if __name__ == '__main__':
+    args = parseArgs()
+
+    results = dict()
+    print(f'{"Benchmark":<16}{"ns/op":>10}{"noise":>8}  Handler')
+    with tempfile.TemporaryDirectory() as tempDir:
+        for benchmark in getBenchmarks():
+            if args.names and benchmark.name not in args.names:
+                continue
+            ns, noise = runBenchmark(benchmark, tempDir, args.calls, args.repeats)
+
+            # Anything within the noise, including below zero, can't be told from air
+            if ns > noise:
+                results[benchmark.name] = {'handler': benchmark.handler, 'nsPerOp': ns, 'noise': noise}
+                print(f'{benchmark.name:<16}{ns:>10.1f}{noise:>8.1f}  {benchmark.handler}')
+            else:
+                results[benchmark.name] = {'handler': benchmark.handler, 'nsPerOp': None, 'noise': noise}
+                print(f'{benchmark.name:<16}{"noise":>10}{noise:>8.1f}  {benchmark.handler}')
+            sys.stdout.flush()
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4)
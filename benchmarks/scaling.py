@@ -0,0 +1,46 @@
+# Measures how load time and memory grow with the size of a program
+# Copyright 2022 Eli Fox
+
+import argparse, json, os, sys, tempfile
+
+from benchmark import measureInProcess
+from structuregen import StructureGenerator, parseMix, DEFAULT_MIX, DEFAULT_LOOP_COUNT
+
+DEFAULT_SIZES = [16, 32, 48, 64]
+
+
+def parseArgs():
+    parser = argparse.ArgumentParser(description='Measure load time and memory use of generated programs by volume.')
+    parser.add_argument('sizes', nargs='*', type=int, default=DEFAULT_SIZES, metavar='SIZE', help=f'Side lengths of the cubes to generate. Defaults to {" ".join(str(n) for n in DEFAULT_SIZES)}.')
+    parser.add_argument('-d', '--density', type=float, default=0.5, help='Fraction of unused blocks to fill with random blocks. Defaults to 0.5.')
+    parser.add_argument('-m', '--mix', type=parseMix, default=DEFAULT_MIX, help='Relative weights of each kind of segment, like "tunnel=2,loop=1".')
+    parser.add_argument('-n', '--loop-count', dest='loopCount', type=int, default=DEFAULT_LOOP_COUNT, help=f'How many times each loop runs. Defaults to {DEFAULT_LOOP_COUNT}.')
+    parser.add_argument('-s', '--seed', type=int, default=0, help='Random seed. Defaults to 0.')
+    parser.add_argument('-o', '--output', default=None, help='Also write the results to this file as JSON.')
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parseArgs()
+
+    print(f'{"Size":>6}{"Volume":>12}{"File (KiB)":>12}{"Load (ms)":>12}{"Run (ms)":>12}{"Steps":>10}{"Peak RSS (KiB)":>16}')
+    results = []
+    with tempfile.TemporaryDirectory() as tempDir:
+        for size in args.sizes:
+            programFile = os.path.join(tempDir, f'synthetic{size}.nbt')
+            StructureGenerator((size, size, size), args.density, args.mix, args.loopCount, seed=args.seed).write(programFile)
+
+            result = measureInProcess(programFile, '')
+            result['size'] = size
+            result['volume'] = size**3
+            result['fileSize'] = os.path.getsize(programFile)
+            results.append(result)
+
+            peakRss = result['peakRss'] if result['peakRss'] is not None else '-'
+            print(f'{size:>6}{size**3:>12}{result["fileSize"]//1024:>12}{result["parseTime"]*1000:>12.1f}{result["runTime"]*1000:>12.1f}{result["steps"]:>10}{peakRss:>16}')
+            sys.stdout.flush()
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4)
@@ -0,0 +1,245 @@
+# Generates large synthetic CraftyFunge programs for scaling benchmarks
+# Copyright 2022 Eli Fox
+#
+# The program snakes back and forth along rows in the x direction. Rows are 3 blocks apart in z,
+# so the lanes on either side are free for loops to return along, and layers are 2 blocks apart
+# in y. Each row is filled with segments: tunnels, counted loops, setBlock writes into a memory
+# region at the top of the structure, string literals, and arithmetic. Everything else is filled
+# with random blocks at the chosen density. Every generated program runs to a stop.
+
+import argparse, os, random, sys
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARK_DIR, '..', 'src'))
+
+from common import *
+from craftyfunge import writeStructure, emptyList
+
+MIN_SIZE = (8, 1, 3)
+ROW_SPACING = 3
+LAYER_SPACING = 2
+
+SEGMENT_KINDS = ['tunnel', 'loop', 'setblock', 'string', 'arith']
+DEFAULT_MIX = {kind: 1 for kind in SEGMENT_KINDS}
+DEFAULT_LOOP_COUNT = 10
+
+# Blocks that are safe anywhere. A second command block could be taken as the start
+VALUE_BLOCKS = sorted(block for block in VALUE_TO_BLOCK.values() if isinstance(block, str) and block != START)
+FILLER_BLOCKS = [block for block in VALUE_BLOCKS if block != 'air']
+SETBLOCK_VALUES = sorted(val for val, block in VALUE_TO_BLOCK.items() if block in FILLER_BLOCKS)
+DIGIT_BLOCKS = [f'{color}_concrete' for color in ['white'] + COLORS]
+
+X_DIRS = {+1: 'east', -1: 'west'}
+Z_DIRS = {+1: 'south', -1: 'north'}
+
+
+# Blocks for a number literal
+def numLiteral(n):
+    blocks = [IN_NUM_LITERAL]
+    if n < 0:
+        blocks.append(NEG)
+    blocks += [DIGIT_BLOCKS[int(digit)] for digit in str(abs(n))]
+    blocks.append(IN_NUM_LITERAL)
+    return blocks
+
+
+def parseMix(text):
+    mix = dict.fromkeys(SEGMENT_KINDS, 0)
+    for part in text.split(','):
+        kind, _, weight = part.partition('=')
+        if kind not in mix:
+            raise ValueError(f'Unknown segment kind "{kind}". Must be one of {", ".join(SEGMENT_KINDS)}.')
+        mix[kind] = float(weight) if weight else 1
+    return mix
+
+
+class StructureGenerator():
+    def __init__(self, size, density=0.0, mix=DEFAULT_MIX, loopCount=DEFAULT_LOOP_COUNT, memoryLayers=None, seed=0):
+        if any(n < low for n, low in zip(size, MIN_SIZE)):
+            raise ValueError(f'Structure must be at least {MIN_SIZE[0]}x{MIN_SIZE[1]}x{MIN_SIZE[2]}.')
+        if loopCount < 1:
+            raise ValueError('Loops must run at least once.')
+
+        self.size = list(size)
+        self.density = density
+        self.mix = mix
+        self.loopCount = loopCount
+        self.random = random.Random(seed)
+
+        # The top quarter is memory for setBlock by default
+        if memoryLayers is None:
+            memoryLayers = size[1] // 4
+        self.memoryLayers = min(memoryLayers, size[1]-1)
+
+        self.cells = dict()
+        self.start = (0, 0, 1)
+
+
+    def set(self, pos, name, facing=None):
+        block = {'Name': name}
+        if facing is not None:
+            block['Properties'] = {'facing': facing}
+        self.cells[pos] = block
+
+
+    # Random position in the memory region, relative to the start
+    def memoryPos(self):
+        y = self.random.randrange(self.size[1] - self.memoryLayers, self.size[1])
+        pos = (self.random.randrange(self.size[0]), y, self.random.randrange(self.size[2]))
+        return [pos[xyz] - self.start[xyz] for xyz in range(3)]
+
+
+    # Segments are lists of (step along the row, z offset, block name, facing)
+    def straight(self, blocks):
+        return [(i, 0, block, None) for i, block in enumerate(blocks)]
+
+
+    def makeSegment(self, kind, space, d):
+        rand = self.random
+
+        if kind == 'tunnel' and space >= 3:
+            inside = [rand.choice(FILLER_BLOCKS) for _ in range(rand.randint(1, space-2))]
+            inside = [block if block != TUNNEL else 'stone' for block in inside]
+            return self.straight([TUNNEL] + inside + [TUNNEL])
+
+        if kind == 'string' and space >= 4:
+            inside = [rand.choice(VALUE_BLOCKS) for _ in range(rand.randint(1, space-3))]
+            inside = [block if block != IN_STR_LITERAL else 'stone' for block in inside]
+            return self.straight([IN_STR_LITERAL] + inside + [IN_STR_LITERAL, CLEAR])
+
+        if kind == 'arith':
+            blocks = numLiteral(rand.randint(0, 99)) + numLiteral(rand.randint(1, 99))
+            blocks += [rand.choice([ADD, SUB, MULT, DIV, MOD, GREATER, LESS]), POP]
+            return self.straight(blocks) if len(blocks) <= space else None
+
+        if kind == 'setblock' and self.memoryLayers > 0:
+            blocks = numLiteral(rand.choice(SETBLOCK_VALUES))
+            for n in self.memoryPos():
+                blocks += numLiteral(n)
+            blocks.append(SET_BLOCK)
+            return self.straight(blocks) if len(blocks) <= space else None
+
+        if kind == 'loop':
+            # Counts down, going back along the lane on the +z side and leaving along the lane on the -z side
+            counter = numLiteral(self.loopCount)
+            head = len(counter)
+            body = [DIR, 'red_concrete', SUB, DUP, IF]
+            end = head + len(body) - 1
+            if end + 3 > space:
+                return None
+
+            segment = self.straight(counter)
+            segment += [(head + i, 0, block, None) for i, block in enumerate(body)]
+            segment[head] = (head, 0, DIR, X_DIRS[d])
+            segment[end] = (end, 0, IF, 'south')
+            segment += [
+                (end, +1, DIR, X_DIRS[-d]),
+                (head, +1, DIR, 'north'),
+                (end, -1, DIR, X_DIRS[d]),
+                (end+1, -1, DIR, 'south'),
+                (end+1, 0, DIR, X_DIRS[d]),
+                (end+2, 0, POP, None),
+            ]
+            segment += [(step, +1, 'air', None) for step in range(head+1, end)]
+            return segment
+
+        return None
+
+
+    # Fills the inside of a row with segments
+    def fillRow(self, y, z, d):
+        columns = list(range(1, self.size[0]-1))
+        if d < 0:
+            columns.reverse()
+
+        kinds = [kind for kind in SEGMENT_KINDS if self.mix.get(kind)]
+        weights = [self.mix[kind] for kind in kinds]
+        i = 0
+        while kinds and i < len(columns):
+            segment = self.makeSegment(self.random.choices(kinds, weights)[0], len(columns) - i, d)
+            # Leave the rest of the row empty if the segment doesn't fit
+            if segment is None:
+                break
+
+            for step, dz, block, facing in segment:
+                self.set((columns[i+step], y, z+dz), block, facing)
+            i += max(step for step, *_ in segment) + 1
+
+        # Nothing random can go on the path
+        for column in columns[i:]:
+            self.set((column, y, z), 'air')
+
+
+    # Lays out the path through every row of every layer
+    def layOutPath(self):
+        rows = list(range(1, self.size[2]-1, ROW_SPACING))
+        layers = list(range(0, self.size[1] - self.memoryLayers, LAYER_SPACING))
+        ends = {+1: self.size[0]-1, -1: 0}
+
+        self.set(self.start, START, 'east')
+        d = +1
+        for layerIndex, y in enumerate(layers):
+            layerRows = rows if layerIndex % 2 == 0 else rows[::-1]
+            dz = +1 if layerIndex % 2 == 0 else -1
+
+            for rowIndex, z in enumerate(layerRows):
+                # Every row after the first starts with a turn
+                if (y, z) != self.start[1:]:
+                    self.set((ends[-d], y, z), DIR, X_DIRS[d])
+                self.fillRow(y, z, d)
+
+                # Go to the next row, the next layer, or stop
+                if rowIndex < len(layerRows) - 1:
+                    self.set((ends[d], y, z), DIR, Z_DIRS[dz])
+                    for step in range(1, ROW_SPACING):
+                        self.set((ends[d], y, z + step*dz), 'air')
+                elif layerIndex < len(layers) - 1:
+                    self.set((ends[d], y, z), DIR, 'up')
+                    for step in range(1, LAYER_SPACING):
+                        self.set((ends[d], y+step, z), 'air')
+                else:
+                    self.set((ends[d], y, z), STOP)
+                d = -d
+
+
+    # Generates the structure as a nested list of blocks, like CraftyFunge.blocks
+    def generate(self):
+        self.layOutPath()
+
+        blocks = emptyList(self.size)
+        for x in range(self.size[0]):
+            for y in range(self.size[1]):
+                for z in range(self.size[2]):
+                    block = self.cells.get((x, y, z))
+                    if block is None:
+                        name = self.random.choice(FILLER_BLOCKS) if self.random.random() < self.density else 'air'
+                        block = {'Name': name}
+                    blocks[x][y][z] = block
+
+        return blocks
+
+
+    def write(self, filename):
+        writeStructure(filename, self.generate(), self.size)
+
+
+def parseArgs():
+    parser = argparse.ArgumentParser(description='Generate a large synthetic CraftyFunge program.')
+    parser.add_argument('filename', metavar='FILE', help='Where to write the structure file.')
+    parser.add_argument('size', nargs=3, type=int, metavar=('X', 'Y', 'Z'), help='Size of the structure.')
+    parser.add_argument('-d', '--density', type=float, default=0.0, help='Fraction of unused blocks to fill with random blocks. Defaults to 0.')
+    parser.add_argument('-m', '--mix', type=parseMix, default=DEFAULT_MIX, help=f'Relative weights of each kind of segment, like "tunnel=2,loop=1". Kinds are {", ".join(SEGMENT_KINDS)}. Defaults to all equal.')
+    parser.add_argument('-n', '--loop-count', dest='loopCount', type=int, default=DEFAULT_LOOP_COUNT, help=f'How many times each loop runs. Defaults to {DEFAULT_LOOP_COUNT}.')
+    parser.add_argument('--memory', dest='memoryLayers', type=int, default=None, help='Layers at the top to use as setBlock memory. Defaults to a quarter of the height.')
+    parser.add_argument('-s', '--seed', type=int, default=0, help='Random seed. Defaults to 0.')
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parseArgs()
+    try:
+        generator = StructureGenerator(args.size, args.density, args.mix, args.loopCount, args.memoryLayers, args.seed)
+    except ValueError as e:
+        sys.exit(e)
+    generator.write(args.filename)
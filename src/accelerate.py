@@ -0,0 +1,486 @@
+# Speeds up hot loops that only do arithmetic on the stack
+# Copyright 2022 Eli Fox
+#
+# Once a loop head has been passed enough times, one trip around the loop is recorded. If it
+# only touches the stack, the trip is run symbolically to get its effect as a function of the
+# values it pops, which is compiled into a Python function that repeats it until a branch
+# would go the other way. When each trip just adds a constant to each stack slot, the number
+# of trips left is worked out directly.
+#
+# A summary is only used while the stack is deeper than everything a trip pops, so the
+# quirks of push and pop on an empty stack never come into it. Division by zero and anything
+# else unusual is left to the interpreter, so results are the same as normal execution.
+
+import sys
+
+from common import *
+from instructions import VALID_COLORS
+
+# Loop heads to count visits at
+ANCHOR_BLOCKS = {DIR, IF, SKIP, SKIP_COND}
+HOT_THRESHOLD = 16
+
+# Branches pop their condition, which is usually a copy of something still on the stack, so trips
+# starting there rarely look like a plain count. Let other blocks in the same loop get hot first
+BRANCH_HOT_THRESHOLD = 2*HOT_THRESHOLD
+MAX_TRACE_LENGTH = 4096
+
+# Instructions a loop can use in default mode. Anything else with an instruction stops it
+PURE_BLOCKS = {
+    ADD, SUB, MULT, DIV, MOD, EXP, NEG,
+    NOT, GREATER, LESS,
+    DIR, SKIP, SKIP_COND, IF,
+    TUNNEL, IN_NUM_LITERAL, IN_STR_LITERAL,
+    DUP, POP, SWAP, PUSH_LEN,
+    PUSH_NEXT_BLOCK, PUSH_POS,
+}
+IMPURE_BLOCKS = {
+    RANDOM_DIR, CLEAR, ROTATE,
+    OUT_NUM, OUT_ASCII, OUT_NEWLINE, RAISE_ERROR,
+    IN_NUM, IN_ASCII,
+    GET_BLOCK, SET_BLOCK,
+    GET_VAR, SET_VAR,
+    GOTO, STOP,
+}
+
+
+# Affine forms are (coefficients, constant). Coefficients are keyed by input index, or 'L' for the stack length
+def affAdd(a, b, scale=1):
+    coeffs = dict(a[0])
+    for key, coeff in b[0].items():
+        coeffs[key] = coeffs.get(key, 0) + scale*coeff
+        if coeffs[key] == 0:
+            del coeffs[key]
+    return (coeffs, a[1] + scale*b[1])
+
+
+def affScale(a, k):
+    if k == 0:
+        return ({}, 0)
+    return ({key: k*coeff for key, coeff in a[0].items()}, k*a[1])
+
+
+def affEval(a, inputs, stackLen):
+    total = a[1]
+    for key, coeff in a[0].items():
+        total += coeff * (stackLen if key == 'L' else inputs[key])
+    return total
+
+
+# A symbolic value: Python code for it, and its affine form or truth condition if known
+class Val():
+    def __init__(self, code, aff=None, pred=None):
+        self.code = code
+        self.aff = aff
+        self.pred = pred
+
+    @staticmethod
+    def const(n):
+        return Val(repr(n) if n >= 0 else f'({n})', ({}, n))
+
+    def isConst(self):
+        return self.aff is not None and not self.aff[0]
+
+
+# Turns a recorded trip around a loop into compiled code
+class CycleCompiler():
+    def __init__(self, interp, trace):
+        self.interp = interp
+        self.trace = trace
+
+        self.lines = []
+        self.temps = 0
+        self.stack = []
+        self.reach = 0 # How many values below the trip it pops
+        self.guards = []
+        self.canFail = False
+        self.sign = +1
+
+
+    def temp(self, code, aff=None, pred=None):
+        name = f't{self.temps}'
+        self.temps += 1
+        self.lines.append(f'{name} = {code}')
+        return Val(name, aff, pred)
+
+
+    def pop(self):
+        if self.stack:
+            return self.stack.pop()
+
+        val = Val(f's{self.reach}', ({self.reach: 1}, 0))
+        self.reach += 1
+        return val
+
+
+    def popN(self, n):
+        return [self.pop() for _ in range(n)]
+
+
+    def push(self, val):
+        self.stack.append(val)
+
+
+    # The branch taken depends on whether val is nonzero
+    def guard(self, val, expected):
+        self.lines.append(f'if {"not " if expected else ""}{val.code}: break')
+
+        if val.pred is not None:
+            kind, aff, negated = val.pred
+            self.guards.append((kind, aff, expected != negated))
+        elif val.aff is not None:
+            self.guards.append(('nonzero', val.aff, expected))
+        else:
+            self.guards.append(None)
+
+
+    # Arithmetic, matching ModeIsrDefault
+    def binary(self, block):
+        b, a = self.popN(2)
+
+        if block == ADD:
+            aff = affAdd(a.aff, b.aff) if a.aff and b.aff else None
+            self.push(self.temp(f'{a.code} + {b.code}', aff))
+        elif block == SUB:
+            aff = affAdd(a.aff, b.aff, -1) if a.aff and b.aff else None
+            self.push(self.temp(f'{a.code} - {b.code}', aff))
+        elif block == MULT:
+            aff = None
+            if a.isConst() and b.aff:
+                aff = affScale(b.aff, a.aff[1])
+            elif b.isConst() and a.aff:
+                aff = affScale(a.aff, b.aff[1])
+            self.push(self.temp(f'{a.code} * {b.code}', aff))
+        elif block in (DIV, MOD):
+            # Dividing by zero is an error, so leave that trip to the interpreter
+            self.canFail = True
+            self.lines.append(f'if {b.code} == 0: break')
+            op = '//' if block == DIV else '%'
+            self.push(self.temp(f'{a.code} {op} {b.code}'))
+        elif block == EXP:
+            self.push(self.temp(f'{a.code} ** {b.code} if {b.code} > 1 else 0'))
+        elif block == GREATER:
+            pred = ('positive', affAdd(a.aff, b.aff, -1), False) if a.aff and b.aff else None
+            self.push(self.temp(f'1 if {a.code} > {b.code} else 0', pred=pred))
+        elif block == LESS:
+            pred = ('negative', affAdd(a.aff, b.aff, -1), False) if a.aff and b.aff else None
+            self.push(self.temp(f'1 if {a.code} < {b.code} else 0', pred=pred))
+
+
+    def logicalNot(self):
+        a = self.pop()
+        if a.pred is not None:
+            kind, aff, negated = a.pred
+            pred = (kind, aff, not negated)
+        elif a.aff is not None:
+            pred = ('nonzero', a.aff, True)
+        else:
+            pred = None
+        self.push(self.temp(f'0 if {a.code} else 1', pred=pred))
+
+
+    # Number literal digits, matching ModeIsrInNumLiteral
+    def literalDigit(self, block):
+        if block.startswith('white') and not block.endswith('concrete'):
+            return
+
+        digit = BLOCK_TO_PUSHNUM[block]
+        while digit // 10 > 0:
+            digit //= 10
+
+        a = self.pop()
+        if a.isConst():
+            self.push(Val.const((abs(a.aff[1])*10 + digit) * self.sign))
+        else:
+            self.push(self.temp(f'(abs({a.code})*10 + {digit}) * {self.sign}'))
+
+
+    def literalNeg(self):
+        self.sign = -1
+        a = self.pop()
+        if a.isConst():
+            self.push(Val.const(-abs(a.aff[1])))
+        else:
+            self.push(self.temp(f'-abs({a.code})'))
+
+
+    def pushBlockVal(self, pos):
+        val = self.interp.isr.blockValAtPos(*pos)
+        if val is not None:
+            self.push(Val.const(val))
+
+
+    # Runs one recorded step symbolically. Returns False if the step can't be summarised
+    def runStep(self, pos, block, mode, dirBefore, dirAfter, posAfter):
+        if mode == Modes.TUNNEL:
+            return True
+
+        if mode == Modes.IN_STR_LITERAL:
+            if block != IN_STR_LITERAL:
+                self.pushBlockVal(pos)
+            return True
+
+        if mode == Modes.IN_NUM_LITERAL:
+            if block == IN_NUM_LITERAL:
+                self.sign = +1
+            elif block in VALID_COLORS:
+                self.literalDigit(block)
+            elif block == NEG:
+                self.literalNeg()
+            return True
+
+        # Default mode
+        if block in IMPURE_BLOCKS:
+            return False
+
+        if block in VALID_COLORS:
+            self.push(Val.const(BLOCK_TO_PUSHNUM[block]))
+        elif block in (ADD, SUB, MULT, DIV, MOD, EXP, GREATER, LESS):
+            self.binary(block)
+        elif block == NEG:
+            a = self.pop()
+            self.push(self.temp(f'-{a.code}', affScale(a.aff, -1) if a.aff else None))
+        elif block == NOT:
+            self.logicalNot()
+        elif block == IF:
+            facing = self.interp.getFacing(*pos)
+            self.guard(self.pop(), dirAfter == facing)
+        elif block == SKIP_COND:
+            delta = DIRS_DEL[dirBefore]
+            skipped = posAfter == tuple(pos[xyz] + 2*delta[xyz] for xyz in range(3))
+            self.guard(self.pop(), not skipped)
+        elif block == IN_NUM_LITERAL:
+            self.sign = +1
+            self.push(Val.const(0))
+        elif block == DUP:
+            a = self.pop()
+            self.push(a)
+            self.push(a)
+        elif block == POP:
+            self.pop()
+        elif block == SWAP:
+            b, a = self.popN(2)
+            self.push(b)
+            self.push(a)
+        elif block == PUSH_LEN:
+            # The real length, which is never zero here
+            offset = len(self.stack) - self.reach
+            self.push(Val(f'(L + {offset})', ({'L': 1}, offset)))
+        elif block == PUSH_NEXT_BLOCK:
+            delta = DIRS_DEL[dirBefore]
+            self.pushBlockVal(tuple(pos[xyz] + delta[xyz] for xyz in range(3)))
+        elif block == PUSH_POS:
+            for n in pos:
+                self.push(Val.const(n))
+
+        return True
+
+
+    # Returns a CycleSummary, or None if the trip does something other than stack arithmetic
+    def compile(self):
+        for entry in self.trace:
+            if not self.runStep(*entry):
+                return None
+
+        # Read what's popped, then replace it with what's pushed once every check has passed
+        body = ['L = len(stack)', f'if L <= {self.reach}: break']
+        body += [f's{k} = stack[{-1-k}]' for k in range(self.reach)]
+        body += self.lines
+        body += ['pop()'] * self.reach
+        body += [f'append({val.code})' for val in self.stack]
+        body += ['n += 1']
+
+        source = 'def cycle(stack, limit):\n'
+        source += '    pop = stack.pop\n'
+        source += '    append = stack.append\n'
+        source += '    n = 0\n'
+        source += '    while n < limit:\n'
+        source += ''.join(f'        {line}\n' for line in body)
+        source += '    return n\n'
+
+        namespace = dict()
+        exec(compile(source, '<cycle>', 'exec'), namespace)
+
+        return CycleSummary(namespace['cycle'], len(self.trace), self.reach, self.getDrift(), self.guards)
+
+
+    # If each trip adds a constant to each slot, gets the affine form of the amount added, else None
+    def getDrift(self):
+        if self.canFail or len(self.stack) != self.reach or None in self.guards:
+            return None
+
+        drift = []
+        for k in range(self.reach):
+            val = self.stack[-1-k]
+            if val.aff is None or val.aff[0].get(k) != 1:
+                return None
+
+            # Anything besides the slot itself has to be constant between trips
+            change = affAdd(val.aff, ({k: 1}, 0), -1)
+            if any(key != 'L' for key in change[0]):
+                return None
+            drift.append(change)
+
+        return drift
+
+
+# Whether a check on a value comes out as expected
+def checkPasses(kind, value, expected):
+    if kind == 'nonzero':
+        return (value != 0) == expected
+    if kind == 'negative':
+        value = -value
+    return (value > 0) == expected
+
+
+# First number of trips n >= 0 where a check on value + n*delta stops passing, or None if it never does
+def firstFailure(kind, value, delta, expected):
+    if not checkPasses(kind, value, expected):
+        return 0
+
+    if kind == 'nonzero':
+        if not expected:
+            return 1 if delta != 0 else None
+        if delta == 0 or (-value) % delta != 0 or -value // delta < 0:
+            return None
+        return -value // delta
+
+    # Negative is the same as positive with everything flipped
+    if kind == 'negative':
+        value, delta = -value, -delta
+
+    # The check passes now, so value > 0 if expected, else value <= 0
+    if expected:
+        return None if delta >= 0 else (value - delta - 1) // -delta
+    else:
+        return None if delta <= 0 else (-value) // delta + 1
+
+
+class CycleSummary():
+    def __init__(self, cycle, length, reach, drift, guards):
+        self.cycle = cycle
+        self.length = length
+        self.reach = reach
+        self.drift = drift
+        self.guards = guards
+
+
+    # Jumps straight to the last trip that would pass every check. Returns the number of trips, or None
+    def jump(self, stack):
+        stackLen = len(stack)
+        if self.drift is None or stackLen <= self.reach:
+            return None
+
+        inputs = [stack[-1-k] for k in range(self.reach)]
+        deltas = [affEval(change, inputs, stackLen) for change in self.drift]
+
+        trips = None
+        for kind, aff, expected in self.guards:
+            value = affEval(aff, inputs, stackLen)
+            delta = sum(coeff*deltas[key] for key, coeff in aff[0].items() if key != 'L')
+            n = firstFailure(kind, value, delta, expected)
+            if n is not None and (trips is None or n < trips):
+                trips = n
+
+        if trips is None:
+            return None
+
+        for k in range(self.reach):
+            stack[-1-k] += trips * deltas[k]
+        return trips
+
+
+    # Runs as many trips as possible. Returns the number run
+    def run(self, stack, limit=sys.maxsize):
+        trips = self.jump(stack)
+        if trips is None:
+            trips = self.cycle(stack, limit)
+        return trips
+
+
+# Runs an interpreter, replacing hot loops with their summaries
+class LoopAccelerator():
+    def __init__(self, interp):
+        self.interp = interp
+        self.visits = dict()
+        self.summaries = dict()
+        self.rejected = set()
+        self.cellsHash = interp.cellsHash
+
+        self.recordingKey = None
+        self.trace = []
+
+
+    def visitAnchor(self, key, block):
+        interp = self.interp
+
+        # Summaries read blocks along the path, so start over if the world changed
+        if interp.cellsHash != self.cellsHash:
+            self.cellsHash = interp.cellsHash
+            self.summaries.clear()
+            self.rejected.clear()
+            self.visits.clear()
+            self.recordingKey = None
+            self.trace = []
+
+        # Finished a trip around the loop
+        if key == self.recordingKey:
+            summary = CycleCompiler(interp, self.trace).compile()
+            if summary is not None:
+                self.summaries[key] = summary
+            else:
+                self.rejected.add(key)
+            self.recordingKey = None
+            self.trace = []
+            return
+
+        if self.recordingKey is not None or key in self.rejected:
+            return
+
+        summary = self.summaries.get(key)
+        if summary is not None:
+            interp.steps += summary.length * summary.run(interp.stack)
+            return
+
+        self.visits[key] = self.visits.get(key, 0) + 1
+        threshold = BRANCH_HOT_THRESHOLD if block in (IF, SKIP_COND) else HOT_THRESHOLD
+        if self.visits[key] >= threshold:
+            self.recordingKey = key
+
+
+    def stopRecording(self):
+        self.rejected.add(self.recordingKey)
+        self.recordingKey = None
+        self.trace = []
+
+
+    def run(self):
+        interp = self.interp
+
+        while interp.running:
+            block = interp.getBlock(*interp.pos)
+
+            if block in ANCHOR_BLOCKS and interp.mode == Modes.DEFAULT:
+                self.visitAnchor((tuple(interp.pos), interp.dir), block)
+
+            # Recording a trip around a loop
+            recording = False
+            if self.recordingKey is not None:
+                mode = interp.mode
+                if (mode == Modes.DEFAULT and block in IMPURE_BLOCKS) or len(self.trace) >= MAX_TRACE_LENGTH:
+                    self.stopRecording()
+                else:
+                    recording = True
+                    pos = tuple(interp.pos)
+                    dirBefore = interp.dir
+
+            interp.block = block
+            interp.steps += 1
+            interp.runStep()
+
+            if not interp.wentTo:
+                interp.move()
+            interp.wentTo = False
+
+            if recording:
+                self.trace.append((pos, block, mode, dirBefore, interp.dir, tuple(interp.pos)))
\ No newline at end of file
@@ -0,0 +1,708 @@
+# Runs one program over many inputs at once, keeping runs that take the same path in lockstep
+# Copyright 2022 Eli Fox
+
+import collections, io, sys
+
+import numpy as np
+
+from common import *
+import craftyfunge
+from craftyfunge import CraftyFunge
+from instructions import ModeIsrDefault, VALID_COLORS
+
+# Stacks and vars are int64 while every value is below this, leaving room to check an add or multiply
+# in floats first. A group switches to Python ints the first time a value might not fit
+SAFE_MAGNITUDE = 2.0**62
+
+# Blocks that can't be run in lockstep. Runs that reach one are finished by the normal interpreter
+SCALAR_BLOCKS = {RANDOM_DIR, SET_BLOCK}
+
+# Groups smaller than this are finished by the normal interpreter, which is faster for only a few runs
+MIN_GROUP_SIZE = 8
+
+
+# One run of the batch, with everything that isn't kept in its group's arrays
+class BatchRun():
+    # Input is buffered exactly like the interpreter does it
+    inputReadLine = CraftyFunge.inputReadLine
+    inputChar = CraftyFunge.inputChar
+
+    def __init__(self, inputText):
+        self.inputText = inputText
+        self.input = io.StringIO(inputText)
+        self.inputBuffer = collections.deque()
+        self.inputLines = None # Runs are never gone back on, so no input is kept
+        self.inputLine = 0
+        self.inputBytes = 0
+
+        self.outputParts = []
+        self.outputLen = 0
+
+        self.steps = 0
+        self.stack = []
+        self.error = None
+        self.detached = False
+
+        # The input instructions are borrowed, pushing onto a stack of their own
+        self.isr = ModeIsrDefault(self)
+
+
+    @property
+    def output(self):
+        return ''.join(self.outputParts)
+
+
+    def outputStr(self, s):
+        self.outputLen += len(s)
+        self.outputParts.append(s)
+
+
+    # Reads a number or character with the interpreter's rules, giving what it would push
+    def readInput(self, block):
+        self.stack.clear()
+        if block == IN_NUM:
+            self.isr.inNum()
+        else:
+            self.isr.inAscii()
+        return self.stack.pop() if self.stack else 0
+
+
+# Runs at the same position, direction, and mode. Each row of the arrays is one run
+class Group():
+    def __init__(self, ids, data, lens, vars, pos, dir, mode=Modes.DEFAULT, sign=+1, steps=0):
+        self.ids = ids
+        self.data = data # Stacks, bottom first, padded to the same width
+        self.lens = lens
+        self.vars = vars # Var index to an array of its value in each run
+        self.pos = pos
+        self.dir = dir
+        self.mode = mode
+        self.sign = sign
+        self.steps = steps
+        self.wentTo = False
+        self.running = True
+
+
+    def __len__(self):
+        return len(self.ids)
+
+
+    @property
+    def wide(self):
+        return self.data.dtype == object
+
+
+    # Switches to Python ints, which can't overflow
+    def widen(self):
+        self.data = self.data.astype(object)
+        self.vars = {index: values.astype(object) for index, values in self.vars.items()}
+
+
+    # Widens if any of the estimated results of an operation might not fit
+    def checkFits(self, estimate):
+        if not self.wide and np.any(np.abs(estimate) >= SAFE_MAGNITUDE):
+            self.widen()
+
+
+    # Returns 0 for runs with an empty stack
+    def pop(self):
+        rows = np.arange(len(self.ids))
+        nonempty = self.lens > 0
+        values = np.where(nonempty, self.data[rows, np.maximum(self.lens - 1, 0)], 0)
+        self.lens -= nonempty
+        return values
+
+
+    # Pushes a value for each run. Zero isn't pushed onto an empty stack
+    def push(self, values, where=None):
+        pushing = (values != 0) | (self.lens > 0)
+        if where is not None:
+            pushing &= where
+
+        needed = int(self.lens.max(initial=0)) + 1
+        if needed > self.data.shape[1]:
+            grown = np.zeros((len(self.ids), max(2 * self.data.shape[1], needed)), dtype=self.data.dtype)
+            grown[:, :self.data.shape[1]] = self.data
+            self.data = grown
+
+        rows = np.nonzero(pushing)[0]
+        self.data[rows, self.lens[rows]] = values[rows]
+        self.lens += pushing
+
+
+    def pushConst(self, n):
+        self.push(np.full(len(self.ids), n, dtype=self.data.dtype))
+
+
+    # Pushes values that came from outside, like input
+    def pushValues(self, values):
+        if not self.wide and any(abs(n) >= SAFE_MAGNITUDE for n in values):
+            self.widen()
+        self.push(np.array(values, dtype=self.data.dtype))
+
+
+    # Moves the runs in mask into a new group, leaving the rest in this one
+    def split(self, mask):
+        group = Group(self.ids[mask], self.data[mask], self.lens[mask],
+                      {index: values[mask] for index, values in self.vars.items()},
+                      list(self.pos), self.dir, self.mode, self.sign, self.steps)
+        group.wentTo = self.wentTo
+        self.remove(mask)
+        return group
+
+
+    def remove(self, mask):
+        keep = ~mask
+        self.ids = self.ids[keep]
+        self.data = self.data[keep]
+        self.lens = self.lens[keep]
+        self.vars = {index: values[keep] for index, values in self.vars.items()}
+
+
+    def move(self):
+        delta = DIRS_DEL[self.dir]
+        for xyz in range(3):
+            self.pos[xyz] += delta[xyz]
+
+
+    # Replaces every stack, for changes too irregular to make to all of them at once
+    def setStacks(self, stacks):
+        width = max(max(len(stack) for stack in stacks), 8)
+        self.data = np.zeros((len(stacks), width), dtype=self.data.dtype)
+        for row, stack in enumerate(stacks):
+            self.data[row, :len(stack)] = stack
+        self.lens = np.array([len(stack) for stack in stacks], dtype=np.int64)
+
+
+    def rowStack(self, row):
+        return [int(n) for n in self.data[row, :self.lens[row]]]
+
+
+    # Vars that are set for one run. Unset vars are 0
+    def rowVars(self, row):
+        return {index: int(values[row]) for index, values in self.vars.items() if values[row] != 0}
+
+
+# Runs a program over many inputs, sharing the work of runs that take the same path through it
+class Batch():
+    def __init__(self, programName, inputs, useWorldPath=False, stack=[]):
+        self.programName = programName
+        self.useWorldPath = useWorldPath
+
+        # Only ever used for its blocks, and for errors to come from the right position
+        self.template = CraftyFunge(programName, useWorldPath, input=io.StringIO(), output=io.StringIO(), stack=stack)
+        self.isr = ModeIsrDefault(self.template)
+        # Rotates one run's stack at a time, with the stack swapped in
+        self.rotateIsr = ModeIsrDefault(self.template)
+
+        self.runs = [BatchRun(inputText) for inputText in inputs]
+        self.initialStack = list(self.template.stack)
+        self.groups = []
+        self.spawned = []
+        self.splits = 0
+
+        self.defaultOps = {
+            ADD             : self.add,
+            SUB             : self.sub,
+            MULT            : self.mult,
+            DIV             : self.div,
+            MOD             : self.mod,
+            EXP             : self.exp,
+            NEG             : self.neg,
+            NOT             : self.logicalNot,
+            GREATER         : self.greater,
+            LESS            : self.less,
+            DIR             : self.changeDir,
+            SKIP            : self.skip,
+            SKIP_COND       : self.skipCond,
+            TUNNEL          : self.tunnel,
+            IN_NUM_LITERAL  : self.inNumLiteral,
+            IN_STR_LITERAL  : self.inStrLiteral,
+            IF              : self.conditional,
+            DUP             : self.dup,
+            POP             : self.popDestroyTop,
+            CLEAR           : self.clear,
+            SWAP            : self.swap,
+            ROTATE          : self.rotate,
+            PUSH_LEN        : self.pushLen,
+            OUT_NUM         : self.outNum,
+            OUT_ASCII       : self.outAscii,
+            OUT_NEWLINE     : self.outNewline,
+            RAISE_ERROR     : self.raiseError,
+            IN_NUM          : self.readInput,
+            IN_ASCII        : self.readInput,
+            GET_BLOCK       : self.getBlock,
+            GET_VAR         : self.getVar,
+            SET_VAR         : self.setVar,
+            PUSH_POS        : self.pushPos,
+            GOTO            : self.goto,
+            PUSH_NEXT_BLOCK : self.pushNextBlock,
+            STOP            : self.stop,
+        }
+        self.modeSteps = {
+            Modes.DEFAULT           : self.stepDefault,
+            Modes.TUNNEL            : self.stepTunnel,
+            Modes.IN_NUM_LITERAL    : self.stepInNumLiteral,
+            Modes.IN_STR_LITERAL    : self.stepInStrLiteral,
+        }
+
+
+    # Runs everything, returning a BatchRun for each input in order
+    def run(self):
+        count = len(self.runs)
+        if count == 0:
+            return self.runs
+
+        data = np.zeros((count, max(len(self.initialStack), 8)), dtype=np.int64)
+        if any(abs(n) >= SAFE_MAGNITUDE for n in self.initialStack):
+            data = data.astype(object)
+        data[:, :len(self.initialStack)] = self.initialStack
+        lens = np.full(count, len(self.initialStack), dtype=np.int64)
+        self.groups = [Group(np.arange(count), data, lens, dict(), list(self.template.pos), self.template.dir)]
+
+        while self.groups:
+            self.runGroup(self.groups.pop())
+
+        return self.runs
+
+
+    # Steps a group until all its runs are finished. Runs that split off are left for later
+    def runGroup(self, group):
+        template = self.template
+        while len(group):
+            # Errors come from the group's position
+            template.pos = group.pos
+            try:
+                block = template.getBlock(*group.pos)
+
+                if len(group) < MIN_GROUP_SIZE or (group.mode == Modes.DEFAULT and block in SCALAR_BLOCKS):
+                    self.detach(group)
+                    return
+
+                group.steps += 1
+                self.spawned = []
+                self.modeSteps[group.mode](group, block)
+            except CraftyFungeError as e:
+                self.finish(group, np.ones(len(group), dtype=bool), e)
+                return
+
+            if not group.running:
+                self.finish(group, np.ones(len(group), dtype=bool))
+                return
+
+            # We don't move if we immediately did a goto command
+            for moved in [group] + self.spawned:
+                if not moved.wentTo:
+                    moved.move()
+                moved.wentTo = False
+            self.groups.extend(self.spawned)
+            self.splits += len(self.spawned)
+
+
+    # Splits off the runs in mask to carry on separately after this step
+    def spawn(self, group, mask):
+        spawned = group.split(mask)
+        self.spawned.append(spawned)
+        return spawned
+
+
+    # Splits off the runs of each mask after the first, which stay in the group. Gives the group for each mask
+    def splitMasks(self, group, masks):
+        groups = [group]
+        removed = np.zeros(len(group), dtype=bool)
+        for mask in masks[1:]:
+            groups.append(self.spawn(group, mask[~removed]))
+            removed |= mask
+        return groups
+
+
+    # Records the runs in mask as finished, removing them from the group
+    def finish(self, group, mask, error=None):
+        for row in np.nonzero(mask)[0].tolist():
+            run = self.runs[group.ids[row]]
+            run.steps = group.steps
+            run.stack = group.rowStack(row)
+            run.error = error
+        group.remove(mask)
+
+
+    # Finishes each run of the group on the normal interpreter, from where the group got to
+    def detach(self, group):
+        blocks = self.template.blocks
+        for row in range(len(group)):
+            run = self.runs[group.ids[row]]
+            interp = CraftyFunge(self.programName, self.useWorldPath, input=io.StringIO(run.inputText), output=io.StringIO(),
+                                 blocks=blocks)
+            interp.setState({
+                'pos'           : list(group.pos),
+                'dir'           : DIRS.index(group.dir),
+                'mode'          : int(group.mode),
+                'sign'          : group.sign,
+                'running'       : 1,
+                'wentTo'        : 0,
+                'steps'         : group.steps,
+                'stack'         : group.rowStack(row),
+                'vars'          : group.rowVars(row),
+                'inputLine'     : run.inputLine,
+                'inputBuffer'   : list(run.inputBuffer),
+                'outputLen'     : run.outputLen,
+            })
+
+            try:
+                interp.run()
+            except CraftyFungeError as e:
+                run.error = e
+            except ValueError as e:
+                run.error = CraftyFungeError(interp.pos, str(e))
+            run.outputStr(interp.output.getvalue())
+            run.steps = interp.steps
+            run.stack = list(interp.stack)
+            run.detached = True
+
+        group.remove(np.ones(len(group), dtype=bool))
+
+
+    # Running one step in each mode
+    def stepDefault(self, group, block):
+        op = self.defaultOps.get(block)
+        if op is not None:
+            op(group, block)
+        elif block in VALID_COLORS:
+            group.pushConst(BLOCK_TO_PUSHNUM[block])
+
+
+    def stepTunnel(self, group, block):
+        if block == TUNNEL:
+            group.mode = Modes.DEFAULT
+
+
+    def stepInNumLiteral(self, group, block):
+        if block == IN_NUM_LITERAL:
+            group.mode = Modes.DEFAULT
+            group.sign = +1
+        elif block == NEG:
+            group.sign = -1
+            group.push(np.abs(group.pop()) * group.sign)
+        elif block == DIR:
+            self.changeDir(group, block)
+        # Only push white concrete, not any other type
+        elif block in VALID_COLORS and not (block.startswith('white') and not block.endswith('concrete')):
+            digit = BLOCK_TO_PUSHNUM[block]
+            while digit // 10 > 0:
+                digit //= 10
+
+            n = np.abs(group.pop())
+            group.checkFits(n.astype(np.float64) * 10 + digit)
+            group.push((n * 10 + digit) * group.sign)
+
+
+    def stepInStrLiteral(self, group, block):
+        if block == IN_STR_LITERAL:
+            group.mode = Modes.DEFAULT
+        else:
+            self.pushBlockAtPos(group, *group.pos)
+
+
+    # Arithmetic, checking in floats first that the results fit
+    def arithmetic(self, group, op):
+        b, a = group.pop(), group.pop()
+        if not group.wide:
+            with np.errstate(all='ignore'):
+                group.checkFits(op(a.astype(np.float64), b.astype(np.float64)))
+        group.push(op(a.astype(group.data.dtype), b.astype(group.data.dtype)))
+
+
+    def add(self, group, block):
+        self.arithmetic(group, lambda a, b: a + b)
+
+
+    def sub(self, group, block):
+        self.arithmetic(group, lambda a, b: a - b)
+
+
+    def mult(self, group, block):
+        self.arithmetic(group, lambda a, b: a * b)
+
+
+    # Runs dividing by zero stop with an error, the rest carry on
+    def divide(self, group, op, msg):
+        b, a = group.pop(), group.pop()
+        zero = b == 0
+        if zero.any():
+            self.finish(group, zero, CraftyFungeError(group.pos, msg))
+            a, b = a[~zero], b[~zero]
+        group.push(op(a, b))
+
+
+    def div(self, group, block):
+        self.divide(group, lambda a, b: a // b, 'Attempted to divide by zero.')
+
+
+    def mod(self, group, block):
+        self.divide(group, lambda a, b: a % b, 'Attempted to mod by zero.')
+
+
+    # Can only do positive exponents
+    def exp(self, group, block):
+        b, a = group.pop(), group.pop()
+        positive = b > 1
+        if not group.wide:
+            with np.errstate(all='ignore'):
+                group.checkFits(np.where(positive, np.abs(a.astype(np.float64)) ** b.astype(np.float64), 0))
+        a, b = a.astype(group.data.dtype), b.astype(group.data.dtype)
+        group.push(np.where(positive, a ** np.where(positive, b, 0), 0))
+
+
+    def neg(self, group, block):
+        group.push(-group.pop())
+
+
+    # Logic and comparisons
+    def logicalNot(self, group, block):
+        group.push((group.pop() == 0).astype(np.int64))
+
+
+    def greater(self, group, block):
+        b, a = group.pop(), group.pop()
+        group.push((a > b).astype(np.int64))
+
+
+    def less(self, group, block):
+        b, a = group.pop(), group.pop()
+        group.push((a < b).astype(np.int64))
+
+
+    # Motion
+    def changeDir(self, group, block):
+        group.dir = self.template.getFacing(*group.pos)
+
+
+    def skip(self, group, block):
+        group.move()
+
+
+    # Runs popping zero skip the next block, splitting from the rest if they don't all agree
+    def skipCond(self, group, block):
+        zero = group.pop() == 0
+        if zero.all():
+            group.move()
+        elif zero.any():
+            self.spawn(group, zero).move()
+
+
+    # Mode switching
+    def tunnel(self, group, block):
+        group.mode = Modes.TUNNEL
+
+
+    def inNumLiteral(self, group, block):
+        group.mode = Modes.IN_NUM_LITERAL
+        group.sign = +1
+        group.pushConst(0)
+
+
+    def inStrLiteral(self, group, block):
+        group.mode = Modes.IN_STR_LITERAL
+
+
+    # True goes in same dir as observer, false in the opposite. Runs going the other way split off
+    def conditional(self, group, block):
+        blockFacing = self.template.getFacing(*group.pos)
+        oppositeFacing = DIRS_INV[DIRS.index(blockFacing)]
+        true = group.pop() != 0
+        if true.all():
+            group.dir = blockFacing
+        elif not true.any():
+            group.dir = oppositeFacing
+        else:
+            self.spawn(group, ~true).dir = oppositeFacing
+            group.dir = blockFacing
+
+
+    # Stack operations
+    def dup(self, group, block):
+        popped = group.pop()
+        group.push(popped)
+        group.push(popped)
+
+
+    def popDestroyTop(self, group, block):
+        group.pop()
+
+
+    def clear(self, group, block):
+        group.lens[:] = 0
+
+
+    def swap(self, group, block):
+        b, a = group.pop(), group.pop()
+        group.push(b)
+        group.push(a)
+
+
+    # Rotating depends on each stack's length, so each run's stack is done on its own
+    def rotate(self, group, block):
+        stacks = []
+        for row in range(len(group)):
+            self.rotateIsr.stack = collections.deque(group.rowStack(row))
+            self.rotateIsr.rotate()
+            stacks.append(list(self.rotateIsr.stack))
+        group.setStacks(stacks)
+
+
+    def pushLen(self, group, block):
+        group.push(group.lens.copy(), where=group.lens > 0)
+
+
+    # Output
+    def outNum(self, group, block):
+        for runId, n in zip(group.ids.tolist(), group.pop().tolist()):
+            self.runs[runId].outputStr(str(n) + ' ')
+
+
+    # A value that isn't a character stops the interpreter outright. Here it only stops that run
+    def outAscii(self, group, block):
+        invalid = np.zeros(len(group), dtype=bool)
+        for row, (runId, n) in enumerate(zip(group.ids.tolist(), group.pop().tolist())):
+            if 0 <= n < 0x110000:
+                self.runs[runId].outputStr(chr(n))
+            else:
+                invalid[row] = True
+
+        if invalid.any():
+            self.finish(group, invalid, CraftyFungeError(group.pos, 'chr() arg not in range(0x110000)'))
+
+
+    def outNewline(self, group, block):
+        for runId in group.ids.tolist():
+            self.runs[runId].outputStr('\n')
+
+
+    def raiseError(self, group, block):
+        self.template.raiseError('An error was manually raised.')
+
+
+    # Input, read separately for each run
+    def readInput(self, group, block):
+        group.pushValues([self.runs[runId].readInput(block) for runId in group.ids.tolist()])
+
+
+    # Get blocks. The world never changes in a batch, so only each different position has to be looked at
+    def getBlock(self, group, block):
+        z, y, x = group.pop(), group.pop(), group.pop()
+        values = np.zeros(len(group), dtype=group.data.dtype)
+        has = np.zeros(len(group), dtype=bool)
+        outOfBounds = np.zeros(len(group), dtype=bool)
+        for (blockPos, mask) in self.uniqueMasks(group, [x, y, z]):
+            try:
+                value = self.isr.blockValAtPos(*blockPos)
+            except CraftyFungeError:
+                outOfBounds |= mask
+                continue
+            if value is not None:
+                values[mask] = value
+                has |= mask
+
+        if outOfBounds.any():
+            values, has = values[~outOfBounds], has[~outOfBounds]
+            self.finish(group, outOfBounds, CraftyFungeError(group.pos, 'Position is out of bounds.'))
+        group.push(values, where=has)
+
+
+    def pushBlockAtPos(self, group, x, y, z):
+        value = self.isr.blockValAtPos(x, y, z)
+        if value is not None:
+            group.pushConst(value)
+
+
+    # Gets a mask of the runs with each different key, without splitting the group
+    def uniqueMasks(self, group, columns):
+        if group.wide:
+            rowKeys = list(zip(*(column.tolist() for column in columns)))
+            return [(key, np.array([rowKey == key for rowKey in rowKeys], dtype=bool)) for key in dict.fromkeys(rowKeys)]
+
+        unique, inverse = np.unique(np.stack(columns, axis=1), axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        return [(tuple(key), inverse == i) for i, key in enumerate(unique.tolist())]
+
+
+    # Get/set variables
+    def getVar(self, group, block):
+        index = group.pop()
+        values = np.zeros(len(group), dtype=group.data.dtype)
+        for (key, ), mask in self.uniqueMasks(group, [index]):
+            if key in group.vars:
+                values[mask] = group.vars[key][mask]
+        group.push(values)
+
+
+    # Setting a variable to 0 is the same as deleting it, since unset vars are 0
+    def setVar(self, group, block):
+        index, values = group.pop(), group.pop()
+        for (key, ), mask in self.uniqueMasks(group, [index]):
+            if key not in group.vars:
+                group.vars[key] = np.zeros(len(group), dtype=group.data.dtype)
+            group.vars[key][mask] = values[mask]
+
+
+    # Push pos and Goto
+    def pushPos(self, group, block):
+        for xyz in range(3):
+            group.pushConst(group.pos[xyz])
+
+
+    # Runs going to different places split off
+    def goto(self, group, block):
+        z, y, x = group.pop(), group.pop(), group.pop()
+        targets = self.uniqueMasks(group, [x, y, z])
+        for (pos, mask), moved in zip(targets, self.splitMasks(group, [mask for pos, mask in targets])):
+            moved.pos = list(pos)
+            moved.wentTo = True
+
+
+    # End
+    def stop(self, group, block):
+        group.running = False
+
+
+    def pushNextBlock(self, group, block):
+        group.move()
+        self.pushBlockAtPos(group, *group.pos)
+
+
+def parseArgs():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Run a CraftyFunge program over many inputs at once.')
+    parser.add_argument('filename', metavar='FILE', help='Which file to run. Must be an nbt file exported from a structure block.')
+    parser.add_argument('-w', dest='useWorldPath', action='store_true', help='Run a file from the configured structure block export location.')
+    parser.add_argument('-i', dest='inputs', metavar='INFILE', action='append', type=argparse.FileType('r'), default=[], help='Run once with input from INFILE. Can be given more than once.')
+    parser.add_argument('-l', dest='lines', metavar='LINESFILE', type=argparse.FileType('r'), default=None, help='Run once for each line of LINESFILE, with that line as the input.')
+    parser.add_argument('-s', dest='stats', action='store_true', help='Print how many times runs split apart, and how many had to be finished one at a time.')
+
+    args = parser.parse_args()
+    if not args.inputs and args.lines is None:
+        parser.error('at least one of -i or -l is required')
+    return args
+
+
+if __name__ == '__main__':
+    args = parseArgs()
+    if args.useWorldPath:
+        craftyfunge.WORLD_PATH = readConfig()
+
+    inputs = [inputFile.read() for inputFile in args.inputs]
+    if args.lines is not None:
+        inputs.extend(args.lines.readlines())
+
+    batch = Batch(args.filename, inputs, args.useWorldPath)
+    runs = batch.run()
+    for i, run in enumerate(runs):
+        print(f'Run {i+1} ({run.steps} steps):')
+        print(run.output)
+        if run.error is not None:
+            print(f'Error at position {run.error.pos}:', file=sys.stderr)
+            print(run.error.msg, file=sys.stderr)
+
+    if args.stats:
+        print(f'{batch.splits} splits, {sum(run.detached for run in runs)} of {len(runs)} runs finished one at a time', file=sys.stderr)
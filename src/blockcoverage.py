@@ -0,0 +1,170 @@
+# Finds which blocks of a program get run, and prunes the ones that never do
+# Copyright 2022 Eli Fox
+
+import copy, io, sys
+
+from common import *
+import craftyfunge
+from craftyfunge import CraftyFunge, writeStructure
+
+# Blocks that do something when run in default mode
+INSTRUCTION_BLOCKS = set(BLOCKS_FOR_VALUES) | set(BLOCK_TO_PUSHNUM) | {IN_STR_LITERAL, START}
+
+
+# Records blocks run by one interpreter into a BlockCoverage
+class CoverageTracer():
+    def __init__(self, coverage, interp):
+        self.coverage = coverage
+        self.interp = interp
+
+
+    # Converts a world pos to a position in the structure
+    def getCell(self, pos):
+        offset = self.interp.offset
+        return (pos[0] + offset[0], pos[1] + offset[1], pos[2] + offset[2])
+
+
+    def onStep(self, block):
+        interp = self.interp
+        coverage = self.coverage
+        cell = self.getCell(interp.pos)
+        coverage.cells.add(cell)
+        coverage.cellDirs.add((cell, interp.dir))
+
+        if interp.mode != Modes.DEFAULT:
+            return
+
+        # Blocks read as data have to be kept, even if they're never run
+        if block == GET_BLOCK:
+            stack = list(interp.stack)
+            z, y, x = [stack.pop() if stack else 0 for _ in range(3)]
+            coverage.dataCells.add(self.getCell((x, y, z)))
+        elif block == PUSH_NEXT_BLOCK:
+            delta = DIRS_DEL[interp.dir]
+            coverage.dataCells.add(self.getCell([interp.pos[xyz] + delta[xyz] for xyz in range(3)]))
+
+
+    def onSetBlock(self, pos, block):
+        self.coverage.dataCells.add(self.getCell(pos))
+
+
+# Coverage of one program over any number of runs
+class BlockCoverage():
+    def __init__(self):
+        self.programFile = None
+        self.blocks = None
+        self.size = None
+        self.offset = None
+        self.runs = 0
+
+        # Positions are in the structure, not relative to the start
+        self.cells = set()
+        self.cellDirs = set()
+        self.dataCells = set()
+
+
+    # Records coverage of a run. Must be called before the interpreter runs
+    def track(self, interp):
+        if self.programFile is None:
+            self.programFile = interp.programFile
+            self.blocks = copy.deepcopy(interp.blocks)
+            self.size = list(interp.size)
+            self.offset = list(interp.offset)
+        elif interp.programFile != self.programFile:
+            raise ValueError(f'Coverage is of "{self.programFile}", not "{interp.programFile}".')
+
+        interp.addPlugin(CoverageTracer(self, interp))
+        self.runs += 1
+
+
+    def getBlock(self, cell):
+        x, y, z = cell
+        return self.blocks[x][y][z]['Name']
+
+
+    # Instruction blocks anywhere in the structure
+    def instructionCells(self):
+        return [(x, y, z) for x in range(self.size[0]) for y in range(self.size[1]) for z in range(self.size[2])
+                if self.getBlock((x, y, z)) in INSTRUCTION_BLOCKS]
+
+
+    # Instruction blocks never run, sorted by position
+    def unexecuted(self):
+        return [cell for cell in self.instructionCells() if cell not in self.cells]
+
+
+    def inBounds(self, cell):
+        return all(0 <= cell[xyz] < self.size[xyz] for xyz in range(3))
+
+
+    # Gets the blocks with everything never run or used as data replaced with air, cropped to what's left
+    def pruned(self):
+        kept = {cell for cell in self.cells | self.dataCells if self.inBounds(cell)}
+        low = [min(cell[xyz] for cell in kept) for xyz in range(3)]
+        high = [max(cell[xyz] for cell in kept) for xyz in range(3)]
+        size = [high[xyz] - low[xyz] + 1 for xyz in range(3)]
+
+        blocks = [[[None for _ in range(size[2])] for _ in range(size[1])] for _ in range(size[0])]
+        for x in range(size[0]):
+            for y in range(size[1]):
+                for z in range(size[2]):
+                    cell = (x + low[0], y + low[1], z + low[2])
+                    blocks[x][y][z] = self.blocks[cell[0]][cell[1]][cell[2]] if cell in kept else {'Name': 'air'}
+
+        return blocks, size
+
+
+    def writePruned(self, filename):
+        blocks, size = self.pruned()
+        writeStructure(filename, blocks, size)
+
+
+    # Prints how much was run and which instruction blocks weren't
+    def report(self, file=sys.stdout):
+        instructionCells = self.instructionCells()
+        unexecuted = self.unexecuted()
+        executed = len(instructionCells) - len(unexecuted)
+        percent = 100 * executed / len(instructionCells) if instructionCells else 100
+
+        print(f'Coverage of {self.programFile} over {self.runs} run{"s" if self.runs != 1 else ""}', file=file)
+        print(f'Ran {executed} of {len(instructionCells)} instruction blocks ({percent:.1f}%)', file=file)
+        print(f'Ran {len(self.cells)} positions in {len(self.cellDirs)} position and direction pairs', file=file)
+
+        if unexecuted:
+            # Positions are shown relative to the start, like everywhere else
+            print('Instruction blocks never run:', file=file)
+            for cell in unexecuted:
+                pos = [cell[xyz] - self.offset[xyz] for xyz in range(3)]
+                print(f'  {pos} {self.getBlock(cell)}', file=file)
+
+
+def parseArgs():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Find which blocks of a CraftyFunge program are run, over one or more runs.')
+    parser.add_argument('filename', metavar='FILE', help='Which file to run. Must be an nbt file exported from a structure block.')
+    parser.add_argument('-w', dest='useWorldPath', action='store_true', help='Run a file from the configured structure block export location.')
+    parser.add_argument('-i', dest='inputs', metavar='INFILE', action='append', type=argparse.FileType('r'), default=[], help='Run once with input from INFILE. Can be given more than once. Runs once with input from stdin if not given.')
+    parser.add_argument('-p', dest='prunedOut', metavar='PRUNEDFILE', default=None, help='Write the program to PRUNEDFILE with blocks that were never run or used as data replaced with air, cropped to what\'s left.')
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parseArgs()
+    if args.useWorldPath:
+        craftyfunge.WORLD_PATH = readConfig()
+
+    coverage = BlockCoverage()
+    for run, inputFile in enumerate(args.inputs or [sys.stdin]):
+        interp = CraftyFunge(args.filename, args.useWorldPath, input=inputFile, output=io.StringIO())
+        coverage.track(interp)
+        try:
+            interp.run()
+        except CraftyFungeError as e:
+            print(f'Run {run+1} stopped with an error at position {e.pos}:', file=sys.stderr)
+            print(e.msg, file=sys.stderr)
+
+    coverage.report()
+    if args.prunedOut is not None:
+        coverage.writePruned(args.prunedOut)
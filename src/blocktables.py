@@ -0,0 +1,921 @@
+# Block value tables for CraftyFunge, generated by maketables.py from data/block_to_value.csv
+# Don't edit by hand. Run "python maketables.py" after changing the csv
+
+CSV_HASH = '13cf5e22812774f5a17ee00be6d76d34ab2396a07d7026cf3480f1b38a0a9312'
+
+# Value to block. Blocks with extra data are (name, ((key, value), ...))
+VALUE_TO_BLOCK = {
+    -2147483648: 'white_concrete',
+    -177: ('observer', (('facing', 'up'),)),
+    -176: ('observer', (('facing', 'down'),)),
+    -175: ('observer', (('facing', 'east'),)),
+    -174: ('observer', (('facing', 'west'),)),
+    -173: ('observer', (('facing', 'north'),)),
+    -172: 'waxed_cut_copper',
+    -171: 'waxed_copper_block',
+    -170: 'warped_wart_block',
+    -169: 'warped_stairs',
+    -168: 'warped_slab',
+    -167: 'warped_planks',
+    -166: 'warped_nylium',
+    -165: 'warped_hyphae',
+    -164: 'verdant_froglight',
+    -163: 'tuff',
+    -162: 'trapped_chest',
+    -161: 'terracotta',
+    -160: 'target',
+    -159: 'stripped_warped_hyphae',
+    -158: 'stripped_spruce_wood',
+    -157: 'stripped_spruce_log',
+    -156: 'stripped_oak_wood',
+    -155: 'stripped_oak_log',
+    -154: 'stripped_mangrove_wood',
+    -153: 'stripped_mangrove_log',
+    -152: 'stripped_jungle_wood',
+    -151: 'stripped_jungle_log',
+    -150: 'stripped_dark_oak_wood',
+    -149: 'stripped_dark_oak_log',
+    -148: 'stripped_crimson_hyphae',
+    -147: 'stripped_birch_wood',
+    -146: 'stripped_birch_log',
+    -145: 'stripped_acacia_wood',
+    -144: 'stripped_acacia_log',
+    -143: 'stonecutter',
+    -142: 'stone_stairs',
+    -141: 'stone_slab',
+    -140: 'stone_bricks',
+    -139: 'stone_brick_stairs',
+    -138: 'stone_brick_slab',
+    -137: 'stone',
+    -136: 'sticky_piston',
+    -135: 'spruce_wood',
+    -134: 'spruce_stairs',
+    -133: 'spruce_slab',
+    -132: 'spruce_planks',
+    -131: 'spruce_log',
+    -130: 'spruce_leaves',
+    -129: 'sponge',
+    -128: 'soul_soil',
+    -127: 'soul_sand',
+    -126: 'snow_block',
+    -125: 'smooth_stone_slab',
+    -124: 'smooth_stone',
+    -123: 'smooth_sandstone_stairs',
+    -122: 'smooth_sandstone_slab',
+    -121: 'smooth_sandstone',
+    -120: 'smooth_red_sandstone_stairs',
+    -119: 'smooth_red_sandstone_slab',
+    -118: 'smooth_red_sandstone',
+    -117: 'smooth_quartz_stairs',
+    -116: 'smooth_quartz_slab',
+    -115: 'smooth_quartz',
+    -114: 'smooth_basalt',
+    -113: 'smoker',
+    -112: 'smithing_table',
+    -111: 'shulker_box',
+    -110: 'shroomlight',
+    -109: 'sculk',
+    -108: 'sandstone_stairs',
+    -107: 'sandstone_slab',
+    -106: 'sandstone',
+    -105: 'reinforced_deepslate',
+    -104: 'redstone_ore',
+    -103: 'red_sandstone_stairs',
+    -102: 'red_sandstone_slab',
+    -101: 'red_sandstone',
+    -100: 'red_nether_brick_stairs',
+    -99: 'red_nether_brick_slab',
+    -98: 'red_mushroom_block',
+    -97: 'red_glazed_terracotta',
+    -96: 'raw_iron_block',
+    -95: 'raw_gold_block',
+    -94: 'raw_copper_block',
+    -93: 'quartz_stairs',
+    -92: 'quartz_slab',
+    -91: 'quartz_pillar',
+    -90: 'quartz_bricks',
+    -89: 'quartz_block',
+    -88: 'purpur_stairs',
+    -87: 'purpur_slab',
+    -86: 'purpur_pillar',
+    -85: 'purpur_block',
+    -84: 'purple_glazed_terracotta',
+    -83: 'prismarine_stairs',
+    -82: 'prismarine_slab',
+    -81: 'prismarine_bricks',
+    -80: 'prismarine_brick_stairs',
+    -79: 'prismarine_brick_slab',
+    -78: 'polished_granite_stairs',
+    -77: 'polished_granite_slab',
+    -76: 'polished_granite',
+    -75: 'polished_diorite_stairs',
+    -74: 'polished_diorite_slab',
+    -73: 'polished_diorite',
+    -72: 'polished_deepslate_stairs',
+    -71: 'polished_deepslate_slab',
+    -70: 'polished_deepslate',
+    -69: 'polished_blackstone_stairs',
+    -68: 'polished_blackstone_slab',
+    -67: 'polished_blackstone_bricks',
+    -66: 'polished_blackstone_brick_stairs',
+    -65: 'polished_blackstone_brick_slab',
+    -64: 'polished_blackstone',
+    -63: 'polished_basalt',
+    -62: 'polished_andesite_stairs',
+    -61: 'polished_andesite_slab',
+    -60: 'polished_andesite',
+    -59: 'podzol',
+    -58: 'pink_wool',
+    -57: 'pink_terracotta',
+    -56: 'pink_stained_glass',
+    -55: 'pink_shulker_box',
+    -54: 'pink_glazed_terracotta',
+    -53: 'pink_concrete',
+    -52: 'petrified_oak_slab',
+    -51: 'pearlescent_froglight',
+    -50: 'packed_mud',
+    -49: 'packed_ice',
+    -48: 'orange_glazed_terracotta',
+    -47: 'ochre_froglight',
+    -46: 'oak_wood',
+    -45: 'oak_stairs',
+    -44: 'oak_slab',
+    -43: 'oak_planks',
+    -42: 'oak_log',
+    -41: 'oak_leaves',
+    -40: 'netherrack',
+    -39: 'nether_wart_block',
+    -38: 'nether_quartz_ore',
+    -37: 'nether_gold_ore',
+    -36: 'nether_brick_stairs',
+    -35: 'nether_brick_slab',
+    -34: 'muddy_mangrove_roots',
+    -33: 'mud_bricks',
+    -32: 'mud_brick_stairs',
+    -31: 'mud_brick_slab',
+    -30: 'mud',
+    -29: 'mossy_stone_brick_stairs',
+    -28: 'mossy_stone_brick_slab',
+    -27: 'mossy_cobblestone_stairs',
+    -26: 'mossy_cobblestone_slab',
+    -25: 'mossy_cobblestone',
+    -24: 'moss_block',
+    -23: 'mangrove_wood',
+    -22: 'mangrove_stairs',
+    -21: 'mangrove_slab',
+    -20: 'mangrove_roots',
+    -19: 'mangrove_planks',
+    -18: 'mangrove_log',
+    -17: 'mangrove_leaves',
+    -16: 'magenta_wool',
+    -15: 'magenta_terracotta',
+    -14: 'magenta_stained_glass',
+    -13: 'magenta_shulker_box',
+    -12: 'magenta_concrete',
+    -11: 'loom',
+    -10: 'lodestone',
+    -9: 'lime_glazed_terracotta',
+    -8: 'light_gray_wool',
+    -7: 'light_gray_terracotta',
+    -6: 'light_gray_stained_glass',
+    -5: 'light_gray_shulker_box',
+    -4: 'light_gray_glazed_terracotta',
+    -3: 'light_gray_concrete',
+    -2: 'light_blue_glazed_terracotta',
+    -1: 'lectern',
+    0: 'air',
+    1: 'red_concrete',
+    2: 'orange_concrete',
+    3: 'yellow_concrete',
+    4: 'lime_concrete',
+    5: 'green_concrete',
+    6: 'light_blue_concrete',
+    7: 'cyan_concrete',
+    8: 'blue_concrete',
+    9: 'purple_concrete',
+    10: 'red_terracotta',
+    11: 'iron_block',
+    12: 'gold_block',
+    13: 'diamond_block',
+    14: 'emerald_block',
+    15: 'lapis_block',
+    16: 'netherite_block',
+    17: 'coal_block',
+    18: 'obsidian',
+    19: 'mossy_stone_bricks',
+    20: 'orange_terracotta',
+    21: 'cracked_stone_bricks',
+    22: ('piston', (('facing', 'north'),)),
+    23: 'magenta_glazed_terracotta',
+    24: 'sea_lantern',
+    25: 'redstone_lamp',
+    26: 'deepslate',
+    27: 'glass',
+    28: ('observer', (('facing', 'south'),)),
+    29: 'crafting_table',
+    30: 'yellow_terracotta',
+    31: 'magma_block',
+    32: 'tnt',
+    33: 'pumpkin',
+    34: 'melon',
+    35: 'ancient_debris',
+    36: 'dispenser',
+    37: 'dropper',
+    38: 'bookshelf',
+    39: 'note_block',
+    40: 'lime_terracotta',
+    41: 'chest',
+    42: 'ender_chest',
+    43: 'slime_block',
+    44: 'honey_block',
+    45: 'jukebox',
+    46: 'red_nether_bricks',
+    47: 'nether_bricks',
+    48: 'dark_prismarine',
+    49: 'prismarine',
+    50: 'green_terracotta',
+    51: 'bedrock',
+    52: 'acacia_leaves',
+    53: 'acacia_log',
+    54: 'acacia_planks',
+    55: 'acacia_slab',
+    56: 'acacia_stairs',
+    57: 'acacia_wood',
+    58: 'amethyst_block',
+    59: 'andesite',
+    60: 'light_blue_terracotta',
+    61: 'andesite_slab',
+    62: 'andesite_stairs',
+    63: 'azalea_leaves',
+    64: 'barrel',
+    65: 'basalt',
+    66: 'beacon',
+    67: 'beehive',
+    68: 'birch_leaves',
+    69: 'birch_log',
+    70: 'cyan_terracotta',
+    71: 'birch_planks',
+    72: 'birch_slab',
+    73: 'birch_stairs',
+    74: 'birch_wood',
+    75: 'black_concrete',
+    76: 'black_glazed_terracotta',
+    77: 'black_shulker_box',
+    78: 'black_stained_glass',
+    79: 'black_terracotta',
+    80: 'blue_terracotta',
+    81: 'black_wool',
+    82: 'blackstone',
+    83: 'blackstone_slab',
+    84: 'blackstone_stairs',
+    85: 'blast_furnace',
+    86: 'blue_glazed_terracotta',
+    87: 'blue_ice',
+    88: 'bone_block',
+    89: 'brick_slab',
+    90: 'purple_terracotta',
+    91: 'brick_stairs',
+    92: 'bricks',
+    93: 'brown_concrete',
+    94: 'brown_glazed_terracotta',
+    95: 'brown_mushroom_block',
+    96: 'brown_shulker_box',
+    97: 'brown_stained_glass',
+    98: 'brown_terracotta',
+    99: 'brown_wool',
+    100: 'red_wool',
+    101: 'calcite',
+    102: 'cartography_table',
+    103: 'carved_pumpkin',
+    104: 'cauldron',
+    105: 'chiseled_deepslate',
+    106: 'chiseled_nether_bricks',
+    107: 'chiseled_polished_blackstone',
+    108: 'chiseled_quartz_block',
+    109: 'chiseled_red_sandstone',
+    110: 'chiseled_sandstone',
+    111: 'chiseled_stone_bricks',
+    112: 'clay',
+    113: 'coal_ore',
+    114: 'coarse_dirt',
+    115: 'cobbled_deepslate',
+    116: 'cobbled_deepslate_slab',
+    117: 'cobbled_deepslate_stairs',
+    118: 'cobblestone',
+    119: 'cobblestone_slab',
+    120: 'cobblestone_stairs',
+    121: 'cobweb',
+    122: 'composter',
+    123: 'copper_block',
+    124: 'copper_ore',
+    125: 'cracked_deepslate_bricks',
+    126: 'cracked_deepslate_tiles',
+    127: 'cracked_nether_bricks',
+    128: 'cracked_polished_blackstone_bricks',
+    129: 'crimson_hyphae',
+    130: 'crimson_nylium',
+    131: 'crimson_planks',
+    132: 'crimson_slab',
+    133: 'crimson_stairs',
+    134: 'crying_obsidian',
+    135: 'cut_copper',
+    136: 'cut_copper_slab',
+    137: 'cut_copper_stairs',
+    138: 'cut_red_sandstone',
+    139: 'cut_red_sandstone_slab',
+    140: 'cut_sandstone',
+    141: 'cut_sandstone_slab',
+    142: 'cyan_glazed_terracotta',
+    143: 'dark_oak_leaves',
+    144: 'dark_oak_log',
+    145: 'dark_oak_planks',
+    146: 'dark_oak_slab',
+    147: 'dark_oak_stairs',
+    148: 'dark_oak_wood',
+    149: 'dark_prismarine_slab',
+    150: 'dark_prismarine_stairs',
+    151: 'dead_brain_coral_block',
+    152: 'dead_bubble_coral_block',
+    153: 'dead_fire_coral_block',
+    154: 'dead_horn_coral_block',
+    155: 'dead_tube_coral_block',
+    156: 'deepslate_brick_slab',
+    157: 'deepslate_brick_stairs',
+    158: 'deepslate_bricks',
+    159: 'deepslate_coal_ore',
+    160: 'deepslate_copper_ore',
+    161: 'deepslate_diamond_ore',
+    162: 'deepslate_emerald_ore',
+    163: 'deepslate_gold_ore',
+    164: 'deepslate_iron_ore',
+    165: 'deepslate_lapis_ore',
+    166: 'deepslate_redstone_ore',
+    167: 'deepslate_tile_slab',
+    168: 'deepslate_tile_stairs',
+    169: 'deepslate_tiles',
+    170: 'diamond_ore',
+    171: 'diorite',
+    172: 'diorite_slab',
+    173: 'diorite_stairs',
+    174: 'dirt',
+    175: 'dried_kelp_block',
+    176: 'dripstone_block',
+    177: 'emerald_ore',
+    178: 'enchanting_table',
+    179: 'end_portal_frame',
+    180: 'end_stone',
+    181: 'end_stone_brick_slab',
+    182: 'end_stone_brick_stairs',
+    183: 'end_stone_bricks',
+    184: 'fletching_table',
+    185: 'flowering_azalea_leaves',
+    186: 'frosted_ice',
+    187: 'furnace',
+    188: 'gilded_blackstone',
+    189: 'glowstone',
+    190: 'gold_ore',
+    191: 'granite',
+    192: 'granite_slab',
+    193: 'granite_stairs',
+    194: 'gray_concrete',
+    195: 'gray_glazed_terracotta',
+    196: 'gray_shulker_box',
+    197: 'gray_stained_glass',
+    198: 'gray_terracotta',
+    199: 'gray_wool',
+    200: 'orange_wool',
+    201: 'green_glazed_terracotta',
+    202: 'grindstone',
+    203: 'hay_block',
+    204: 'honeycomb_block',
+    205: 'infested_chiseled_stone_bricks',
+    206: 'infested_cobblestone',
+    207: 'infested_cracked_stone_bricks',
+    208: 'infested_deepslate',
+    209: 'infested_mossy_stone_bricks',
+    210: 'infested_stone',
+    211: 'infested_stone_bricks',
+    212: 'iron_ore',
+    213: 'jack_o_lantern',
+    214: 'jungle_leaves',
+    215: 'jungle_log',
+    216: 'jungle_planks',
+    217: 'jungle_slab',
+    218: 'jungle_stairs',
+    219: 'jungle_wood',
+    220: 'lapis_ore',
+    221: ('piston', (('facing', 'south'),)),
+    222: ('piston', (('facing', 'east'),)),
+    223: ('piston', (('facing', 'west'),)),
+    224: ('piston', (('facing', 'up'),)),
+    225: ('piston', (('facing', 'down'),)),
+    300: 'yellow_wool',
+    400: 'lime_wool',
+    500: 'green_wool',
+    600: 'light_blue_wool',
+    700: 'cyan_wool',
+    800: 'blue_wool',
+    900: 'purple_wool',
+    1000: 'red_stained_glass',
+    2000: 'orange_stained_glass',
+    3000: 'yellow_stained_glass',
+    4000: 'lime_stained_glass',
+    5000: 'green_stained_glass',
+    6000: 'light_blue_stained_glass',
+    7000: 'cyan_stained_glass',
+    8000: 'blue_stained_glass',
+    9000: 'purple_stained_glass',
+    1000000: 'red_shulker_box',
+    2000000: 'orange_shulker_box',
+    3000000: 'yellow_shulker_box',
+    4000000: 'lime_shulker_box',
+    5000000: 'green_shulker_box',
+    6000000: 'light_blue_shulker_box',
+    7000000: 'cyan_shulker_box',
+    8000000: 'blue_shulker_box',
+    9000000: 'purple_shulker_box',
+    2147483647: 'tinted_glass',
+}
+
+BLOCK_TO_VALUE = {
+    'white_concrete': -2147483648,
+    ('observer', (('facing', 'up'),)): -177,
+    ('observer', (('facing', 'down'),)): -176,
+    ('observer', (('facing', 'east'),)): -175,
+    ('observer', (('facing', 'west'),)): -174,
+    ('observer', (('facing', 'north'),)): -173,
+    'waxed_cut_copper': -172,
+    'waxed_copper_block': -171,
+    'warped_wart_block': -170,
+    'warped_stairs': -169,
+    'warped_slab': -168,
+    'warped_planks': -167,
+    'warped_nylium': -166,
+    'warped_hyphae': -165,
+    'verdant_froglight': -164,
+    'tuff': -163,
+    'trapped_chest': -162,
+    'terracotta': -161,
+    'target': -160,
+    'stripped_warped_hyphae': -159,
+    'stripped_spruce_wood': -158,
+    'stripped_spruce_log': -157,
+    'stripped_oak_wood': -156,
+    'stripped_oak_log': -155,
+    'stripped_mangrove_wood': -154,
+    'stripped_mangrove_log': -153,
+    'stripped_jungle_wood': -152,
+    'stripped_jungle_log': -151,
+    'stripped_dark_oak_wood': -150,
+    'stripped_dark_oak_log': -149,
+    'stripped_crimson_hyphae': -148,
+    'stripped_birch_wood': -147,
+    'stripped_birch_log': -146,
+    'stripped_acacia_wood': -145,
+    'stripped_acacia_log': -144,
+    'stonecutter': -143,
+    'stone_stairs': -142,
+    'stone_slab': -141,
+    'stone_bricks': -140,
+    'stone_brick_stairs': -139,
+    'stone_brick_slab': -138,
+    'stone': -137,
+    'sticky_piston': -136,
+    'spruce_wood': -135,
+    'spruce_stairs': -134,
+    'spruce_slab': -133,
+    'spruce_planks': -132,
+    'spruce_log': -131,
+    'spruce_leaves': -130,
+    'sponge': -129,
+    'soul_soil': -128,
+    'soul_sand': -127,
+    'snow_block': -126,
+    'smooth_stone_slab': -125,
+    'smooth_stone': -124,
+    'smooth_sandstone_stairs': -123,
+    'smooth_sandstone_slab': -122,
+    'smooth_sandstone': -121,
+    'smooth_red_sandstone_stairs': -120,
+    'smooth_red_sandstone_slab': -119,
+    'smooth_red_sandstone': -118,
+    'smooth_quartz_stairs': -117,
+    'smooth_quartz_slab': -116,
+    'smooth_quartz': -115,
+    'smooth_basalt': -114,
+    'smoker': -113,
+    'smithing_table': -112,
+    'shulker_box': -111,
+    'shroomlight': -110,
+    'sculk': -109,
+    'sandstone_stairs': -108,
+    'sandstone_slab': -107,
+    'sandstone': -106,
+    'reinforced_deepslate': -105,
+    'redstone_ore': -104,
+    'red_sandstone_stairs': -103,
+    'red_sandstone_slab': -102,
+    'red_sandstone': -101,
+    'red_nether_brick_stairs': -100,
+    'red_nether_brick_slab': -99,
+    'red_mushroom_block': -98,
+    'red_glazed_terracotta': -97,
+    'raw_iron_block': -96,
+    'raw_gold_block': -95,
+    'raw_copper_block': -94,
+    'quartz_stairs': -93,
+    'quartz_slab': -92,
+    'quartz_pillar': -91,
+    'quartz_bricks': -90,
+    'quartz_block': -89,
+    'purpur_stairs': -88,
+    'purpur_slab': -87,
+    'purpur_pillar': -86,
+    'purpur_block': -85,
+    'purple_glazed_terracotta': -84,
+    'prismarine_stairs': -83,
+    'prismarine_slab': -82,
+    'prismarine_bricks': -81,
+    'prismarine_brick_stairs': -80,
+    'prismarine_brick_slab': -79,
+    'polished_granite_stairs': -78,
+    'polished_granite_slab': -77,
+    'polished_granite': -76,
+    'polished_diorite_stairs': -75,
+    'polished_diorite_slab': -74,
+    'polished_diorite': -73,
+    'polished_deepslate_stairs': -72,
+    'polished_deepslate_slab': -71,
+    'polished_deepslate': -70,
+    'polished_blackstone_stairs': -69,
+    'polished_blackstone_slab': -68,
+    'polished_blackstone_bricks': -67,
+    'polished_blackstone_brick_stairs': -66,
+    'polished_blackstone_brick_slab': -65,
+    'polished_blackstone': -64,
+    'polished_basalt': -63,
+    'polished_andesite_stairs': -62,
+    'polished_andesite_slab': -61,
+    'polished_andesite': -60,
+    'podzol': -59,
+    'pink_wool': -58,
+    'pink_terracotta': -57,
+    'pink_stained_glass': -56,
+    'pink_shulker_box': -55,
+    'pink_glazed_terracotta': -54,
+    'pink_concrete': -53,
+    'petrified_oak_slab': -52,
+    'pearlescent_froglight': -51,
+    'packed_mud': -50,
+    'packed_ice': -49,
+    'orange_glazed_terracotta': -48,
+    'ochre_froglight': -47,
+    'oak_wood': -46,
+    'oak_stairs': -45,
+    'oak_slab': -44,
+    'oak_planks': -43,
+    'oak_log': -42,
+    'oak_leaves': -41,
+    'netherrack': -40,
+    'nether_wart_block': -39,
+    'nether_quartz_ore': -38,
+    'nether_gold_ore': -37,
+    'nether_brick_stairs': -36,
+    'nether_brick_slab': -35,
+    'muddy_mangrove_roots': -34,
+    'mud_bricks': -33,
+    'mud_brick_stairs': -32,
+    'mud_brick_slab': -31,
+    'mud': -30,
+    'mossy_stone_brick_stairs': -29,
+    'mossy_stone_brick_slab': -28,
+    'mossy_cobblestone_stairs': -27,
+    'mossy_cobblestone_slab': -26,
+    'mossy_cobblestone': -25,
+    'moss_block': -24,
+    'mangrove_wood': -23,
+    'mangrove_stairs': -22,
+    'mangrove_slab': -21,
+    'mangrove_roots': -20,
+    'mangrove_planks': -19,
+    'mangrove_log': -18,
+    'mangrove_leaves': -17,
+    'magenta_wool': -16,
+    'magenta_terracotta': -15,
+    'magenta_stained_glass': -14,
+    'magenta_shulker_box': -13,
+    'magenta_concrete': -12,
+    'loom': -11,
+    'lodestone': -10,
+    'lime_glazed_terracotta': -9,
+    'light_gray_wool': -8,
+    'light_gray_terracotta': -7,
+    'light_gray_stained_glass': -6,
+    'light_gray_shulker_box': -5,
+    'light_gray_glazed_terracotta': -4,
+    'light_gray_concrete': -3,
+    'light_blue_glazed_terracotta': -2,
+    'lectern': -1,
+    'air': 0,
+    'red_concrete': 1,
+    'orange_concrete': 2,
+    'yellow_concrete': 3,
+    'lime_concrete': 4,
+    'green_concrete': 5,
+    'light_blue_concrete': 6,
+    'cyan_concrete': 7,
+    'blue_concrete': 8,
+    'purple_concrete': 9,
+    'red_terracotta': 10,
+    'iron_block': 11,
+    'gold_block': 12,
+    'diamond_block': 13,
+    'emerald_block': 14,
+    'lapis_block': 15,
+    'netherite_block': 16,
+    'coal_block': 17,
+    'obsidian': 18,
+    'mossy_stone_bricks': 19,
+    'orange_terracotta': 20,
+    'cracked_stone_bricks': 21,
+    ('piston', (('facing', 'north'),)): 22,
+    'magenta_glazed_terracotta': 23,
+    'sea_lantern': 24,
+    'redstone_lamp': 25,
+    'deepslate': 26,
+    'glass': 27,
+    ('observer', (('facing', 'south'),)): 28,
+    'crafting_table': 29,
+    'yellow_terracotta': 30,
+    'magma_block': 31,
+    'tnt': 32,
+    'pumpkin': 33,
+    'melon': 34,
+    'ancient_debris': 35,
+    'dispenser': 36,
+    'dropper': 37,
+    'bookshelf': 38,
+    'note_block': 39,
+    'lime_terracotta': 40,
+    'chest': 41,
+    'ender_chest': 42,
+    'slime_block': 43,
+    'honey_block': 44,
+    'jukebox': 45,
+    'red_nether_bricks': 46,
+    'nether_bricks': 47,
+    'dark_prismarine': 48,
+    'prismarine': 49,
+    'green_terracotta': 50,
+    'bedrock': 51,
+    'acacia_leaves': 52,
+    'acacia_log': 53,
+    'acacia_planks': 54,
+    'acacia_slab': 55,
+    'acacia_stairs': 56,
+    'acacia_wood': 57,
+    'amethyst_block': 58,
+    'andesite': 59,
+    'light_blue_terracotta': 60,
+    'andesite_slab': 61,
+    'andesite_stairs': 62,
+    'azalea_leaves': 63,
+    'barrel': 64,
+    'basalt': 65,
+    'beacon': 66,
+    'beehive': 67,
+    'birch_leaves': 68,
+    'birch_log': 69,
+    'cyan_terracotta': 70,
+    'birch_planks': 71,
+    'birch_slab': 72,
+    'birch_stairs': 73,
+    'birch_wood': 74,
+    'black_concrete': 75,
+    'black_glazed_terracotta': 76,
+    'black_shulker_box': 77,
+    'black_stained_glass': 78,
+    'black_terracotta': 79,
+    'blue_terracotta': 80,
+    'black_wool': 81,
+    'blackstone': 82,
+    'blackstone_slab': 83,
+    'blackstone_stairs': 84,
+    'blast_furnace': 85,
+    'blue_glazed_terracotta': 86,
+    'blue_ice': 87,
+    'bone_block': 88,
+    'brick_slab': 89,
+    'purple_terracotta': 90,
+    'brick_stairs': 91,
+    'bricks': 92,
+    'brown_concrete': 93,
+    'brown_glazed_terracotta': 94,
+    'brown_mushroom_block': 95,
+    'brown_shulker_box': 96,
+    'brown_stained_glass': 97,
+    'brown_terracotta': 98,
+    'brown_wool': 99,
+    'red_wool': 100,
+    'calcite': 101,
+    'cartography_table': 102,
+    'carved_pumpkin': 103,
+    'cauldron': 104,
+    'chiseled_deepslate': 105,
+    'chiseled_nether_bricks': 106,
+    'chiseled_polished_blackstone': 107,
+    'chiseled_quartz_block': 108,
+    'chiseled_red_sandstone': 109,
+    'chiseled_sandstone': 110,
+    'chiseled_stone_bricks': 111,
+    'clay': 112,
+    'coal_ore': 113,
+    'coarse_dirt': 114,
+    'cobbled_deepslate': 115,
+    'cobbled_deepslate_slab': 116,
+    'cobbled_deepslate_stairs': 117,
+    'cobblestone': 118,
+    'cobblestone_slab': 119,
+    'cobblestone_stairs': 120,
+    'cobweb': 121,
+    'composter': 122,
+    'copper_block': 123,
+    'copper_ore': 124,
+    'cracked_deepslate_bricks': 125,
+    'cracked_deepslate_tiles': 126,
+    'cracked_nether_bricks': 127,
+    'cracked_polished_blackstone_bricks': 128,
+    'crimson_hyphae': 129,
+    'crimson_nylium': 130,
+    'crimson_planks': 131,
+    'crimson_slab': 132,
+    'crimson_stairs': 133,
+    'crying_obsidian': 134,
+    'cut_copper': 135,
+    'cut_copper_slab': 136,
+    'cut_copper_stairs': 137,
+    'cut_red_sandstone': 138,
+    'cut_red_sandstone_slab': 139,
+    'cut_sandstone': 140,
+    'cut_sandstone_slab': 141,
+    'cyan_glazed_terracotta': 142,
+    'dark_oak_leaves': 143,
+    'dark_oak_log': 144,
+    'dark_oak_planks': 145,
+    'dark_oak_slab': 146,
+    'dark_oak_stairs': 147,
+    'dark_oak_wood': 148,
+    'dark_prismarine_slab': 149,
+    'dark_prismarine_stairs': 150,
+    'dead_brain_coral_block': 151,
+    'dead_bubble_coral_block': 152,
+    'dead_fire_coral_block': 153,
+    'dead_horn_coral_block': 154,
+    'dead_tube_coral_block': 155,
+    'deepslate_brick_slab': 156,
+    'deepslate_brick_stairs': 157,
+    'deepslate_bricks': 158,
+    'deepslate_coal_ore': 159,
+    'deepslate_copper_ore': 160,
+    'deepslate_diamond_ore': 161,
+    'deepslate_emerald_ore': 162,
+    'deepslate_gold_ore': 163,
+    'deepslate_iron_ore': 164,
+    'deepslate_lapis_ore': 165,
+    'deepslate_redstone_ore': 166,
+    'deepslate_tile_slab': 167,
+    'deepslate_tile_stairs': 168,
+    'deepslate_tiles': 169,
+    'diamond_ore': 170,
+    'diorite': 171,
+    'diorite_slab': 172,
+    'diorite_stairs': 173,
+    'dirt': 174,
+    'dried_kelp_block': 175,
+    'dripstone_block': 176,
+    'emerald_ore': 177,
+    'enchanting_table': 178,
+    'end_portal_frame': 179,
+    'end_stone': 180,
+    'end_stone_brick_slab': 181,
+    'end_stone_brick_stairs': 182,
+    'end_stone_bricks': 183,
+    'fletching_table': 184,
+    'flowering_azalea_leaves': 185,
+    'frosted_ice': 186,
+    'furnace': 187,
+    'gilded_blackstone': 188,
+    'glowstone': 189,
+    'gold_ore': 190,
+    'granite': 191,
+    'granite_slab': 192,
+    'granite_stairs': 193,
+    'gray_concrete': 194,
+    'gray_glazed_terracotta': 195,
+    'gray_shulker_box': 196,
+    'gray_stained_glass': 197,
+    'gray_terracotta': 198,
+    'gray_wool': 199,
+    'orange_wool': 200,
+    'green_glazed_terracotta': 201,
+    'grindstone': 202,
+    'hay_block': 203,
+    'honeycomb_block': 204,
+    'infested_chiseled_stone_bricks': 205,
+    'infested_cobblestone': 206,
+    'infested_cracked_stone_bricks': 207,
+    'infested_deepslate': 208,
+    'infested_mossy_stone_bricks': 209,
+    'infested_stone': 210,
+    'infested_stone_bricks': 211,
+    'iron_ore': 212,
+    'jack_o_lantern': 213,
+    'jungle_leaves': 214,
+    'jungle_log': 215,
+    'jungle_planks': 216,
+    'jungle_slab': 217,
+    'jungle_stairs': 218,
+    'jungle_wood': 219,
+    'lapis_ore': 220,
+    ('piston', (('facing', 'south'),)): 221,
+    ('piston', (('facing', 'east'),)): 222,
+    ('piston', (('facing', 'west'),)): 223,
+    ('piston', (('facing', 'up'),)): 224,
+    ('piston', (('facing', 'down'),)): 225,
+    'yellow_wool': 300,
+    'lime_wool': 400,
+    'green_wool': 500,
+    'light_blue_wool': 600,
+    'cyan_wool': 700,
+    'blue_wool': 800,
+    'purple_wool': 900,
+    'red_stained_glass': 1000,
+    'orange_stained_glass': 2000,
+    'yellow_stained_glass': 3000,
+    'lime_stained_glass': 4000,
+    'green_stained_glass': 5000,
+    'light_blue_stained_glass': 6000,
+    'cyan_stained_glass': 7000,
+    'blue_stained_glass': 8000,
+    'purple_stained_glass': 9000,
+    'red_shulker_box': 1000000,
+    'orange_shulker_box': 2000000,
+    'yellow_shulker_box': 3000000,
+    'lime_shulker_box': 4000000,
+    'green_shulker_box': 5000000,
+    'light_blue_shulker_box': 6000000,
+    'cyan_shulker_box': 7000000,
+    'blue_shulker_box': 8000000,
+    'purple_shulker_box': 9000000,
+    'tinted_glass': 2147483647,
+}
+
+# Blocks that push a number, in the order their colors and types are listed
+BLOCK_TO_PUSHNUM = {
+    'white_concrete': 0,
+    'red_concrete': 1,
+    'orange_concrete': 2,
+    'yellow_concrete': 3,
+    'lime_concrete': 4,
+    'green_concrete': 5,
+    'light_blue_concrete': 6,
+    'cyan_concrete': 7,
+    'blue_concrete': 8,
+    'purple_concrete': 9,
+    'red_terracotta': 10,
+    'orange_terracotta': 20,
+    'yellow_terracotta': 30,
+    'lime_terracotta': 40,
+    'green_terracotta': 50,
+    'light_blue_terracotta': 60,
+    'cyan_terracotta': 70,
+    'blue_terracotta': 80,
+    'purple_terracotta': 90,
+    'red_wool': 100,
+    'orange_wool': 200,
+    'yellow_wool': 300,
+    'lime_wool': 400,
+    'green_wool': 500,
+    'light_blue_wool': 600,
+    'cyan_wool': 700,
+    'blue_wool': 800,
+    'purple_wool': 900,
+    'red_stained_glass': 1000,
+    'orange_stained_glass': 2000,
+    'yellow_stained_glass': 3000,
+    'lime_stained_glass': 4000,
+    'green_stained_glass': 5000,
+    'light_blue_stained_glass': 6000,
+    'cyan_stained_glass': 7000,
+    'blue_stained_glass': 8000,
+    'purple_stained_glass': 9000,
+    'red_shulker_box': 1000000,
+    'orange_shulker_box': 2000000,
+    'yellow_shulker_box': 3000000,
+    'lime_shulker_box': 4000000,
+    'green_shulker_box': 5000000,
+    'light_blue_shulker_box': 6000000,
+    'cyan_shulker_box': 7000000,
+    'blue_shulker_box': 8000000,
+    'purple_shulker_box': 9000000,
+}
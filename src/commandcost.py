@@ -0,0 +1,227 @@
+# Estimates how many commands each generated function runs, without running it
+# Copyright 2022 Eli Fox
+#
+# Each line of a function is one command, and a line calling a function with "function" or
+# "execute ... run function" also runs that function's commands. A call behind an if or unless might
+# not happen. Calls whose conditions test the same score, block, or data against different values
+# are taken to exclude each other, so the worst case counts the costliest of them and the typical case
+# their average. A call behind any other condition counts fully in the worst case and half in the
+# typical case. A function calling itself runs as many times as RECURSION_DEPTHS gives.
+
+import json, re, sys
+
+from common import *
+from mcsim import DATAPACK_PATH, STEP_FUNCTION, getFunctions, readDatapack
+
+NAMESPACE = 'craftyfunge'
+
+# Worst and typical times a function calling itself runs. The rest are taken as up to the stack size, but usually once
+RECURSION_DEPTHS = {
+    f'{NAMESPACE}:wrapped/recount_length'       : (MAX_STACK_SIZE, 1), # Once per zero on top of the stack, and once more
+    f'{NAMESPACE}:rotate/remove_bottom_zeros'   : (MAX_STACK_SIZE, 1),
+    f'{NAMESPACE}:rotate/pad_bottom'            : (MAX_STACK_SIZE, 2),
+    f'{NAMESPACE}:arithmetic/exp_rec_mult'      : (MAX_NUMBER_HEIGHT, 3), # Once per multiplication, past which most powers overflow
+    f'{NAMESPACE}:input/eat_spaces'             : (MAX_DIGITS, 2),
+    f'{NAMESPACE}:input/input_digits'           : (MAX_DIGITS + 1, 4),
+    f'{NAMESPACE}:input/restore_eaten_input'    : (MAX_DIGITS + 1, 1),
+    f'{NAMESPACE}:prepop/input_prepop_recurse'  : (MAX_STACK_SIZE + 1, 1),
+    f'{NAMESPACE}:turbo/step'                   : (1, 1), # Counted for one step
+}
+DEFAULT_DEPTHS = (MAX_STACK_SIZE, 1)
+
+CALL = re.compile(r'(?:execute (.*) run )?function (\S+)')
+CONDITION = re.compile(r'\b(?:if|unless)\b')
+
+
+# Conditions that only differ in the values tested against become the same
+def getConditionKey(condition):
+    condition = re.sub(r'matches \S+', 'matches _', condition)
+    condition = re.sub(r'\b(if|unless) block (\S+ \S+ \S+) \S+', r'\1 block \2 _', condition)
+    return re.sub(r'\{[^{}]*\}', '{_}', condition)
+
+
+# The generator's name has a space, so it's loaded from its path. Loading it doesn't write anything
+def loadGenerator():
+    import importlib.util
+
+    spec = importlib.util.spec_from_file_location('function_generator', resourcePath('function generator.py'))
+    generator = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(generator)
+    return generator
+
+
+# Functions run by each instruction block, by the block
+def getInstructionFunctions(generator):
+    instructions = [(block, f'{NAMESPACE}:{name}') for block, name in generator.BLOCKS_TO_FN_NAMES]
+    instructions += [(block, f'{NAMESPACE}:arithmetic/{name}') for name, _, block in generator.BINARY_OPERATORS]
+    instructions += [(block, f'{NAMESPACE}:comparisons/{name}') for name, _, block in generator.COMPARISON_TYPES]
+    instructions.append(('numbers', f'{NAMESPACE}:push_number'))
+    return instructions
+
+
+class CommandCosts():
+    # fixed gives costs to use for some functions instead of working them out
+    def __init__(self, functions, depths=RECURSION_DEPTHS, fixed=dict()):
+        self.functions = functions
+        self.depths = depths
+        self.costs = dict(fixed) # Name to worst and typical commands
+        self.missing = set()
+        self.cycles = set() # Functions calling each other, which are only counted once
+
+
+    def getCost(self, name):
+        if name not in self.costs:
+            self.costs[name] = None # Still working it out
+            self.costs[name] = self.findCost(name)
+        elif self.costs[name] is None:
+            self.cycles.add(name)
+            return (0, 0)
+
+        return self.costs[name]
+
+
+    def findCost(self, name):
+        if name not in self.functions:
+            self.missing.add(name)
+            return (0, 0)
+
+        worst = typical = 0
+        recursive = False
+        groups = dict() # Condition key to the conditions of calls and their costs
+        for line in self.functions[name]:
+            worst += 1
+            typical += 1
+
+            match = CALL.fullmatch(line)
+            if match is None:
+                continue
+            condition, callee = match.group(1) or '', match.group(2)
+
+            # Calls to itself are counted by running the whole function again
+            if callee == name:
+                recursive = True
+                continue
+
+            calleeWorst, calleeTypical = self.getCost(callee)
+            if CONDITION.search(condition) is None:
+                worst += calleeWorst
+                typical += calleeTypical
+            else:
+                groups.setdefault(getConditionKey(condition), []).append((condition, calleeWorst, calleeTypical))
+
+        for branches in groups.values():
+            if len(set(condition for condition, _, _ in branches)) > 1:
+                worst += max(branchWorst for _, branchWorst, _ in branches)
+                typical += sum(branchTypical for _, _, branchTypical in branches) / len(branches)
+            else:
+                worst += sum(branchWorst for _, branchWorst, _ in branches)
+                typical += sum(branchTypical for _, _, branchTypical in branches) / 2
+
+        if recursive:
+            worstDepth, typicalDepth = self.depths.get(name, DEFAULT_DEPTHS)
+            worst *= worstDepth
+            typical *= typicalDepth
+
+        return (worst, typical)
+
+
+    def getAllCosts(self):
+        return {name: self.getCost(name) for name in sorted(self.functions)}
+
+
+# Works out the costs of every function and instruction, and of a step without its instruction
+def estimateCosts(functions, generator):
+    costs = CommandCosts(functions)
+    functionCosts = costs.getAllCosts()
+
+    instructions = []
+    for block, name in getInstructionFunctions(generator):
+        if name in functions:
+            worst, typical = functionCosts[name]
+            instructions.append({'block': block, 'function': name, 'worst': worst, 'typical': typical})
+    instructions.sort(key=lambda instruction: (-instruction['worst'], -instruction['typical'], instruction['block']))
+
+    # Steps cost the same besides their instruction, so those are taken out
+    overhead = CommandCosts(functions, fixed={instruction['function']: (0, 0) for instruction in instructions}).getCost(STEP_FUNCTION)
+
+    return {
+        'step'          : {'worst': overhead[0], 'typical': overhead[1]},
+        'instructions'  : instructions,
+        'functions'     : {name: {'worst': worst, 'typical': typical} for name, (worst, typical) in functionCosts.items()},
+        'missing'       : sorted(costs.missing),
+        'cycles'        : sorted(costs.cycles),
+    }
+
+
+def printReport(report, top=20):
+    step = report['step']
+    print(f'Each step runs {step["worst"]} commands at worst and {step["typical"]:.1f} typically besides its instruction\n')
+
+    print('Instructions by commands:')
+    width = max(len(instruction['block']) for instruction in report['instructions'])
+    print(f'  {"Block":<{width}}  {"Worst":>7}  {"Typical":>8}  Function')
+    for instruction in report['instructions']:
+        print(f'  {instruction["block"]:<{width}}  {instruction["worst"]:>7}  {instruction["typical"]:>8.1f}  {instruction["function"]}')
+
+    print('\nMost commands by function:')
+    functions = sorted(report['functions'].items(), key=lambda item: (-item[1]['worst'], item[0]))
+    for name, cost in functions[:top]:
+        print(f'  {cost["worst"]:>7}  {cost["typical"]:>8.1f}  {name}')
+
+    if report['missing']:
+        print('\nCalled but not generated: ' + ', '.join(report['missing']), file=sys.stderr)
+    if report['cycles']:
+        print('Calling each other, so only counted once: ' + ', '.join(report['cycles']), file=sys.stderr)
+
+
+# Functions whose worst case went up from a report saved earlier
+def findRegressions(report, baseline):
+    regressions = []
+    for name, cost in sorted(baseline['functions'].items()):
+        if name in report['functions'] and report['functions'][name]['worst'] > cost['worst']:
+            regressions.append(f'{name} went from {cost["worst"]} to {report["functions"][name]["worst"]} commands at worst')
+    return regressions
+
+
+# The backends come from the generator, so it's loaded first
+def parseArgs(generator):
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Estimate the commands each function of the in-game interpreter runs, without Minecraft.')
+    parser.add_argument('-d', dest='datapack', metavar='DATAPACK', default=None, help='Read the functions from the datapack folder DATAPACK instead of generating them.')
+    parser.add_argument('-w', dest='useWorld', action='store_true', help='Read the functions from the datapack in the world in world.cfg instead of generating them.')
+    parser.add_argument('-s', '--stack', dest='stackBackend', choices=generator.STACK_BACKENDS, default=None, help='Stack backend to generate with, as in "function generator.py".')
+    parser.add_argument('-v', '--vars', dest='varsBackend', choices=generator.VARS_BACKENDS, default=None, help='Variables backend to generate with, as in "function generator.py".')
+    parser.add_argument('-n', dest='top', metavar='N', type=int, default=20, help='List the N functions with the most commands. Defaults to 20.')
+    parser.add_argument('-j', dest='jsonOut', metavar='JSONFILE', default=None, help='Write the estimates to JSONFILE.')
+    parser.add_argument('-b', dest='baseline', metavar='BASELINE', type=argparse.FileType('r'), default=None, help='Exit with an error if any function\'s worst case is more than in BASELINE, a file written by -j.')
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    generator = loadGenerator()
+    args = parseArgs(generator)
+
+    if args.datapack is not None or args.useWorld:
+        files = readDatapack(args.datapack if args.datapack is not None else os.path.join(readConfig(), DATAPACK_PATH))
+    else:
+        if args.stackBackend is not None:
+            generator.STACK_BACKEND = args.stackBackend
+        if args.varsBackend is not None:
+            generator.VARS_BACKEND = args.varsBackend
+        files = generator.generateFiles()
+
+    report = estimateCosts(getFunctions(files), generator)
+    printReport(report, args.top)
+
+    if args.jsonOut is not None:
+        with open(args.jsonOut, 'w') as f:
+            json.dump(report, f, indent=4)
+
+    if args.baseline is not None:
+        regressions = findRegressions(report, json.load(args.baseline))
+        for regression in regressions:
+            print(regression, file=sys.stderr)
+        if regressions:
+            sys.exit(1)
@@ -3,7 +3,6 @@
 
 import sys, os
 import math, enum
-import csv
 
 # Stack and number limits
 MAX_NUMBER_HEIGHT = 31
@@ -165,6 +164,14 @@ BLOCKS_WITH_EXTRA_DATA = ['piston', 'observer']
 EXTRA_DATA_ORDER = ['facing']
 
 
+# Raised when a program hits a runtime error
+class CraftyFungeError(Exception):
+    def __init__(self, pos, msg):
+        super().__init__(msg)
+        self.pos = tuple(pos)
+        self.msg = msg
+
+
 # Gets a path to a resource depending on if it's bundled or not
 def resourcePath(relPath, config=False):
     # If we are bundled and getting config data, we want a different location
@@ -205,7 +212,6 @@ def findNumColors():
             colorNumbers[block] = num
             
     return colorNumbers
-BLOCK_TO_PUSHNUM = findNumColors()
 
 
 # Generates consistent paired tuples from extra data
@@ -220,6 +226,8 @@ def getExtraDataTup(block, extraData):
 
 # Read block values from csv
 def readBlockValues():
+    import csv
+    
     valueToBlock = dict()
     
     with open(resourcePath('data/block_to_value.csv'), 'r', newline='') as f:
@@ -245,7 +253,15 @@ def readBlockValues():
     blockToValue = invertDict(valueToBlock)
     
     return valueToBlock, blockToValue
-VALUE_TO_BLOCK, BLOCK_TO_VALUE = readBlockValues()
+
+
+# The tables are generated ahead of time by maketables.py, so nothing has to be parsed at startup
+try:
+    from blocktables import VALUE_TO_BLOCK, BLOCK_TO_VALUE, BLOCK_TO_PUSHNUM
+# Before they've been generated for the first time
+except ImportError:
+    BLOCK_TO_PUSHNUM = findNumColors()
+    VALUE_TO_BLOCK, BLOCK_TO_VALUE = readBlockValues()
 
 
 # Get a block's name from extra data
@@ -0,0 +1,465 @@
+# Compiles a program ahead of time into its own datapack, so it runs without the IP checking blocks
+# Copyright 2022 Eli Fox
+#
+# Every node of the program's flow graph is known ahead of time, so straight chains of nodes
+# become one function each, with their stack ops written out and turns, skips, tunnels and
+# literal modes gone entirely. Branches pick the next function from a score. Only programs
+# whose graph is complete can be compiled, so nothing can goto or set a block.
+#
+# The compiled pack runs on top of the craftyfunge datapack, generated with the storage stack.
+# It uses the same stack, variables, input and output, and calls its functions for anything
+# not worth writing out. It runs up to a budget of steps each tick, picking up where it left
+# off with $<namespace> aot_pc, and stops early on output or input like turbo mode.
+
+import json, os, re, shutil
+
+from common import *
+from flowgraph import FlowGraph, applyEffect
+
+STACK_DATA = 'storage craftyfunge:stack values'
+MAX_STACK_LENGTH = MAX_STACK_SIZE + 1
+
+DEFAULT_BUDGET = 1000
+PACK_FORMAT = 10 # 1.19
+
+# Instructions run by calling the craftyfunge datapack's function for them
+CALLED_FUNCTIONS = {
+    EXP: 'arithmetic/exp',
+    CLEAR: 'clear_stack',
+    SWAP: 'swap',
+    ROTATE: 'rotate',
+    PUSH_LEN: 'push_stack_length',
+    OUT_NUM: 'output_number',
+    OUT_ASCII: 'output_ascii',
+    OUT_NEWLINE: 'output_newline',
+    IN_NUM: 'input/input_number',
+    IN_ASCII: 'input/input_ascii',
+    GET_BLOCK: 'get_block',
+    GET_VAR: 'get_var',
+    SET_VAR: 'set_var',
+}
+
+# Scoreboard operations for binary ops on (second, top)
+BINARY_OPERATIONS = {ADD: '+=', SUB: '-=', MULT: '*=', DIV: '/=', MOD: '%='}
+COMPARISONS = {GREATER: '>', LESS: '<'}
+
+# Ops that can stop the program partway through a chain
+STOPPING_BLOCKS = {DIV, MOD}
+
+# Branch functions are split until at most this many are checked one by one
+DISPATCH_LEAF_SIZE = 4
+
+# Compiled packs are told apart from other folders by their description, so only they're replaced
+DESCRIPTION = 'CraftyFunge program compiled as '
+
+# Namespaces of other packs, which a compiled pack mustn't write functions into
+RESERVED_NAMESPACES = ('minecraft', 'craftyfunge', 'suso.str')
+
+
+class CompileError(Exception):
+    pass
+
+
+# Lowercase letters, digits and underscores, as namespaces need
+def getNamespace(programFile):
+    name = os.path.splitext(os.path.basename(programFile))[0].lower()
+    return 'cf_' + re.sub('[^a-z0-9_]', '_', name)
+
+
+class DatapackCompiler():
+    def __init__(self, interp, namespace, budget=DEFAULT_BUDGET):
+        if namespace in RESERVED_NAMESPACES or not re.fullmatch('[a-z0-9_.-]+', namespace):
+            raise CompileError(f'Can\'t compile into the namespace "{namespace}". Use lowercase letters, digits, and _.-, and not {", ".join(RESERVED_NAMESPACES)}.')
+
+        self.graph = FlowGraph(interp)
+        self.namespace = namespace
+        self.budget = budget
+        self.player = f'${namespace}'
+
+        if not self.graph.isComplete():
+            dynamic = self.graph.dynamicCells()
+            where = '; '.join(f'{name} at {", ".join(str(self.graph.getPos(cell)) for cell in cells)}' for name, cells in dynamic.items() if name != 'random direction')
+            raise CompileError(f'Only programs that can\'t goto or set a block can be compiled. This one can {where}.')
+
+        self.files = dict() # Path in the pack to its lines
+        self.chains = []    # Nodes in each chain, where a chain's index is its number
+        self.chainOf = dict()
+
+        self.findChains()
+
+
+    def score(self, objective):
+        return f'{self.player} {objective}'
+
+
+    # Where a node goes next, with cells outside the structure given as None
+    def getNexts(self, node):
+        cell, dir, mode = node
+        nexts, _ = self.graph.successors(node, self.graph.depths[node])
+        block = self.graph.getBlock(cell)
+        if mode == Modes.DEFAULT and block == PUSH_NEXT_BLOCK and not self.graph.inBounds(self.graph.ahead(cell, dir)):
+            return [None]
+        return [nextNode if self.graph.inBounds(nextNode[0]) else None for nextNode in nexts]
+
+
+    # Splits the graph into chains that always run start to end
+    def findChains(self):
+        preds = dict()
+        for node, nexts in self.graph.edges.items():
+            for nextNode in nexts:
+                preds.setdefault(nextNode, set()).add(node)
+
+        # Nodes that start a chain, in a fixed order so the pack is the same every time
+        def startsChain(node):
+            if node == self.graph.start or len(preds.get(node, ())) != 1:
+                return True
+            pred, = preds[node]
+            predBlock = self.graph.getBlock(pred[0])
+            return len(self.getNexts(pred)) != 1 or (pred[2] == Modes.DEFAULT and predBlock in STOPPING_BLOCKS)
+
+        starts = [self.graph.start] + sorted(node for node in self.graph.edges if node != self.graph.start and startsChain(node))
+        for start in starts:
+            self.chainOf[start] = len(self.chains)
+            chain = [start]
+            node = start
+            while True:
+                nexts = self.getNexts(node)
+                if len(nexts) != 1 or nexts[0] is None or startsChain(nexts[0]):
+                    break
+                node = nexts[0]
+                chain.append(node)
+            self.chains.append(chain)
+
+
+    # Stack helpers, written out when the depth is known well enough and calling the datapack otherwise
+    @staticmethod
+    def popTo(n, depth):
+        if depth[0] >= 1:
+            return [
+                f'execute store result score $stack stack{n} run data get {STACK_DATA}[-1]',
+                f'data remove {STACK_DATA}[-1]',
+                'scoreboard players remove $stack stacklen 1',
+            ]
+        return [f'function craftyfunge:pop_stack{n}']
+
+
+    @staticmethod
+    def pushScore(n, depth):
+        if depth[0] >= 1 and depth[1] < MAX_STACK_LENGTH:
+            return [
+                f'data modify {STACK_DATA} append value 0',
+                f'execute store result {STACK_DATA}[-1] int 1 run scoreboard players get $stack stack{n}',
+                'scoreboard players add $stack stacklen 1',
+            ]
+        return [f'scoreboard players operation $stack stackin = $stack stack{n}', 'function craftyfunge:push_stack']
+
+
+    @staticmethod
+    def pushConst(value, depth):
+        if (value != 0 or depth[0] >= 1) and depth[1] < MAX_STACK_LENGTH:
+            return [f'data modify {STACK_DATA} append value {value}', 'scoreboard players add $stack stacklen 1']
+        return [f'scoreboard players set $stack stackin {value}', 'function craftyfunge:push_stack']
+
+
+    # Commands for what a node does to the stack and world, not counting where it goes
+    def compileNode(self, node):
+        cell, dir, mode = node
+        block = self.graph.getBlock(cell)
+        depth = self.graph.depths[node]
+        lines = []
+
+        if mode == Modes.IN_NUM_LITERAL:
+            if block in BLOCK_TO_PUSHNUM:
+                digit = BLOCK_TO_PUSHNUM[block]
+                while digit // 10 > 0:
+                    digit //= 10
+
+                # Take the absolute value, add the digit, and put the literal's sign back
+                lines += self.popTo(1, depth)
+                lines.append('execute if score $stack stack1 matches ..-1 run scoreboard players operation $stack stack1 *= $constants minus')
+                lines.append('scoreboard players operation $stack stack1 *= $constants ten')
+                lines.append(f'scoreboard players add $stack stack1 {digit}')
+                lines.append('scoreboard players operation $stack stack1 *= $temp temp2')
+                lines += self.pushScore(1, applyEffect(depth, 1, 0, 0))
+            elif block == NEG:
+                lines.append('scoreboard players set $temp temp2 -1')
+                lines += self.popTo(1, depth)
+                lines.append('execute if score $stack stack1 matches 1.. run scoreboard players operation $stack stack1 *= $constants minus')
+                lines += self.pushScore(1, applyEffect(depth, 1, 0, 0))
+            return lines
+
+        if mode == Modes.IN_STR_LITERAL:
+            value = self.graph.getValue(cell)
+            if block != IN_STR_LITERAL and value is not None:
+                lines += self.pushConst(value, depth)
+            return lines
+
+        if mode == Modes.TUNNEL:
+            return lines
+
+        # Default mode
+        popped = applyEffect(depth, 2, 0, 0)
+        if block in BLOCK_TO_PUSHNUM:
+            lines += self.pushConst(BLOCK_TO_PUSHNUM[block], depth)
+        elif block in BINARY_OPERATIONS:
+            lines += self.popTo(1, depth)
+            lines += self.popTo(2, applyEffect(depth, 1, 0, 0))
+            if block in STOPPING_BLOCKS:
+                fullName = 'divide' if block == DIV else 'mod'
+                lines.append('execute if score $stack stack1 matches 0 run tellraw @a {"text":"Error: Attempted to %s by zero.","color":"red"}' % fullName)
+                lines.append('execute if score $stack stack1 matches 0 run function craftyfunge:stop')
+                lines += [f'execute unless score $stack stack1 matches 0 run {line}' for line in self.binaryResult(block, popped)]
+            else:
+                lines += self.binaryResult(block, popped)
+        elif block in COMPARISONS:
+            lines += self.popTo(1, depth)
+            lines += self.popTo(2, applyEffect(depth, 1, 0, 0))
+            lines.append(f'execute store result score $stack stack2 if score $stack stack2 {COMPARISONS[block]} $stack stack1')
+            lines += self.pushScore(2, popped)
+        elif block == NOT:
+            lines += self.popTo(1, depth)
+            lines.append('execute store result score $stack stack1 if score $stack stack1 matches 0')
+            lines += self.pushScore(1, applyEffect(depth, 1, 0, 0))
+        elif block == NEG:
+            lines += self.popTo(1, depth)
+            lines.append('scoreboard players operation $stack stack1 *= $constants minus')
+            lines += self.pushScore(1, applyEffect(depth, 1, 0, 0))
+        elif block == POP:
+            lines += self.popTo(1, depth)
+        elif block == DUP:
+            if depth[0] >= 1 and depth[1] + 1 < MAX_STACK_LENGTH:
+                lines.append(f'data modify {STACK_DATA} append from {STACK_DATA}[-1]')
+                lines.append('scoreboard players add $stack stacklen 1')
+            else:
+                lines.append('function craftyfunge:duplicate')
+        elif block in (IF, SKIP_COND):
+            # Kept apart from the stack scores until the branch is taken
+            lines += self.popTo(1, depth)
+            lines.append(f'scoreboard players operation {self.score("aot_cond")} = $stack stack1')
+        elif block == PUSH_NEXT_BLOCK:
+            value = self.graph.getValue(self.graph.ahead(cell, dir))
+            if value is not None:
+                lines += self.pushConst(value, depth)
+        elif block == PUSH_POS:
+            for xyz, value in enumerate(self.graph.getPos(cell)):
+                lines += self.pushConst(value, applyEffect(depth, 0, xyz, xyz))
+        elif block == IN_NUM_LITERAL:
+            lines.append('scoreboard players set $temp temp2 1')
+        elif block == RANDOM_DIR:
+            lines.append('function craftyfunge:random_direction')
+        elif block == STOP:
+            lines.append('function craftyfunge:stop')
+        elif block == RAISE_ERROR:
+            lines.append('function craftyfunge:raise_error')
+        elif block in CALLED_FUNCTIONS:
+            lines.append(f'function craftyfunge:{CALLED_FUNCTIONS[block]}')
+
+        return lines
+
+
+    def binaryResult(self, block, depth):
+        return [f'scoreboard players operation $stack stack2 {BINARY_OPERATIONS[block]} $stack stack1'] + self.pushScore(2, depth)
+
+
+    def chainFunction(self, chain):
+        return f'{self.namespace}:chain/{chain}'
+
+
+    # Whether to keep going this tick. Once a chain returns this is always false, so only one branch is ever taken
+    def continuing(self):
+        return (f'if score {self.score("aot_running")} matches 1 unless score $ip mode matches {Modes.STOPPED} '
+                f'if score {self.score("aot_budget")} matches 1.. if score $ip yield matches 0 ')
+
+
+    # Goes on to one of the chains, or leaves it for the next tick once the budget is spent or the program outputs or inputs.
+    # Every branch's pc is set before any is called, as calling one runs everything after it
+    def jump(self, branches):
+        lines = []
+        calls = []
+        running = f'if score {self.score("aot_running")} matches 1 unless score $ip mode matches {Modes.STOPPED} '
+        for condition, nextNode in branches:
+            if nextNode is None:
+                lines.append(f'execute {condition}run tellraw @a {{"text":"Error: The IP left the program.","color":"red"}}')
+                lines.append(f'execute {condition}run function craftyfunge:stop')
+            else:
+                chain = self.chainOf[nextNode]
+                lines.append(f'execute {condition}{running}run scoreboard players set {self.score("aot_pc")} {chain}')
+                calls.append(f'execute {condition}{self.continuing()}run function {self.chainFunction(chain)}')
+        return lines + calls
+
+
+    def compileChain(self, chain):
+        lines = []
+        for node in self.chains[chain]:
+            lines += self.compileNode(node)
+        lines.append(f'scoreboard players remove {self.score("aot_budget")} {len(self.chains[chain])}')
+
+        last = self.chains[chain][-1]
+        cell, dir, mode = last
+        block = self.graph.getBlock(cell)
+        nexts = self.getNexts(last)
+
+        if mode == Modes.DEFAULT and block == STOP:
+            lines.append(f'scoreboard players set {self.score("aot_running")} 0')
+        elif mode == Modes.DEFAULT and block == IF:
+            # Zero goes out the back
+            facing, back = nexts
+            lines += self.jump([(f'if score {self.score("aot_cond")} matches 0 ', back), (f'unless score {self.score("aot_cond")} matches 0 ', facing)])
+        elif mode == Modes.DEFAULT and block == SKIP_COND:
+            # Zero skips the next block
+            ahead, skipped = nexts
+            lines += self.jump([(f'if score {self.score("aot_cond")} matches 0 ', skipped), (f'unless score {self.score("aot_cond")} matches 0 ', ahead)])
+        elif mode == Modes.DEFAULT and block == RANDOM_DIR:
+            lines += self.jump([(f'if score $ip direction matches {i} ', nextNode) for i, nextNode in enumerate(nexts)])
+        elif nexts:
+            lines += self.jump([('', nexts[0])])
+
+        self.files[f'functions/chain/{chain}.mcfunction'] = lines
+
+
+    # Picks the chain to pick up from, splitting the range of chains in half until there are few enough to check.
+    # The chain called changes the pc, so the checks after it are kept from running too
+    def compileResume(self, chains, name):
+        lines = []
+        if len(chains) <= DISPATCH_LEAF_SIZE:
+            for chain in chains:
+                lines.append(f'execute {self.continuing()}if score {self.score("aot_pc")} matches {chain} run function {self.chainFunction(chain)}')
+        else:
+            mid = len(chains) // 2
+            for half in (chains[:mid], chains[mid:]):
+                halfName = f'resume/{half[0]}_{half[-1]}'
+                lines.append(f'execute {self.continuing()}if score {self.score("aot_pc")} matches {half[0]}..{half[-1]} run function {self.namespace}:{halfName}')
+                self.compileResume(half, halfName)
+
+        self.files[f'functions/{name}.mcfunction'] = lines
+
+
+    def compile(self):
+        for chain in range(len(self.chains)):
+            self.compileChain(chain)
+        self.compileResume(list(range(len(self.chains))), 'resume')
+
+        ns = self.namespace
+        self.files['functions/load.mcfunction'] = [
+            f'scoreboard objectives add {objective} dummy' for objective in ('aot_pc', 'aot_running', 'aot_budget', 'aot_cond')
+        ]
+
+        # Run from a command block, like craftyfunge:start. The datapack's own IP is left stepping, so it doesn't move
+        self.files['functions/start.mcfunction'] = [
+            'kill @e[tag=StartAnchor]',
+            'summon minecraft:armor_stand ~ ~ ~ {Tags:["StartAnchor"],Invisible:1b}',
+            *[f'execute store result score $start_pos {objective} run data get entity @e[tag=StartAnchor,limit=1] Pos[{axis}] 1' for axis, objective in enumerate(AXIS_NAMES)],
+            *[f'scoreboard players set $stack stack{i} 0' for i in range(1, 5)],
+            *[f'scoreboard players set $temp temp{i} 0' for i in range(1, 5)],
+            'scoreboard players set $stack stackin 0',
+            f'data modify {STACK_DATA} set value []',
+            'scoreboard players set $stack stacklen 0',
+            'scoreboard players reset * vars',
+            'data remove storage craftyfunge:io textBuffer',
+            'data remove storage craftyfunge:io eatenBuffer',
+            'scoreboard players set $ip running 0',
+            'scoreboard players set $ip stepping 1',
+            f'scoreboard players set $ip mode {Modes.DEFAULT}',
+            'function suso.str:charsets/ascii',
+            'function craftyfunge:prepop/parse_prepop',
+            f'scoreboard players set {self.score("aot_pc")} 0',
+            f'scoreboard players set {self.score("aot_running")} 1',
+        ]
+
+        self.files['functions/tick.mcfunction'] = [
+            f'execute if score {self.score("aot_running")} matches 1 unless score $ip mode matches {Modes.STOPPED} run function {ns}:run',
+            f'execute if score {self.score("aot_running")} matches 1 if score $ip mode matches {Modes.STOPPED} run scoreboard players set {self.score("aot_running")} 0',
+        ]
+        self.files['functions/run.mcfunction'] = [
+            f'scoreboard players set {self.score("aot_budget")} {self.budget}',
+            'scoreboard players set $ip yield 0',
+            f'function {ns}:resume',
+        ]
+        self.files['functions/stop.mcfunction'] = [
+            f'scoreboard players set {self.score("aot_running")} 0',
+        ]
+
+        return self.files
+
+
+    # Whether a folder can be written over, which it can if it's missing, empty, or an earlier compiled pack
+    @staticmethod
+    def isReplaceable(packPath):
+        if not os.path.exists(packPath):
+            return True
+        if not os.path.isdir(packPath):
+            return False
+        if not os.listdir(packPath):
+            return True
+
+        try:
+            with open(os.path.join(packPath, 'pack.mcmeta'), 'r') as f:
+                description = json.load(f)['pack']['description']
+        except (OSError, ValueError, KeyError, TypeError):
+            return False
+        return isinstance(description, str) and description.startswith(DESCRIPTION)
+
+
+    # Writes the pack to a folder, replacing an earlier compiled pack there
+    def write(self, packPath):
+        if not DatapackCompiler.isReplaceable(packPath):
+            raise CompileError(f'"{packPath}" has something besides a compiled pack in it, so it won\'t be replaced. Give another folder with -o.')
+
+        files = self.compile()
+        shutil.rmtree(packPath, ignore_errors=True)
+
+        def writeJson(path, obj):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w') as f:
+                json.dump(obj, f, indent=4)
+
+        writeJson(os.path.join(packPath, 'pack.mcmeta'), {'pack': {'pack_format': PACK_FORMAT, 'description': DESCRIPTION + self.namespace}})
+        for event in ('load', 'tick'):
+            writeJson(os.path.join(packPath, f'data/minecraft/tags/functions/{event}.json'), {'values': [f'{self.namespace}:{event}']})
+
+        for path, lines in files.items():
+            filename = os.path.join(packPath, 'data', self.namespace, path)
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+            with open(filename, 'w') as f:
+                f.write('\n'.join(lines))
+
+
+    def report(self):
+        commands = sum(len(lines) for path, lines in self.files.items() if path.startswith('functions/chain/'))
+        print(f'Compiled {len(self.graph.depths)} nodes into {len(self.chains)} chains with {commands} commands')
+        print(f'Start it from a command block with "function {self.namespace}:start"')
+
+
+def parseArgs():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Compile a CraftyFunge program into its own datapack, which runs it without an IP checking blocks.')
+    parser.add_argument('filename', metavar='FILE', help='Which file to compile. Must be an nbt file exported from a structure block.')
+    parser.add_argument('-w', dest='useWorldPath', action='store_true', help='Compile a file from the configured structure block export location.')
+    parser.add_argument('-n', dest='namespace', default=None, help='Namespace of the datapack\'s functions. Defaults to cf_ and the file\'s name.')
+    parser.add_argument('-o', dest='packPath', metavar='DIR', default=None, help='Folder to write the datapack to. Defaults to the datapacks folder of the world in world.cfg.')
+    parser.add_argument('-b', dest='budget', metavar='STEPS', type=int, default=DEFAULT_BUDGET, help=f'Run up to STEPS steps each tick. Defaults to {DEFAULT_BUDGET}.')
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    import sys
+    import craftyfunge
+    from craftyfunge import CraftyFunge
+
+    args = parseArgs()
+    if args.useWorldPath:
+        craftyfunge.WORLD_PATH = readConfig()
+
+    namespace = args.namespace or getNamespace(args.filename)
+    packPath = args.packPath or os.path.join(readConfig(), 'datapacks', namespace)
+
+    try:
+        compiler = DatapackCompiler(CraftyFunge(args.filename, args.useWorldPath), namespace, args.budget)
+        compiler.write(packPath)
+    except CompileError as e:
+        print(f'Error: {e}', file=sys.stderr)
+        sys.exit(1)
+
+    compiler.report()
@@ -4,13 +4,18 @@
 from nbt.nbt import NBTFile, TAG_Long, TAG_Int, TAG_String, TAG_List, TAG_Compound
 from nbt import nbt, world
 from pprint import pprint
-import collections, copy
-import os, sys
+import collections, copy, io
+import os, sys, time
 
 from common import *
-from instructions import ModeIsrDefault
+from instructions import ModeIsrDefault, MODE_ISRS
+from loopdetect import LoopDetector, HashedStack, cellHash
+from tracers import HOOK_NAMES, STEP_HOOK_NAMES, HookedStack, DebugTracer
+from metrics import MetricsTracer
+import snapshot
 
 STRUCTURE_PATH = 'generated/craftyfunge/structures/'
+STRUCTURE_DATA_VERSION = 3105 # Minecraft 1.19, matching the examples
 
 
 # Unpack into python format
@@ -25,6 +30,49 @@ def unpackNbt(tag):
         return tag.value
 
 
+# Writes blocks, laid out like CraftyFunge.blocks, to a structure file
+def writeStructure(filename, blocks, size):
+    structure = NBTFile()
+    structure.name = ''
+
+    sizeTag = TAG_List(name='size', type=TAG_Int)
+    sizeTag.tags.extend(TAG_Int(n) for n in size)
+
+    # Each different block and set of properties is only stored once
+    paletteTag = TAG_List(name='palette', type=TAG_Compound)
+    blocksTag = TAG_List(name='blocks', type=TAG_Compound)
+    palette = dict()
+    for x in range(size[0]):
+        for y in range(size[1]):
+            for z in range(size[2]):
+                block = blocks[x][y][z]
+                properties = tuple(sorted(block.get('Properties', {}).items()))
+                key = (block['Name'], properties)
+
+                if key not in palette:
+                    palette[key] = len(palette)
+                    stateTag = TAG_Compound()
+                    stateTag.tags.append(TAG_String(name='Name', value='minecraft:'+block['Name']))
+                    if properties:
+                        propertiesTag = TAG_Compound(name='Properties')
+                        for name, value in properties:
+                            # Minecraft stores properties as lowercase strings
+                            value = str(value).lower() if isinstance(value, bool) else str(value)
+                            propertiesTag.tags.append(TAG_String(name=name, value=value))
+                        stateTag.tags.append(propertiesTag)
+                    paletteTag.tags.append(stateTag)
+
+                posTag = TAG_List(name='pos', type=TAG_Int)
+                posTag.tags.extend((TAG_Int(x), TAG_Int(y), TAG_Int(z)))
+                blockTag = TAG_Compound()
+                blockTag.tags.extend((TAG_Int(name='state', value=palette[key]), posTag))
+                blocksTag.tags.append(blockTag)
+
+    structure.tags.extend((sizeTag, blocksTag, paletteTag, TAG_List(name='entities', type=TAG_Compound)))
+    structure.tags.append(TAG_Int(name='DataVersion', value=STRUCTURE_DATA_VERSION))
+    structure.write_file(filename)
+
+
 # Nicely formatted nested list
 def pprintNestedList(L, depth=0):
     space = '\t'*depth
@@ -49,24 +97,31 @@ class CraftyFunge():
     def __init__(self, programName, useWorldPath=True, 
                  input=sys.stdin, output=sys.stdout, 
                  debug=False, debugOut=sys.stdout,
-                 stack=[]):
+                 stack=[], detectLoops=False, accelerate=False, collectMetrics=False,
+                 optimize=False, blocks=None):
         
         self.programName = programName
         self.programFile = CraftyFunge.getProgramFile(programName, useWorldPath)
         self.input = input
         self.output = output
         self.debug = debug
-        
-        if self.debug:
-            self.outputBuffer = []
-            self.debugBuffer = []
-            self.debugOut = debugOut
-            self.steps = 0
+        self.accelerate = accelerate
+        self.optimize = optimize
+        self.steps = 0
         
         self.block = ''
         self.blocks = []
         self.size = [0, 0, 0]
-        self.getBlocks()
+        self.originalCells = dict() # Cells changed by setBlock, with what was there before
+        self.cellsHash = 0
+        parseStart = time.perf_counter()
+        # Blocks from another interpreter of the same program save reading the file again
+        if blocks is None:
+            self.getBlocks()
+        else:
+            self.copyBlocks(blocks)
+        self.parseTime = time.perf_counter() - parseStart
+        self.runTime = 0.0
         
         self.pos = [0, 0, 0]
         self.offset = [0, 0, 0]
@@ -77,11 +132,34 @@ class CraftyFunge():
         
         self.stack = collections.deque(stack)
         self.vars = dict()
+        self.varsHash = 0
         
         self.inputBuffer = collections.deque()
+        self.inputLines = None # Lines read since the oldest snapshot, only kept while there are snapshots
+        self.inputStart = 0 # Which line inputLines starts at
+        self.inputLine = 0
+        self.inputBytes = 0
+        self.outputLen = 0
         
         self.running = True
         self.isr = ModeIsrDefault(self)
+        
+        # Hooks called while running, by name
+        self.hooks = {name: [] for name in HOOK_NAMES}
+        self.hooksChanged = True
+        self.instrumented = False
+        self.metered = False
+        
+        if self.debug:
+            self.addPlugin(DebugTracer(self, debugOut))
+        
+        self.loopDetector = LoopDetector(self) if detectLoops else None
+        if self.loopDetector is not None:
+            self.addPlugin(self.loopDetector)
+        
+        self.metrics = MetricsTracer(self) if collectMetrics else None
+        if self.metrics is not None:
+            self.addPlugin(self.metrics)
     
     
     # Get the file path to the program
@@ -101,11 +179,9 @@ class CraftyFunge():
         return os.path.join(startPath, programName+'.nbt')
     
     
-    # Print an error to the 
+    # Stop the program with an error at the current position
     def raiseError(self, msg):
-        print(f'Error at position {tuple(self.pos)}:', file=sys.stderr)
-        print(msg, file=sys.stderr)
-        sys.exit(1)
+        raise CraftyFungeError(self.pos, msg)
     
     
     # Uses the offset to convert world pos to internal pos, for use in lists
@@ -134,6 +210,12 @@ class CraftyFunge():
             
             self.blocks[x][y][z] = copy.deepcopy(structure['palette'][block['state']])
             self.blocks[x][y][z]['Name'] = self.blocks[x][y][z]['Name'][10:] # Chops off "minecraft:"
+    
+    
+    # Uses already read blocks. setBlock replaces block dicts rather than changing them, so only the lists are copied
+    def copyBlocks(self, blocks):
+        self.size = [len(blocks), len(blocks[0]), len(blocks[0][0])]
+        self.blocks = [[list(column) for column in plane] for plane in blocks]
         
     
     # Gets the type of block at a location
@@ -142,10 +224,37 @@ class CraftyFunge():
         return self.blocks[x][y][z]['Name']
 
     
+    # Sets a block at a location, calling hooks. Shadows setBlock while anything is listening
+    def setBlockHooked(self, x, y, z, block):
+        CraftyFunge.setBlock(self, x, y, z, block)
+        for hook in self.hooks['onSetBlock']:
+            hook((x, y, z), block)
+    
+    
     # Sets a block at a location
     def setBlock(self, x, y, z, block):
         x, y, z = self.getInternalPos(x, y, z)
+        pos = (x, y, z)
+        if pos not in self.originalCells:
+            self.originalCells[pos] = self.blocks[x][y][z]
+        else:
+            self.cellsHash ^= cellHash(pos, self.blocks[x][y][z])
+        
         self.blocks[x][y][z] = block
+        self.cellsHash ^= cellHash(pos, block)
+    
+    
+    # Puts back the block at an internal pos from before a setBlock. changed is whether it had already been set before that
+    def undoSetBlock(self, pos, block, changed):
+        x, y, z = pos
+        if pos in self.originalCells:
+            self.cellsHash ^= cellHash(pos, self.blocks[x][y][z])
+        
+        if changed:
+            self.blocks[x][y][z] = block
+            self.cellsHash ^= cellHash(pos, block)
+        elif pos in self.originalCells:
+            self.blocks[x][y][z] = self.originalCells.pop(pos)
     
     
     # Gets the direction the block is facing
@@ -181,11 +290,43 @@ class CraftyFunge():
             self.pos[xyz] += delta[xyz]
     
     
+    # Reads the next line of input, replaying kept lines after a restore
+    def inputReadLine(self):
+        lines = self.inputLines
+        if lines is not None and self.inputLine - self.inputStart < len(lines):
+            lineIn = lines[self.inputLine - self.inputStart]
+        else:
+            lineIn = self.input.readline()
+            if not lineIn:
+                return lineIn
+            
+            self.inputBytes += len(lineIn.encode())
+            if lines is not None:
+                lines.append(lineIn)
+        
+        self.inputLine += 1
+        return lineIn
+    
+    
+    # Keeps input lines from line on, so states from there can be gone back to. None stops keeping them
+    def keepInput(self, line):
+        if line is None:
+            self.inputLines = None
+        # Lines already read are gone, so only those read from now on can be kept
+        elif self.inputLines is None:
+            self.inputLines = []
+            self.inputStart = self.inputLine
+        else:
+            drop = min(max(line - self.inputStart, 0), len(self.inputLines))
+            del self.inputLines[:drop]
+            self.inputStart += drop
+    
+    
     # Reads a character or buffers it
     def inputChar(self):
         # Reads one line into the buffer
         if not self.inputBuffer:
-            lineIn = self.input.readline()
+            lineIn = self.inputReadLine()
             self.inputBuffer = collections.deque(lineIn)
         
         # If there's something in the buffer, we haven't reached EOF
@@ -193,84 +334,291 @@ class CraftyFunge():
             return self.inputBuffer.popleft()
     
     
+    # Outputs a character or several characters, calling hooks. Shadows outputStr while anything is listening
+    def outputStrHooked(self, s):
+        CraftyFunge.outputStr(self, s)
+        for hook in self.hooks['onOutput']:
+            hook(s)
+    
+    
     # Outputs a character or several characters
     def outputStr(self, s):
-        if self.debug:
-            self.debugBuffer.append(f'  Out: {s}')
-            self.outputBuffer.append(s)
+        self.outputLen += len(s)
+        print(s, end='', file=self.output, flush=True)
+    
+    
+    # Registers a function to call on a hook from HOOK_NAMES
+    def addHook(self, name, hook):
+        if name not in self.hooks:
+            raise ValueError(f'Unknown hook "{name}". Must be one of {", ".join(HOOK_NAMES)}.')
+        self.hooks[name].append(hook)
+        self.hooksChanged = True
+    
+    
+    def removeHook(self, name, hook):
+        self.hooks[name].remove(hook)
+        self.hooksChanged = True
+    
+    
+    # Registers every method of a plugin named after a hook
+    def addPlugin(self, plugin):
+        for name in HOOK_NAMES:
+            hook = getattr(plugin, name, None)
+            if hook is not None:
+                self.addHook(name, hook)
+    
+    
+    def hasHooks(self):
+        return any(self.hooks.values())
+    
+    
+    # Sets up for the hooks registered, so nothing is checked for that isn't being listened to
+    def prepareHooks(self):
+        hooks = self.hooks
+        
+        # Shadow methods with hooked versions while needed
+        for name, method, hooked in (('onOutput', 'outputStr', self.outputStrHooked),
+                                     ('onSetBlock', 'setBlock', self.setBlockHooked)):
+            if hooks[name]:
+                setattr(self, method, hooked)
+            else:
+                self.__dict__.pop(method, None)
+        
+        # Swap in a stack that calls hooks, or that keeps a hash for the loop detector too.
+        # The ISR holds a reference to the stack, so update it too
+        if self.loopDetector is not None:
+            stackType = HashedStack
+        elif hooks['onPush'] or hooks['onPop']:
+            stackType = HookedStack
         else:
-            print(s, end='', file=self.output, flush=True)
+            stackType = collections.deque
+        
+        if type(self.stack) is not stackType:
+            if stackType is collections.deque:
+                self.stack = collections.deque(self.stack)
+            else:
+                self.stack = stackType(self.stack, hooks['onPush'], hooks['onPop'])
+        self.isr.stack = self.stack
+        
+        self.instrumented = any(hooks[name] for name in STEP_HOOK_NAMES)
+        # Metrics can count steps in a loop of their own if nothing else is watching them
+        self.metered = self.instrumented and self.metrics is not None and all(getattr(hook, '__self__', None) is self.metrics
+                                                                                  for name in STEP_HOOK_NAMES for hook in hooks[name])
+        self.hooksChanged = False
     
     
     # Executes program
     def run(self):
+        self.prepareHooks()
+        
+        # Hooks have to see every step, so loops can only be skipped through without them
+        runStart = time.perf_counter()
+        try:
+            if self.metered:
+                self.metrics.run()
+            elif self.instrumented:
+                self.runInstrumented()
+            elif self.accelerate and not self.hasHooks():
+                from accelerate import LoopAccelerator
+                LoopAccelerator(self).run()
+            elif self.optimize and not self.hasHooks():
+                from peephole import RunOptimizer
+                RunOptimizer(self).run()
+            else:
+                self.runPlain()
+        finally:
+            self.runTime += time.perf_counter() - runStart
+        
+        for hook in self.hooks['onEnd']:
+            hook()
+    
+    
+    # Run loop with no hooks to check for
+    def runPlain(self):
         while self.running:
             self.block = self.getBlock(*self.pos)
-            
-            if self.debug:
-                initPos = self.pos.copy()
-                initBlock = self.block
-                self.steps += 1
+            self.steps += 1
             
             self.runStep()
-
-            if self.debug:
-                stackAsText = ''.join([chr(n) for n in self.stack if (n >= 32 and n < 127)])
-                self.debugBuffer.append(f' Step: {self.steps}')
-                self.debugBuffer.append(f'  Pos: {initPos}')
-                self.debugBuffer.append(f'Block: {initBlock}')
-                self.debugBuffer.append(f'Stack: {list(self.stack)} {repr(stackAsText)}')
-                self.debugBuffer.append(f' Vars: {self.vars}')
-                
-                # See if we have any output
-                if len(self.debugBuffer) > 5:
-                    out = self.debugBuffer.pop(0)
-                    self.debugBuffer.append(out)
-                
-                print('\n'.join(self.debugBuffer), file=self.debugOut)
-                self.debugBuffer = []
-                
-                print(file=self.debugOut)
             
             # We don't move if we immediately did a goto command
             if not self.wentTo:
                 self.move()
             
             self.wentTo = False
-
-        if self.debug:
-            print(f'Program terminated in {self.steps} steps.', file=self.debugOut)
-            print('Final Output:', file=self.debugOut)
-            finalOut = ''.join(self.outputBuffer)
-            print(finalOut, file=self.output)
-            if self.debugOut != self.output: print(finalOut, file=self.debugOut)
+    
+    
+    # Run loop calling step hooks
+    def runInstrumented(self):
+        while self.running:
+            self.stepInstrumented()
+    
+    
+    def stepInstrumented(self):
+        hooks = self.hooks
+        self.block = self.getBlock(*self.pos)
+        for hook in hooks['onStep']:
+            hook(self.block)
+        
+        mode = self.mode
+        self.steps += 1
+        self.runStep()
+        
+        if self.mode != mode:
+            for hook in hooks['onModeChange']:
+                hook(mode, self.mode)
+        for hook in hooks['onStepEnd']:
+            hook(self.block)
+        
+        # We don't move if we immediately did a goto command
+        if not self.wentTo:
+            self.move()
+        self.wentTo = False
+    
+    
+    # Executes a single step, for running under external control
+    def step(self):
+        if self.hooksChanged:
+            self.prepareHooks()
+        if self.instrumented:
+            self.stepInstrumented()
+            return
+        
+        self.block = self.getBlock(*self.pos)
+        self.steps += 1
+        
+        self.runStep()
+        
+        if not self.wentTo:
+            self.move()
+        self.wentTo = False
     
     
     # Run one instruction at the current block
     def runStep(self):
         self.isr.runStep(self.block)
+    
+    
+    # Gets everything needed to resume execution later as a dict. Without cells, the world is left out
+    def getState(self, cells=True):
+        state = {
+            'pos'           : list(self.pos),
+            'dir'           : DIRS.index(self.dir),
+            'mode'          : int(self.mode),
+            'sign'          : getattr(self.isr, 'sign', +1),
+            'running'       : int(self.running),
+            'wentTo'        : int(self.wentTo),
+            'steps'         : self.steps,
+            'stack'         : list(self.stack),
+            'vars'          : dict(self.vars),
+            'inputLine'     : self.inputLine,
+            'inputBuffer'   : list(self.inputBuffer),
+            'outputLen'     : self.outputLen,
+        }
+        if cells:
+            state['cells'] = {pos: copy.deepcopy(self.blocks[pos[0]][pos[1]][pos[2]]) for pos in self.originalCells}
+        
+        return state
+    
+    
+    # Resumes from a state dict made by getState
+    def setState(self, state):
+        # Going back needs the input read since then
+        line = state['inputLine']
+        kept = self.inputLines
+        if line < self.inputLine and (kept is None or line < self.inputStart):
+            raise ValueError(f'Input from line {line} wasn\'t kept, so the state can\'t be gone back to. Take a snapshot first.')
+        
+        self.pos = list(state['pos'])
+        self.dir = DIRS[state['dir']]
+        self.mode = Modes(state['mode'])
+        self.isr = MODE_ISRS[self.mode](self)
+        if hasattr(self.isr, 'sign'):
+            self.isr.sign = state['sign']
+        self.running = bool(state['running'])
+        self.wentTo = bool(state['wentTo'])
+        self.steps = state['steps']
+        
+        # The ISR holds a reference to the stack, so change it in place
+        self.stack.clear()
+        self.stack.extend(state['stack'])
+        self.vars = dict(state['vars'])
+        self.varsHash = 0
+        for item in self.vars.items():
+            self.varsHash ^= hash(item)
+        
+        # Catch up on input lines a fresh interpreter hasn't read yet
+        read = self.inputLine if kept is None else self.inputStart + len(kept)
+        while read < line:
+            lineIn = self.input.readline()
+            if not lineIn:
+                break
+            self.inputBytes += len(lineIn.encode())
+            if kept is not None:
+                kept.append(lineIn)
+            read += 1
+        self.inputLine = line
+        self.inputBuffer = collections.deque(state['inputBuffer'])
+        self.outputLen = state['outputLen']
+        
+        # Undo our own changes to the world, then apply the saved ones
+        if 'cells' not in state:
+            return
+        for (x, y, z), block in self.originalCells.items():
+            self.blocks[x][y][z] = block
+        self.originalCells = dict()
+        self.cellsHash = 0
+        for (x, y, z), block in state['cells'].items():
+            self.originalCells[(x, y, z)] = self.blocks[x][y][z]
+            self.blocks[x][y][z] = copy.deepcopy(block)
+            self.cellsHash ^= cellHash((x, y, z), block)
+    
+    
+    # Serialises the current state into a compact binary blob. Input from then on is kept until released, so it can be restored here
+    def snapshot(self):
+        if self.inputLines is None:
+            self.keepInput(self.inputLine)
+        return snapshot.packState(self.getState())
+    
+    
+    # Resumes from a blob made by snapshot, on this or a fresh interpreter of the same program
+    def restore(self, blob):
+        self.setState(snapshot.unpackState(blob))
+    
+    
+    # Lets go of input kept for snapshots from before the blob oldest, or for all of them if it's None
+    def releaseSnapshots(self, oldest=None):
+        self.keepInput(None if oldest is None else snapshot.unpackState(oldest)['inputLine'])
 
 
 # Parse arguments from the command line
 def parseArgs():
     import argparse
 
-    parser = argparse.ArgumentParser(description='Run a CraftyFunge program.', prog='craftyfunge', usage='%(prog)s [-h] [--version] [-w] [-d] [-l [DEBUGFILE]] [-s STACK] [-i INFILE] [-o OUTFILE] FILE')
+    parser = argparse.ArgumentParser(description='Run a CraftyFunge program.', prog='craftyfunge', epilog='Run "%(prog)s serve -h" for serving many runs from one process.', usage='%(prog)s [-h] [--version] [-w] [-d] [-l [DEBUGFILE]] [-g] [-c] [-a] [-O] [-m [METRICSFILE]] [-s STACK] [-i INFILE] [-o OUTFILE] FILE')
     parser.add_argument('filename', nargs=argparse.REMAINDER, metavar='FILE', help='Which file to run. Must be an nbt file exported from a structure block. File extension not necessary.')
     parser.add_argument('--version', action='version', version='%(prog)s 1.0.0')
     parser.add_argument('-w', dest='useWorldPath', action='store_true', help='Run a file from the configured structure block export location.')
     parser.add_argument('-d', dest='debug', action='store_true', help='Run the program in debug mode, printing the position, block, and stack at each step.')
     parser.add_argument('-l', nargs='?', dest='debugOut', metavar='DEBUGFILE', default=None, const=True, help='Log the debug output separately. Defaults to "debugout.txt".')
+    parser.add_argument('-g', dest='debugger', action='store_true', help='Run the program in the interactive debugger, with breakpoints, watchpoints, and reverse stepping. The program gets no input unless -i is given.')
+    parser.add_argument('-c', dest='detectLoops', action='store_true', help='Stop with an error if the program gets stuck repeating the same state without doing any input or output.')
+    parser.add_argument('-a', dest='accelerate', action='store_true', help='Speed up hot loops that only do arithmetic on the stack. Output and step counts are unchanged.')
+    parser.add_argument('-O', dest='optimize', action='store_true', help='Run straight stretches of stack instructions all at once, after optimising them. Output and step counts are unchanged.')
+    parser.add_argument('-m', nargs='?', dest='metricsOut', metavar='METRICSFILE', default=None, const=True, help='Write counts of what the program did, like steps by block and stack depth, as JSON when it stops. Defaults to "metrics.json".')
     parser.add_argument('-s', '--stack', nargs=1, dest='stack', metavar='STACK', default=[], help='Pre-populate the stack. Input the stack as a comma-separated list of integers surrounded by square brackets with no spaces. Ex. [1,2,3,4,5]')
-    parser.add_argument('-i', nargs=1, dest='input', metavar='INFILE', type=argparse.FileType('r'), default=[sys.stdin], help='Take input from INFILE instead of stdin.')
+    parser.add_argument('-i', nargs=1, dest='input', metavar='INFILE', type=argparse.FileType('r'), default=[None], help='Take input from INFILE instead of stdin.')
     parser.add_argument('-o', nargs=1, dest='output', metavar='OUTFILE', type=argparse.FileType('w'), default=[sys.stdout], help='Send output to OUTFILE instead of stdout.')
 
     args = parser.parse_args()
     
-    # See if filename got eaten by -l
+    # See if filename got eaten by -l or -m
     if (not args.filename) and isinstance(args.debugOut, str):
         args.filename = [args.debugOut]
         args.debugOut = True
+    elif (not args.filename) and isinstance(args.metricsOut, str):
+        args.filename = [args.metricsOut]
+        args.metricsOut = True
     # See if user actually didn't specify file
     elif not args.filename:
         parser.error('the following arguments are required: FILE')
@@ -278,6 +626,9 @@ def parseArgs():
     # Get lists into single arguments
     args.filename = args.filename[0]
     args.input = args.input[0]
+    # The debugger reads its commands from stdin, so the program can't share it
+    if args.input is None:
+        args.input = io.StringIO() if args.debugger else sys.stdin
     args.output = args.output[0]
     if args.stack: args.stack = args.stack[0]
     
@@ -296,6 +647,9 @@ def parseArgs():
         else:
             args.debugOut = args.output
     
+    if args.metricsOut == True:
+        args.metricsOut = 'metrics.json'
+    
     return args
 
 
@@ -341,9 +695,32 @@ def validateProcessArgs(args, parser):
 
 
 if __name__ == '__main__':
+    # The service has options of its own
+    if sys.argv[1:2] == ['serve']:
+        from serve import main
+        main(sys.argv[2:])
+        sys.exit()
+    
     args = parseArgs()
     interp = CraftyFunge(args.filename, args.useWorldPath, 
                          args.input, args.output, 
                          args.debug, args.debugOut,
-                         args.stack)
-    interp.run()
\ No newline at end of file
+                         args.stack, args.detectLoops, args.accelerate,
+                         args.metricsOut is not None, args.optimize)
+    
+    try:
+        if args.debugger:
+            from debugger import Debugger
+            Debugger(interp).cmdloop()
+        else:
+            interp.run()
+    except CraftyFungeError as e:
+        print(f'Error at position {e.pos}:', file=sys.stderr)
+        print(e.msg, file=sys.stderr)
+        if interp.metrics is not None:
+            interp.metrics.error = e.msg
+        sys.exit(1)
+    finally:
+        if interp.metrics is not None:
+            with open(args.metricsOut, 'w') as f:
+                interp.metrics.write(f)
\ No newline at end of file
@@ -0,0 +1,421 @@
+# Interactive debugger for the CraftyFunge interpreter, with reverse stepping
+# Copyright 2022 Eli Fox
+
+import cmd, collections, random
+
+from common import *
+from instructions import MODE_ISRS
+from loopdetect import HashedStack
+
+SNAPSHOT_INTERVAL = 1000
+UNDO_LOG_SIZE = 256
+
+
+# Stands in for the program output, so text isn't printed twice when replaying after going back
+class OutputTracker():
+    def __init__(self, interp, out):
+        self.interp = interp
+        self.out = out
+        self.shownLen = 0
+
+    def write(self, s):
+        # outputStr has already counted s, so this is where it starts
+        start = self.interp.outputLen - len(s)
+        if start + len(s) <= self.shownLen:
+            return
+
+        s = s[max(self.shownLen-start, 0):]
+        self.shownLen += len(s)
+        self.out.write(s)
+
+    def flush(self):
+        self.out.flush()
+
+
+class Debugger(cmd.Cmd):
+    intro = 'CraftyFunge debugger. Type help or ? to list commands.'
+    prompt = '(cfdb) '
+
+    def __init__(self, interp, snapshotInterval=SNAPSHOT_INTERVAL, undoLogSize=UNDO_LOG_SIZE, stdout=None):
+        super().__init__(stdout=stdout)
+        self.interp = interp
+        self.interp.output = OutputTracker(interp, interp.output)
+        self.snapshotInterval = snapshotInterval
+        self.error = None
+
+        # Breakpoints and watchpoints
+        self.breakPositions = set()
+        self.breakBlocks = set()
+        self.watchVars = dict()
+        self.watchDepth = None
+
+        # Full snapshots every snapshotInterval steps, and a log of what each step since changed
+        self.snapshots = []
+        self.undoLog = collections.deque(maxlen=undoLogSize)
+        self.change = None # The entry of the step running
+        # Rewinding can go back to the first snapshot, so input is kept from there
+        interp.keepInput(interp.inputLine)
+        self.takeSnapshot()
+
+        # Stack changes are recorded as they happen
+        interp.addHook('onPush', self.onPush)
+        interp.addHook('onPop', self.onPop)
+
+
+    def print(self, *args):
+        print(*args, file=self.stdout)
+
+
+    # State plus the random generator, so replays make the same random choices
+    def takeSnapshot(self):
+        self.snapshots.append((self.interp.steps, self.interp.getState(), random.getstate()))
+
+
+    def restoreEntry(self, state, randomState):
+        self.interp.setState(state)
+        random.setstate(randomState)
+        self.error = None
+
+        # Going back would otherwise look like the program repeating itself
+        if self.interp.loopDetector is not None:
+            self.interp.loopDetector.clear()
+
+
+    def onPush(self, n):
+        self.change['pushed'] += 1
+
+
+    def onPop(self, n):
+        self.change['popped'].append(n)
+
+
+    # Gets the value n down from the top of the stack as it would be popped
+    def peek(self, n):
+        stack = self.interp.stack
+        return stack[-n-1] if n < len(stack) else 0
+
+
+    # Gets the block the IP is about to execute, or None if it is out of bounds
+    def nextBlock(self):
+        try:
+            return self.interp.getBlock(*self.interp.pos)
+        except CraftyFungeError:
+            return None
+
+
+    # Records what the next step will change besides the stack values it pushes and pops
+    def recordChange(self):
+        interp = self.interp
+        change = {
+            'pos'       : list(interp.pos),
+            'dir'       : interp.dir,
+            'mode'      : interp.mode,
+            'sign'      : getattr(interp.isr, 'sign', +1),
+            'running'   : interp.running,
+            'wentTo'    : interp.wentTo,
+            'steps'     : interp.steps,
+            'outputLen' : interp.outputLen,
+            'popped'    : [],
+            'pushed'    : 0,
+        }
+        if interp.mode != Modes.DEFAULT:
+            return change
+
+        block = self.nextBlock()
+        # These move values around the stack without pushing or popping them
+        if block in (CLEAR, ROTATE):
+            change['stack'] = list(interp.stack)
+        elif block == SET_VAR:
+            index = self.peek(0)
+            change['var'] = (index, interp.vars.get(index))
+        elif block == SET_BLOCK:
+            try:
+                pos = tuple(interp.getInternalPos(self.peek(2), self.peek(1), self.peek(0)))
+            except CraftyFungeError:
+                pass # The step fails without setting anything
+            else:
+                change['cell'] = (pos, interp.blocks[pos[0]][pos[1]][pos[2]], pos in interp.originalCells)
+        elif block == RANDOM_DIR:
+            change['random'] = random.getstate()
+        elif block in (IN_NUM, IN_ASCII):
+            change['input'] = (interp.inputLine, list(interp.inputBuffer))
+
+        return change
+
+
+    # Puts back everything a step changed
+    def undoChange(self, change):
+        interp = self.interp
+
+        interp.pos = change['pos']
+        interp.dir = change['dir']
+        if interp.mode != change['mode']:
+            interp.mode = change['mode']
+            interp.isr = MODE_ISRS[interp.mode](interp)
+        if hasattr(interp.isr, 'sign'):
+            interp.isr.sign = change['sign']
+        interp.running = change['running']
+        interp.wentTo = change['wentTo']
+        interp.steps = change['steps']
+        interp.outputLen = change['outputLen']
+
+        # Going through deque skips the hooks, which would record this as another change
+        stack = interp.stack
+        if 'stack' in change:
+            stack.clear()
+            stack.extend(change['stack'])
+        else:
+            for _ in range(change['pushed']):
+                collections.deque.pop(stack)
+            for n in reversed(change['popped']):
+                collections.deque.append(stack, n)
+            # Nor do they keep the loop detector's hash
+            if isinstance(stack, HashedStack):
+                stack.rehash()
+
+        if 'var' in change:
+            index, val = change['var']
+            if index in interp.vars:
+                interp.varsHash ^= hash((index, interp.vars.pop(index)))
+            if val is not None:
+                interp.vars[index] = val
+                interp.varsHash ^= hash((index, val))
+        if 'cell' in change:
+            interp.undoSetBlock(*change['cell'])
+        if 'random' in change:
+            random.setstate(change['random'])
+        if 'input' in change:
+            interp.inputLine = change['input'][0]
+            interp.inputBuffer = collections.deque(change['input'][1])
+
+        self.error = None
+        if interp.loopDetector is not None:
+            interp.loopDetector.clear()
+
+
+    # Runs one step, recording what it changes so it can be undone
+    def stepOnce(self):
+        interp = self.interp
+
+        self.change = self.recordChange()
+        self.undoLog.append(self.change)
+
+        try:
+            interp.step()
+        except CraftyFungeError as e:
+            self.error = e
+            self.print(f'Error at position {e.pos}:')
+            self.print(e.msg)
+            return
+
+        if interp.steps % self.snapshotInterval == 0 and interp.steps > self.snapshots[-1][0]:
+            self.takeSnapshot()
+
+
+    def canStep(self):
+        if self.error is not None:
+            self.print('The program stopped with an error. Use rstep to go back.')
+            return False
+        if not self.interp.running:
+            self.print(f'The program has terminated after {self.interp.steps} steps.')
+            return False
+        return True
+
+
+    # Checks breakpoints before a step and watchpoints after. Returns a reason to stop, or None
+    def checkBreak(self):
+        interp = self.interp
+
+        if tuple(interp.pos) in self.breakPositions:
+            return f'Breakpoint at {tuple(interp.pos)}'
+        if self.breakBlocks and self.nextBlock() in self.breakBlocks:
+            return f'Breakpoint on {self.nextBlock()}'
+
+        for index, val in self.watchVars.items():
+            newVal = interp.vars.get(index, 0)
+            if newVal != val:
+                self.watchVars[index] = newVal
+                return f'Var {index} changed from {val} to {newVal}'
+
+        if self.watchDepth is not None and len(interp.stack) >= self.watchDepth:
+            return f'Stack depth reached {len(interp.stack)}'
+
+        return None
+
+
+    def hasBreaks(self):
+        return bool(self.breakPositions or self.breakBlocks or self.watchVars) or self.watchDepth is not None
+
+
+    # Goes back to just before the step numbered target
+    def rewindTo(self, target):
+        interp = self.interp
+
+        # Recent steps are in the undo log
+        while self.undoLog and interp.steps > target:
+            self.undoChange(self.undoLog.pop())
+        if interp.steps <= target:
+            return
+
+        # Otherwise, go to the last snapshot before and replay forwards
+        while len(self.snapshots) > 1 and self.snapshots[-1][0] > target:
+            self.snapshots.pop()
+        _, state, randomState = self.snapshots[-1]
+        self.restoreEntry(state, randomState)
+        while interp.steps < target:
+            self.stepOnce()
+
+
+    def showPos(self):
+        interp = self.interp
+        block = self.nextBlock()
+        self.print(f'Step {interp.steps}  Pos: {tuple(interp.pos)}  Dir: {interp.dir}  Mode: {MODE_NAMES[interp.mode]}  Next: {block}')
+
+
+    def showState(self):
+        self.showPos()
+        self.print(f'Stack: {list(self.interp.stack)}')
+        self.print(f' Vars: {self.interp.vars}')
+
+
+    # Parses a position or a block name
+    def parseTarget(self, arg):
+        parts = arg.replace(',', ' ').split()
+        if len(parts) == 3:
+            try:
+                return tuple(int(n) for n in parts)
+            except ValueError:
+                pass
+        elif len(parts) == 1:
+            return parts[0]
+
+        self.print('Expected a position "X Y Z" or a block name.')
+        return None
+
+
+    def parseCount(self, arg):
+        try:
+            return int(arg) if arg.strip() else 1
+        except ValueError:
+            self.print(f'Invalid count "{arg}".')
+            return 0
+
+
+    # Commands
+    def do_step(self, arg):
+        '''step [N]: Run N steps (default 1).'''
+        for _ in range(self.parseCount(arg)):
+            if not self.canStep():
+                break
+            self.stepOnce()
+        self.showState()
+
+
+    def do_continue(self, arg):
+        '''continue: Run until a breakpoint or watchpoint is hit or the program ends.'''
+        if not self.canStep():
+            return
+
+        # Without any breakpoints there is nothing to check
+        if not self.hasBreaks():
+            while self.interp.running and self.error is None:
+                self.stepOnce()
+        else:
+            # Always leave the current position, even if it's a breakpoint
+            self.stepOnce()
+            reason = None
+            while self.interp.running and self.error is None:
+                reason = self.checkBreak()
+                if reason is not None:
+                    break
+                self.stepOnce()
+
+            if reason is not None:
+                self.print(reason)
+
+        self.showState()
+
+
+    def do_rstep(self, arg):
+        '''rstep [N]: Go back N steps (default 1).'''
+        target = max(self.interp.steps - self.parseCount(arg), 0)
+        self.rewindTo(target)
+        self.showState()
+
+
+    def do_break(self, arg):
+        '''break X Y Z | break BLOCK: Stop before executing at a position or a block type. With no arguments, list breakpoints.'''
+        if not arg.strip():
+            for pos in sorted(self.breakPositions):
+                self.print(f'  {pos}')
+            for block in sorted(self.breakBlocks):
+                self.print(f'  {block}')
+            return
+
+        target = self.parseTarget(arg)
+        if isinstance(target, tuple):
+            self.breakPositions.add(target)
+        elif target is not None:
+            self.breakBlocks.add(target)
+
+
+    def do_delete(self, arg):
+        '''delete X Y Z | delete BLOCK: Remove a breakpoint. With no arguments, remove all breakpoints.'''
+        if not arg.strip():
+            self.breakPositions.clear()
+            self.breakBlocks.clear()
+            return
+
+        target = self.parseTarget(arg)
+        self.breakPositions.discard(target)
+        self.breakBlocks.discard(target)
+
+
+    def do_watch(self, arg):
+        '''watch var I | watch depth N: Stop when var I changes, or when the stack has at least N values.'''
+        parts = arg.split()
+        try:
+            if len(parts) == 2 and parts[0] == 'var':
+                index = int(parts[1])
+                self.watchVars[index] = self.interp.vars.get(index, 0)
+                return
+            elif len(parts) == 2 and parts[0] == 'depth':
+                self.watchDepth = int(parts[1])
+                return
+        except ValueError:
+            pass
+
+        self.print('Usage: watch var I | watch depth N')
+
+
+    def do_unwatch(self, arg):
+        '''unwatch: Remove all watchpoints.'''
+        self.watchVars.clear()
+        self.watchDepth = None
+
+
+    def do_print(self, arg):
+        '''print: Show the position, stack, and vars.'''
+        self.showState()
+
+
+    def do_quit(self, arg):
+        '''quit: Exit the debugger.'''
+        return True
+
+    do_EOF = do_quit
+
+
+    # Short aliases
+    do_s = do_step
+    do_c = do_continue
+    do_rs = do_rstep
+    do_b = do_break
+    do_w = do_watch
+    do_p = do_print
+    do_q = do_quit
+
+
+    # Repeating the last command on an empty line is too easy to do by accident when stepping backwards
+    def emptyline(self):
+        pass
\ No newline at end of file
@@ -0,0 +1,296 @@
+# Works out where a program can go without running it
+# Copyright 2022 Eli Fox
+#
+# Nodes are (cell, direction, mode), where the cell is a position in the structure. Starting
+# from the command block, every way the IP could leave each node is followed, with the stack
+# only tracked as a range of depths. Branches go both ways and random directions go every way,
+# so the graph covers every run. It's only complete if nothing can goto or set a block, since
+# those depend on values on the stack.
+
+import json, math, sys
+
+from common import *
+
+# Depth ranges that keep growing around a loop are given up on after this many updates
+WIDEN_AFTER = 8
+
+# Stack effects in default mode, as (pops, fewest pushes, most pushes). Missing blocks do nothing
+STACK_EFFECTS = {
+    ADD: (2, 1, 1), SUB: (2, 1, 1), MULT: (2, 1, 1), DIV: (2, 1, 1), MOD: (2, 1, 1), EXP: (2, 1, 1),
+    NEG: (1, 1, 1), NOT: (1, 1, 1),
+    GREATER: (2, 1, 1), LESS: (2, 1, 1),
+    SKIP_COND: (1, 0, 0), IF: (1, 0, 0),
+    IN_NUM_LITERAL: (0, 1, 1),
+    DUP: (1, 2, 2), POP: (1, 0, 0), SWAP: (2, 2, 2),
+    PUSH_LEN: (0, 1, 1),
+    OUT_NUM: (1, 0, 0), OUT_ASCII: (1, 0, 0),
+    IN_NUM: (0, 1, 1), IN_ASCII: (0, 1, 1),
+    GET_BLOCK: (3, 0, 1), SET_BLOCK: (4, 0, 0),
+    GET_VAR: (1, 1, 1), SET_VAR: (2, 0, 0),
+    PUSH_POS: (0, 3, 3), GOTO: (3, 0, 0),
+}
+
+# Blocks that make the graph incomplete or nondeterministic when they can be run
+DYNAMIC_BLOCKS = {GOTO: 'goto', SET_BLOCK: 'setBlock', RANDOM_DIR: 'random direction'}
+
+ENDS = {STOP: 'stop', RAISE_ERROR: 'error', GOTO: 'goto'}
+
+
+# Depth range after popping, then pushing. Pushing zero onto an empty stack does nothing,
+# so pushes only count for certain if the stack can't be empty or the value can't be zero
+def applyEffect(depth, pops, minPushes, maxPushes, nonzero=False):
+    low = max(depth[0] - pops, 0)
+    high = max(depth[1] - pops, 0)
+    if low > 0:
+        low += minPushes
+    elif nonzero:
+        low = minPushes
+    return (low, high + maxPushes)
+
+
+class FlowGraph():
+    def __init__(self, interp):
+        self.blocks = interp.blocks
+        self.size = interp.size
+        self.offset = list(interp.offset)
+
+        self.depths = dict()        # Range of stack depths before running each node
+        self.edges = dict()         # Nodes each node can go to next
+        self.ends = dict()          # Nodes the program stops or jumps away at, and how
+        self.leaves = []            # Nodes with a way out of the structure, and the cell outside
+        self.start = (tuple(interp.offset), interp.dir, Modes.DEFAULT)
+
+        self.build(len(interp.stack))
+
+
+    def inBounds(self, cell):
+        return all(0 <= cell[xyz] < self.size[xyz] for xyz in range(3))
+
+
+    def getBlock(self, cell):
+        x, y, z = cell
+        return self.blocks[x][y][z]['Name']
+
+
+    def getFacing(self, cell):
+        x, y, z = cell
+        return self.blocks[x][y][z].get('Properties', {}).get('facing')
+
+
+    # Value pushed for the block in a cell, or None if it doesn't have one
+    def getValue(self, cell):
+        block = self.getBlock(cell)
+        if block in BLOCKS_WITH_EXTRA_DATA:
+            block = (block, (('facing', self.getFacing(cell)), ))
+        return BLOCK_TO_VALUE.get(block)
+
+
+    # Position relative to the start, like the interpreter uses
+    def getPos(self, cell):
+        return [cell[xyz] - self.offset[xyz] for xyz in range(3)]
+
+
+    @staticmethod
+    def ahead(cell, dir, n=1):
+        delta = DIRS_DEL[dir]
+        return tuple(cell[xyz] + n*delta[xyz] for xyz in range(3))
+
+
+    # Gets where a node can go as (cell, dir, mode), and its stack depth after
+    def successors(self, node, depth):
+        cell, dir, mode = node
+        block = self.getBlock(cell)
+
+        if mode == Modes.TUNNEL:
+            nextMode = Modes.DEFAULT if block == TUNNEL else mode
+            return [(self.ahead(cell, dir), dir, nextMode)], depth
+
+        if mode == Modes.IN_NUM_LITERAL:
+            if block == IN_NUM_LITERAL:
+                return [(self.ahead(cell, dir), dir, Modes.DEFAULT)], depth
+            if block == DIR:
+                dir = self.getFacing(cell)
+            elif block in BLOCK_TO_PUSHNUM or block == NEG:
+                depth = applyEffect(depth, 1, 1, 1)
+            return [(self.ahead(cell, dir), dir, mode)], depth
+
+        if mode == Modes.IN_STR_LITERAL:
+            if block == IN_STR_LITERAL:
+                return [(self.ahead(cell, dir), dir, Modes.DEFAULT)], depth
+            value = self.getValue(cell)
+            if value is not None:
+                depth = applyEffect(depth, 0, 1, 1, value != 0)
+            return [(self.ahead(cell, dir), dir, mode)], depth
+
+        # Default mode
+        if block in ENDS:
+            return [], depth
+
+        if block in STACK_EFFECTS:
+            depth = applyEffect(depth, *STACK_EFFECTS[block])
+        elif block in BLOCK_TO_PUSHNUM:
+            depth = applyEffect(depth, 0, 1, 1, BLOCK_TO_PUSHNUM[block] != 0)
+        elif block == CLEAR:
+            depth = (0, 0)
+        elif block == ROTATE:
+            # Rotating can pad the stack with any number of zeros, or strip them off
+            depth = (0, math.inf)
+
+        if block == DIR:
+            dir = self.getFacing(cell)
+        elif block == IF:
+            facing = self.getFacing(cell)
+            opposite = DIRS_INV[DIRS.index(facing)]
+            return [(self.ahead(cell, facing), facing, mode), (self.ahead(cell, opposite), opposite, mode)], depth
+        elif block == RANDOM_DIR:
+            return [(self.ahead(cell, newDir), newDir, mode) for newDir in DIRS], depth
+        elif block == SKIP:
+            return [(self.ahead(cell, dir, 2), dir, mode)], depth
+        elif block == SKIP_COND:
+            return [(self.ahead(cell, dir), dir, mode), (self.ahead(cell, dir, 2), dir, mode)], depth
+        elif block == PUSH_NEXT_BLOCK:
+            value = self.getValue(self.ahead(cell, dir)) if self.inBounds(self.ahead(cell, dir)) else None
+            if value is not None:
+                depth = applyEffect(depth, 0, 1, 1, value != 0)
+            return [(self.ahead(cell, dir, 2), dir, mode)], depth
+        elif block == TUNNEL:
+            mode = Modes.TUNNEL
+        elif block == IN_NUM_LITERAL:
+            mode = Modes.IN_NUM_LITERAL
+        elif block == IN_STR_LITERAL:
+            mode = Modes.IN_STR_LITERAL
+
+        return [(self.ahead(cell, dir), dir, mode)], depth
+
+
+    # Follows every path from the start, widening depth ranges until nothing changes
+    def build(self, startDepth):
+        self.depths[self.start] = (startDepth, startDepth)
+        updates = dict()
+        work = [self.start]
+        while work:
+            node = work.pop()
+            cell, _, mode = node
+            block = self.getBlock(cell)
+            nexts, depth = self.successors(node, self.depths[node])
+
+            if mode == Modes.DEFAULT and block in ENDS:
+                self.ends[node] = ENDS[block]
+
+            # Reading the block after a jukebox needs it to be there too
+            if mode == Modes.DEFAULT and block == PUSH_NEXT_BLOCK and not self.inBounds(self.ahead(cell, node[1])):
+                self.leaves.append((node, self.ahead(cell, node[1])))
+                nexts = []
+
+            self.edges[node] = []
+            for nextNode in nexts:
+                if not self.inBounds(nextNode[0]):
+                    self.leaves.append((node, nextNode[0]))
+                    continue
+                self.edges[node].append(nextNode)
+
+                old = self.depths.get(nextNode)
+                new = depth if old is None else (min(old[0], depth[0]), max(old[1], depth[1]))
+                if new != old:
+                    updates[nextNode] = updates.get(nextNode, 0) + 1
+                    if old is not None and new[1] > old[1] and updates[nextNode] > WIDEN_AFTER:
+                        new = (new[0], math.inf)
+                    self.depths[nextNode] = new
+                    work.append(nextNode)
+
+        # The same way out can be found more than once while widening
+        self.leaves = sorted(set(self.leaves))
+
+
+    # Cells that can be run in default mode, by block
+    def instructionCells(self):
+        cells = dict()
+        for cell, _, mode in self.depths:
+            if mode == Modes.DEFAULT:
+                cells.setdefault(self.getBlock(cell), set()).add(cell)
+        return cells
+
+
+    # Which of the blocks in DYNAMIC_BLOCKS can be run, and where
+    def dynamicCells(self):
+        cells = self.instructionCells()
+        return {name: sorted(cells[block]) for block, name in DYNAMIC_BLOCKS.items() if block in cells}
+
+
+    def maxDepth(self):
+        return max(high for _, high in self.depths.values())
+
+
+    # Whether every way the program can go is in the graph
+    def isComplete(self):
+        dynamic = self.dynamicCells()
+        return 'goto' not in dynamic and 'setBlock' not in dynamic
+
+
+    # What a runtime needs to pick how to run the program, ready for JSON
+    def summary(self):
+        maxDepth = self.maxDepth()
+        return {
+            'nodes'          : len(self.depths),
+            'cells'          : len({cell for cell, _, _ in self.depths}),
+            'complete'       : self.isComplete(),
+            'dynamic'        : {name: [self.getPos(cell) for cell in cells] for name, cells in self.dynamicCells().items()},
+            'canStop'        : 'stop' in self.ends.values(),
+            'leaves'         : [{'pos': self.getPos(node[0]), 'dir': node[1], 'mode': node[2].name} for node, _ in self.leaves],
+            'maxStackDepth'  : None if maxDepth == math.inf else maxDepth,
+        }
+
+
+    def report(self, verbose=False, file=sys.stdout):
+        cells = self.instructionCells()
+        maxDepth = self.maxDepth()
+        print(f'{len(self.depths)} nodes reachable over {len({cell for cell, _, _ in self.depths})} blocks', file=file)
+        print(f'{sum(len(blockCells) for blockCells in cells.values())} blocks can be run in default mode:', file=file)
+        for block, blockCells in sorted(cells.items(), key=lambda item: (-len(item[1]), item[0])):
+            print(f'  {len(blockCells):>5} {block}', file=file)
+
+        for name, dynamicCells in self.dynamicCells().items():
+            print(f'Can {name} at {", ".join(str(self.getPos(cell)) for cell in dynamicCells)}', file=file)
+        if not self.isComplete():
+            print('Places the program can go after a goto or setBlock aren\'t known, so this may be incomplete', file=file)
+        if 'stop' not in self.ends.values():
+            print('The program can never stop normally', file=file)
+
+        for node, outside in self.leaves:
+            print(f'Leaves the structure at {self.getPos(node[0])} going {node[1]} in {node[2].name.lower()} mode, to {self.getPos(outside)}', file=file)
+
+        print(f'Stack depth is at most {maxDepth}', file=file)
+        if verbose:
+            print('Stack depth before each node:', file=file)
+            for node in sorted(self.depths, key=lambda node: (node[0], node[1], node[2])):
+                cell, dir, mode = node
+                low, high = self.depths[node]
+                print(f'  {self.getPos(cell)} {dir:>5} {mode.name:<14} {self.getBlock(cell):<30} {low}..{high}', file=file)
+
+
+def parseArgs():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Find where a CraftyFunge program can go without running it.')
+    parser.add_argument('filename', metavar='FILE', help='Which file to analyse. Must be an nbt file exported from a structure block.')
+    parser.add_argument('-w', dest='useWorldPath', action='store_true', help='Analyse a file from the configured structure block export location.')
+    parser.add_argument('-d', dest='depth', type=int, default=0, help='How deep the stack starts. Defaults to 0.')
+    parser.add_argument('-v', dest='verbose', action='store_true', help='Also list the range of stack depths before every node.')
+    parser.add_argument('-j', dest='jsonOut', metavar='JSONFILE', default=None, help='Write a summary to JSONFILE.')
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    import craftyfunge
+    from craftyfunge import CraftyFunge
+
+    args = parseArgs()
+    if args.useWorldPath:
+        craftyfunge.WORLD_PATH = readConfig()
+
+    graph = FlowGraph(CraftyFunge(args.filename, args.useWorldPath, stack=[1]*args.depth))
+    graph.report(args.verbose)
+    if args.jsonOut is not None:
+        with open(args.jsonOut, 'w') as f:
+            json.dump(graph.summary(), f, indent=4)
@@ -1,18 +1,21 @@
 # Generates Minecraft functions for the in-game interpreter
 # Copyright 2022 Eli Fox
 
-import math
+import hashlib, json, math
 import os, sys
 
 from common import *
 
-FUNCTION_PATH = 'datapacks/craftyfunge/data/craftyfunge/functions/'
-WORLD_PATH = readConfig()
-START_PATH = os.path.join(WORLD_PATH, FUNCTION_PATH)
+PACK_PATH = 'datapacks/craftyfunge/'
+START_PATH = 'data/craftyfunge/functions/'
+TAG_START_PATH = 'data/craftyfunge/tags/blocks/'
 
-# Make sure the path exists before trying to write to it
-if not os.path.exists(START_PATH):
-    raise OSError('Function folder does not exist. Change world.cfg to match the path to your world.')
+# Hashes of the files last written, so only the ones that change are written again
+MANIFEST_NAME = 'generated.json'
+
+# Files are built here by their path in the datapack, then written all at once
+GENERATED = dict()
+GENERATED_DIRS = set() # Folders only holding generated files
 
 
 BLOCKS_TO_FN_NAMES = [
@@ -49,6 +52,20 @@ BLOCKS_TO_FN_NAMES = [
     (PUSH_NEXT_BLOCK, 'push_next_block'), # This must be at the end, so nothing overrides it
 ]
 
+# Name, scoreboard operation, block
+BINARY_OPERATORS = [
+    ('add',     '+=',   ADD),
+    ('sub',     '-=',   SUB),
+    ('mult',    '*=',   MULT),
+    ('div',     '/=',   DIV),
+    ('mod',     '%=',   MOD),
+]
+
+COMPARISON_TYPES = [
+    ('lessthan',     '<',   LESS),
+    ('greaterthan',  '>',   GREATER),
+]
+
 # Selectors
 getSelector = lambda mob, tag: f'type=minecraft:{mob},tag={tag},limit=1'
 FUNGIE = getSelector('magma_cube', 'Fungie') # The IP
@@ -60,6 +77,22 @@ MARKER = getSelector('marker', 'BlockMarker')
 STACKS = 4
 TEMPS = 4
 
+# Where the stack is kept. 'storage' is an NBT list with the top at the end, and 'blocks' is the visual stack of iron block columns
+STACK_BACKENDS = ('storage', 'blocks')
+STACK_BACKEND = 'storage'
+STACK_DATA = 'storage craftyfunge:stack values'
+
+# Where variables are kept. 'scoreboard' gives each index a fake player in the vars objective, and 'blocks' is iron block columns under the VarSetter
+VARS_BACKENDS = ('scoreboard', 'blocks')
+VARS_BACKEND = 'scoreboard'
+
+# Steps run each tick in turbo mode by default, or 0 to step every $ip delay ticks. Changed in game with $ip turbo.
+# Keep this times the commands in a step under maxCommandChainLength
+TURBO_STEPS = 0
+
+# Count each opcode and step run in the profile objective, shown by craftyfunge:profile/report
+PROFILE = False
+
 # Hardcoded positions
 # Stack/Stacker
 STACKER_POS = (-39, 1, 10)
@@ -76,15 +109,63 @@ VARS_Z = VARS_POS[2]
 # Clock start
 CLOCK_START_POS = (-45, 0, 23)
 
+# Most items checked one by one at the bottom of a dispatch tree
+DISPATCH_LEAF_SIZE = 4
+
 
 def writeFile(filename, lines, mode='w'):
+    filename = filename.replace(os.sep, '/')
+    s = '\n'.join(lines)
+    
     # Appending needs an extra newline before
     if mode == 'a':
-        lines[0] = '\n' + lines[0]
+        s = GENERATED[filename] + '\n' + s
+    
+    GENERATED[filename] = s
+
+
+# Writes a block tag holding the given blocks and tags, used as #craftyfunge:{name}
+def writeTag(name, values):
+    filename = os.path.join(TAG_START_PATH, f'{name}.json').replace(os.sep, '/')
+    GENERATED[filename] = json.dumps({'replace': False, 'values': values}, indent=4)
+
+
+# Marks a folder as only holding generated files, so ones left over from an earlier split are removed
+def clearGenerated(path):
+    GENERATED_DIRS.add(path.replace(os.sep, '/').rstrip('/') + '/')
+
+
+# Every opcode run in the default mode, as the blocks it's run by (a block or a tag) and its function
+def getOpcodes():
+    opcodes = [('#craftyfunge:numbers', 'push_number')]
+    opcodes += [(f'minecraft:{block}', f'arithmetic/{name}') for name, _, block in BINARY_OPERATORS]
+    opcodes += [(f'minecraft:{block}', f'comparisons/{name}') for name, _, block in COMPARISON_TYPES]
+    opcodes += [(f'minecraft:{block}', functionName) for block, functionName in BLOCKS_TO_FN_NAMES]
+    return opcodes
+
+
+# The fake player counting an opcode when profiling, which is its block or tag's name
+def getProfileName(blocks):
+    return blocks.split(':')[1]
+
+
+# Splits sorted items into a balanced tree of nested functions under path, so a call runs O(log n) commands instead of O(n).
+# getBranch gives the name and condition of a branch holding some of the items, getLeafLines the commands for a leaf.
+# Returns the lines for the root, writing the rest of the nodes
+def dispatchTree(path, items, getBranch, getLeafLines):
+    if len(items) <= DISPATCH_LEAF_SIZE:
+        return getLeafLines(items)
+    
+    lines = []
+    mid = len(items) // 2
+    for half in (items[:mid], items[mid:]):
+        name, condition = getBranch(half)
+        lines.append(f'execute {condition} run function craftyfunge:{path}/{name}')
         
-    with open(filename, mode) as f:
-        s = '\n'.join(lines)
-        f.write(s)
+        filename = os.path.join(START_PATH, f'{path}/{name}.mcfunction')
+        writeFile(filename, dispatchTree(path, half, getBranch, getLeafLines))
+    
+    return lines
 
 
 # Teleport a scoreboard distance using binary search. Adds to the lines, to be written later.
@@ -168,14 +249,33 @@ def pushCurrBlock():
     filename = os.path.join(START_PATH, 'push_curr_block.mcfunction')
     lines = []
     
+    # Blocks by name, with the values of each of their states. Tags can't tell states apart, so these stay together
+    blockValues = dict()
+    for n in sorted(VALUE_TO_BLOCK.keys()):
+        blockValues.setdefault(getNameFromValue(n), []).append(n)
+    
+    # Each branch gets a tag of its blocks
+    def getBranch(items):
+        name = f'push_curr_block/{items[0][1][0]}_{items[-1][1][-1]}'
+        writeTag(name, [f'minecraft:{block}' for block, _ in items])
+        return name.split('/')[1], f'at @s if block ~ ~ ~ #craftyfunge:{name}'
+    
+    def getLeafLines(items):
+        lines = []
+        for _, values in items:
+            for n in values:
+                block = getBlockPredicate(n)
+                lines.append(f'execute at @s if block ~ ~ ~ {block} run scoreboard players set $stack stackin {n}')
+                lines.append(f'execute at @s if block ~ ~ ~ {block} run scoreboard players set $temp temp1 1')
+        return lines
+    
     # Variable to see if we found any block
     lines.append('scoreboard players set $temp temp1 0')
     
     # Get block
-    for n in sorted(VALUE_TO_BLOCK.keys()):
-        block = getBlockPredicate(n)
-        lines.append(f'execute at @s if block ~ ~ ~ {block} run scoreboard players set $stack stackin {n}')
-        lines.append(f'execute at @s if block ~ ~ ~ {block} run scoreboard players set $temp temp1 1')
+    clearGenerated(os.path.join(START_PATH, 'push_curr_block'))
+    clearGenerated(os.path.join(TAG_START_PATH, 'push_curr_block'))
+    lines += dispatchTree('push_curr_block', list(blockValues.items()), getBranch, getLeafLines)
     
     # Push
     lines.append('execute if score $temp temp1 matches 1 run function craftyfunge:push_stack')
@@ -329,12 +429,22 @@ def moveStackRight():
 def dupStack():
     filename = os.path.join(START_PATH, 'duplicate.mcfunction')
     lines = []
-    # Manipulate the blocks to duplicate the stack
-    lines.append('function craftyfunge:move_stack_right')
-    lines.append(f'execute at @e[{STACKER}] run clone ~ ~-1 ~-1 ~ ~{MAX_NUMBER_HEIGHT} ~-1 ~ ~-1 ~ replace')
     
-    # Add 1 to length unless we're duplicating an empty stack
-    lines.append('execute unless score $stack stacklen matches 0 run scoreboard players add $stack stacklen 1')
+    if STACK_BACKEND == 'storage':
+        # Pop and push twice, so a zero left alone on the stack goes away like in the interpreter
+        lines.append('function craftyfunge:pop_stack1')
+        lines.append('scoreboard players operation $stack stackin = $stack stack1')
+        lines.append('function craftyfunge:push_stack')
+        lines.append('scoreboard players operation $stack stackin = $stack stack1')
+        lines.append('function craftyfunge:push_stack')
+        lines.append('scoreboard players set $stack stack1 0')
+    else:
+        # Manipulate the blocks to duplicate the stack
+        lines.append('function craftyfunge:move_stack_right')
+        lines.append(f'execute at @e[{STACKER}] run clone ~ ~-1 ~-1 ~ ~{MAX_NUMBER_HEIGHT} ~-1 ~ ~-1 ~ replace')
+        
+        # Add 1 to length unless we're duplicating an empty stack
+        lines.append('execute unless score $stack stacklen matches 0 run scoreboard players add $stack stacklen 1')
     
     writeFile(filename, lines)
 
@@ -343,7 +453,10 @@ def clearStack():
     filename = os.path.join(START_PATH, 'clear_stack.mcfunction')
     lines = []
     
-    lines.append(f'execute at @e[{STACKER}] run fill ~ ~-1 ~ ~ ~{MAX_NUMBER_HEIGHT} ~-{MAX_STACK_SIZE} minecraft:air')
+    if STACK_BACKEND == 'storage':
+        lines.append(f'data modify {STACK_DATA} set value []')
+    else:
+        lines.append(f'execute at @e[{STACKER}] run fill ~ ~-1 ~ ~ ~{MAX_NUMBER_HEIGHT} ~-{MAX_STACK_SIZE} minecraft:air')
     lines.append('scoreboard players set $stack stacklen 0')
     
     writeFile(filename, lines)
@@ -351,6 +464,19 @@ def clearStack():
 
 def popStack():
     for n in range(1, STACKS+1):
+        if STACK_BACKEND == 'storage':
+            filename = os.path.join(START_PATH, f'pop_stack{n}.mcfunction')
+            lines = []
+            
+            # Popping an empty stack gives 0
+            lines.append(f'scoreboard players set $stack stack{n} 0')
+            lines.append(f'execute if data {STACK_DATA}[-1] store result score $stack stack{n} run data get {STACK_DATA}[-1]')
+            lines.append(f'data remove {STACK_DATA}[-1]')
+            lines.append('execute unless score $stack stacklen matches 0 run scoreboard players remove $stack stacklen 1')
+            
+            writeFile(filename, lines)
+            continue
+        
         # Calling function
         filename = os.path.join(START_PATH, f'pop_stack{n}.mcfunction')
         lines = [f'execute as @e[{STACKER}] run function craftyfunge:wrapped/pop_stack{n}']
@@ -387,6 +513,31 @@ def popStack():
 
 
 def pushStack():
+    if STACK_BACKEND == 'storage':
+        filename = os.path.join(START_PATH, 'push_stack.mcfunction')
+        lines = []
+        
+        # Don't push zero onto an empty stack
+        lines.append('execute unless score $stack stackin matches 0 run function craftyfunge:wrapped/push_stack')
+        lines.append('execute if score $stack stackin matches 0 unless score $stack stacklen matches 0 run function craftyfunge:wrapped/push_stack')
+        lines.append('scoreboard players set $stack stackin 0')
+        
+        writeFile(filename, lines)
+        
+        filename = os.path.join(START_PATH, 'wrapped/push_stack.mcfunction')
+        lines = []
+        
+        lines.append(f'data modify {STACK_DATA} append value 0')
+        lines.append(f'execute store result {STACK_DATA}[-1] int 1 run scoreboard players get $stack stackin')
+        lines.append('scoreboard players add $stack stacklen 1')
+        
+        # Past the maximum length, the bottom falls off like with the blocks
+        lines.append(f'execute if score $stack stacklen matches {MAX_STACK_SIZE+2}.. run data remove {STACK_DATA}[0]')
+        lines.append(f'execute if score $stack stacklen matches {MAX_STACK_SIZE+2}.. run scoreboard players remove $stack stacklen 1')
+        
+        writeFile(filename, lines)
+        return
+    
     # Calling function
     filename = os.path.join(START_PATH, 'push_stack.mcfunction')
     lines = [f'execute as @e[{STACKER}] run function craftyfunge:wrapped/push_stack']
@@ -509,21 +660,13 @@ def arithmeticOperators():
     filename = os.path.join(START_PATH, 'arithmetic.mcfunction')
     lines = []
     
-    binaryOperators = [
-        ('add',     '+=',   ADD),
-        ('sub',     '-=',   SUB),
-        ('mult',    '*=',   MULT),
-        ('div',     '/=',   DIV),
-        ('mod',     '%=',   MOD),
-    ]
-    
-    for name, _, block in binaryOperators:
+    for name, _, block in BINARY_OPERATORS:
         lines.append(f'execute at @s if block ~ ~ ~ minecraft:{block} run function craftyfunge:arithmetic/{name}')
         
     writeFile(filename, lines)
     
     # Binary Operators
-    for name, op, _ in binaryOperators:
+    for name, op, _ in BINARY_OPERATORS:
         filename = os.path.join(START_PATH, f'arithmetic/{name}.mcfunction')
         lines = []
         
@@ -715,6 +858,9 @@ def output():
     lines.append('tellraw @a ["%s"]' % ('\\n'*50))
     lines.append('tellraw @a {"nbt":"textBuffer","storage":"craftyfunge:io","interpret":"true"}')
     
+    # End the tick in turbo mode, so the output shows as it happens
+    lines.append('scoreboard players set $ip yield 1')
+    
     writeFile(filename, lines)
 
 
@@ -813,8 +959,18 @@ def start():
         lines.append(f'execute store result score $start_pos {objective} run data get entity @e[tag=StartAnchor,limit=1] Pos[{axis}] 1')
     
     # Reset stack and vars
-    lines.append(f'execute at @e[{STACKER}] run fill ~ ~-1 ~ ~ ~{MAX_NUMBER_HEIGHT} ~-{MAX_STACK_SIZE} minecraft:air')
-    lines.append(f'execute at @e[{SETTER}] run fill ~ ~-1 ~ ~ ~{MAX_NUMBER_HEIGHT} ~-{MAX_STACK_SIZE} minecraft:air')
+    if STACK_BACKEND == 'storage':
+        lines.append(f'data modify {STACK_DATA} set value []')
+    else:
+        lines.append(f'execute at @e[{STACKER}] run fill ~ ~-1 ~ ~ ~{MAX_NUMBER_HEIGHT} ~-{MAX_STACK_SIZE} minecraft:air')
+    if VARS_BACKEND == 'scoreboard':
+        lines.append('scoreboard players reset * vars')
+    else:
+        lines.append(f'execute at @e[{SETTER}] run fill ~ ~-1 ~ ~ ~{MAX_NUMBER_HEIGHT} ~-{MAX_STACK_SIZE} minecraft:air')
+    
+    # Profile counts are for one run
+    if PROFILE:
+        lines.append('function craftyfunge:profile/reset')
     
     # Reset text buffer
     lines.append('data remove storage craftyfunge:io textBuffer')
@@ -1024,19 +1180,14 @@ def conditional():
 def comparisons():
     filename = os.path.join(START_PATH, 'comparisons.mcfunction')
     lines = []
-
-    compTypes = [
-        ('lessthan',     '<',   'cracked_stone_bricks'),
-        ('greaterthan',  '>',   'mossy_stone_bricks'),
-    ]
     
-    for name, _, block in compTypes:
+    for name, _, block in COMPARISON_TYPES:
         lines.append(f'execute at @s if block ~ ~ ~ minecraft:{block} run function craftyfunge:comparisons/{name}')
 
     writeFile(filename, lines)
 
     # Comparisons
-    for name, op, _ in compTypes:
+    for name, op, _ in COMPARISON_TYPES:
         filename = os.path.join(START_PATH, f'comparisons/{name}.mcfunction')
         lines = []
 
@@ -1063,15 +1214,139 @@ def comparisons():
 def swap():
     filename = os.path.join(START_PATH, 'swap.mcfunction')
     lines = []
-
-    lines.append(f'execute at @e[{STACKER}] run clone ~ ~-1 ~ ~ ~{MAX_NUMBER_HEIGHT} ~ ~1 ~-1 ~ replace move')
-    lines.append(f'execute at @e[{STACKER}] run clone ~ ~-1 ~-1 ~ ~{MAX_NUMBER_HEIGHT} ~-1 ~ ~-1 ~ replace move')
-    lines.append(f'execute at @e[{STACKER}] run clone ~1 ~-1 ~ ~1 ~{MAX_NUMBER_HEIGHT} ~ ~ ~-1 ~-1 replace move')
+    
+    if STACK_BACKEND == 'storage':
+        # Pop a and b, then push a and b
+        lines.append('function craftyfunge:pop_stack1')
+        lines.append('function craftyfunge:pop_stack2')
+        lines.append('scoreboard players operation $stack stackin = $stack stack1')
+        lines.append('function craftyfunge:push_stack')
+        lines.append('scoreboard players operation $stack stackin = $stack stack2')
+        lines.append('function craftyfunge:push_stack')
+        lines.append('scoreboard players set $stack stack1 0')
+        lines.append('scoreboard players set $stack stack2 0')
+    else:
+        lines.append(f'execute at @e[{STACKER}] run clone ~ ~-1 ~ ~ ~{MAX_NUMBER_HEIGHT} ~ ~1 ~-1 ~ replace move')
+        lines.append(f'execute at @e[{STACKER}] run clone ~ ~-1 ~-1 ~ ~{MAX_NUMBER_HEIGHT} ~-1 ~ ~-1 ~ replace move')
+        lines.append(f'execute at @e[{STACKER}] run clone ~1 ~-1 ~ ~1 ~{MAX_NUMBER_HEIGHT} ~ ~ ~-1 ~-1 replace move')
 
     writeFile(filename, lines)
 
 
 def rotate():
+    if STACK_BACKEND == 'storage':
+        # Each depth is its own function, picked from a tree on the score, since list indices can't come from scores
+        def getBranch(depths):
+            return f'{depths[0]}_{depths[-1]}', f'if score $stack stack1 matches {depths[0]}..{depths[-1]}'
+        
+        filename = os.path.join(START_PATH, 'rotate.mcfunction')
+        lines = []
+        
+        # Get rotate length. Nothing happens if that empties the stack
+        lines.append('function craftyfunge:pop_stack1')
+        lines.append('execute unless score $stack stacklen matches 0 if score $stack stack1 matches 0.. run function craftyfunge:rotate/right')
+        lines.append('execute unless score $stack stacklen matches 0 if score $stack stack1 matches ..-1 run function craftyfunge:rotate/left')
+        
+        # Reset
+        lines.append('scoreboard players set $stack stack1 0')
+        lines.append('scoreboard players set $temp temp1 0')
+        lines.append('scoreboard players set $temp temp2 0')
+        
+        writeFile(filename, lines)
+        
+        # For positive rotations, bottom goes to top. [2 1 2 3 4 5] -> [3 1 2 4 5]
+        def rotateRight():
+            filename = os.path.join(START_PATH, 'rotate/right.mcfunction')
+            lines = []
+            
+            # Rotating past the bottom is the same as pushing a zero
+            lines.append('scoreboard players set $temp temp1 0')
+            lines.append('execute if score $stack stack1 < $stack stacklen run scoreboard players set $temp temp1 1')
+            lines.append('execute if score $temp temp1 matches 0 run function craftyfunge:push_stack')
+            lines.append('execute if score $temp temp1 matches 1 run function craftyfunge:rotate/right_depth')
+            
+            # Taking the bottom element to the top leaves zeros at the bottom, which aren't counted
+            lines.append('scoreboard players operation $temp temp2 = $stack stack1')
+            lines.append('scoreboard players add $temp temp2 1')
+            lines.append('execute if score $temp temp1 matches 1 if score $temp temp2 = $stack stacklen run function craftyfunge:rotate/remove_bottom_zeros')
+            
+            writeFile(filename, lines)
+            
+            def getLeafLines(depths):
+                lines = []
+                for depth in depths:
+                    lines.append(f'execute if score $stack stack1 matches {depth} run data modify {STACK_DATA} append from {STACK_DATA}[-{depth+1}]')
+                    lines.append(f'execute if score $stack stack1 matches {depth} run data remove {STACK_DATA}[-{depth+2}]')
+                return lines
+            
+            filename = os.path.join(START_PATH, 'rotate/right_depth.mcfunction')
+            clearGenerated(os.path.join(START_PATH, 'rotate/right_depth'))
+            writeFile(filename, dispatchTree('rotate/right_depth', list(range(MAX_STACK_SIZE+1)), getBranch, getLeafLines))
+        rotateRight()
+        
+        def removeBottomZeros():
+            filename = os.path.join(START_PATH, 'rotate/remove_bottom_zeros.mcfunction')
+            lines = []
+            
+            lines.append('scoreboard players set $temp temp3 1')
+            lines.append(f'execute if data {STACK_DATA}[0] store result score $temp temp3 run data get {STACK_DATA}[0]')
+            lines.append(f'execute if score $temp temp3 matches 0 run data remove {STACK_DATA}[0]')
+            lines.append('execute if score $temp temp3 matches 0 run scoreboard players remove $stack stacklen 1')
+            lines.append('execute if score $temp temp3 matches 0 run function craftyfunge:rotate/remove_bottom_zeros')
+            lines.append('scoreboard players set $temp temp3 0')
+            
+            writeFile(filename, lines)
+        removeBottomZeros()
+        
+        # For negative rotations, top goes to bottom. [-2 1 2 3 4 5] -> [2 3 1 4 5]
+        def rotateLeft():
+            filename = os.path.join(START_PATH, 'rotate/left.mcfunction')
+            lines = []
+            
+            # Depths out of range are truncated, which -2147483648 still is after negating
+            lines.append('scoreboard players operation $stack stack1 *= $constants minus')
+            lines.append(f'execute unless score $stack stack1 matches 0..{MAX_STACK_SIZE} run scoreboard players set $stack stack1 {MAX_STACK_SIZE}')
+            lines.append('function craftyfunge:pop_stack2')
+            
+            # Rotating past the bottom pads it with zeros
+            lines.append('scoreboard players set $temp temp1 0')
+            lines.append('execute if score $stack stack1 >= $stack stacklen run scoreboard players set $temp temp1 1')
+            lines.append('execute if score $temp temp1 matches 1 run function craftyfunge:rotate/pad_bottom')
+            lines.append(f'execute if score $temp temp1 matches 1 run data modify {STACK_DATA} prepend value 0')
+            lines.append(f'execute if score $temp temp1 matches 1 store result {STACK_DATA}[0] int 1 run scoreboard players get $stack stack2')
+            lines.append('execute if score $temp temp1 matches 0 run function craftyfunge:rotate/left_depth')
+            lines.append('scoreboard players add $stack stacklen 1')
+            
+            lines.append('scoreboard players set $stack stack2 0')
+            
+            writeFile(filename, lines)
+            
+            # Inserting at -1 appends, so -(depth+1) puts the value depth elements from the top
+            def getLeafLines(depths):
+                lines = []
+                for depth in depths:
+                    lines.append(f'execute if score $stack stack1 matches {depth} run data modify {STACK_DATA} insert -{depth+1} value 0')
+                    lines.append(f'execute if score $stack stack1 matches {depth} store result {STACK_DATA}[-{depth+1}] int 1 run scoreboard players get $stack stack2')
+                return lines
+            
+            filename = os.path.join(START_PATH, 'rotate/left_depth.mcfunction')
+            clearGenerated(os.path.join(START_PATH, 'rotate/left_depth'))
+            writeFile(filename, dispatchTree('rotate/left_depth', list(range(1, MAX_STACK_SIZE+1)), getBranch, getLeafLines))
+        rotateLeft()
+        
+        def padBottom():
+            filename = os.path.join(START_PATH, 'rotate/pad_bottom.mcfunction')
+            lines = []
+            
+            lines.append(f'execute if score $stack stacklen < $stack stack1 run data modify {STACK_DATA} prepend value 0')
+            lines.append('execute if score $stack stacklen < $stack stack1 run scoreboard players add $stack stacklen 1')
+            lines.append('execute if score $stack stacklen < $stack stack1 run function craftyfunge:rotate/pad_bottom')
+            
+            writeFile(filename, lines)
+        padBottom()
+        
+        return
+    
     # Calling function
     filename = os.path.join(START_PATH, 'rotate.mcfunction')
     lines = [f'execute as @e[{STACKER}] run function craftyfunge:wrapped/rotate']
@@ -1222,10 +1497,16 @@ def setBlock():
     
     lines.append('function craftyfunge:pop_stack4') # value
     
+    # Each branch covers a range of values
+    def getBranch(values):
+        return f'{values[0]}_{values[-1]}', f'if score $stack stack4 matches {values[0]}..{values[-1]}'
+    
+    def getLeafLines(values):
+        return [f'execute at @s if score $stack stack4 matches {n} run setblock ~ ~ ~ {getBlockPredicate(n)}' for n in values]
+    
     # Set block
-    for n in sorted(VALUE_TO_BLOCK.keys()):
-        block = getBlockPredicate(n)
-        lines.append(f'execute at @s if score $stack stack4 matches {n} run setblock ~ ~ ~ {block}')
+    clearGenerated(os.path.join(START_PATH, 'wrapped/set_block'))
+    lines += dispatchTree('wrapped/set_block', sorted(VALUE_TO_BLOCK.keys()), getBranch, getLeafLines)
     
     # Clean up temp entity
     lines.append('kill @s')
@@ -1235,7 +1516,43 @@ def setBlock():
     writeFile(filename, lines)
 
 
+# Each variable index gets its own function, picked from a tree on the index since fake player names can't come from scores
+def varsDispatchTree(path, getLeafLines):
+    def getBranch(indices):
+        return f'{indices[0]}_{indices[-1]}', f'if score $stack stack1 matches {indices[0]}..{indices[-1]}'
+    
+    clearGenerated(os.path.join(START_PATH, path))
+    lines = []
+    
+    # Indices out of range are truncated
+    lines.append('execute if score $stack stack1 matches ..-1 run scoreboard players set $stack stack1 0')
+    lines.append(f'execute if score $stack stack1 matches {MAX_VARS_SIZE+1}.. run scoreboard players set $stack stack1 {MAX_VARS_SIZE}')
+    
+    lines += dispatchTree(path, list(range(MAX_VARS_SIZE+1)), getBranch, getLeafLines)
+    return lines
+
+
 def getVar():
+    if VARS_BACKEND == 'scoreboard':
+        filename = os.path.join(START_PATH, 'get_var.mcfunction')
+        lines = []
+        
+        # Get variable index
+        lines.append('function craftyfunge:pop_stack1')
+        
+        # Copy the variable, which is 0 if it was never set
+        lines.append('scoreboard players set $stack stackin 0')
+        lines += varsDispatchTree('get_var', lambda indices: [f'execute if score $stack stack1 matches {i} run scoreboard players operation $stack stackin = $var{i} vars' for i in indices])
+        
+        # Push onto stack
+        lines.append('function craftyfunge:push_stack')
+        
+        # Reset
+        lines.append('scoreboard players set $stack stack1 0')
+        
+        writeFile(filename, lines)
+        return
+    
     # Calling function
     filename = os.path.join(START_PATH, 'get_var.mcfunction')
     lines = [f'execute as @e[{SETTER}] run function craftyfunge:wrapped/get_var']
@@ -1265,6 +1582,23 @@ def getVar():
 
 
 def setVar():
+    if VARS_BACKEND == 'scoreboard':
+        filename = os.path.join(START_PATH, 'set_var.mcfunction')
+        lines = []
+        
+        # Get index and value
+        lines.append('function craftyfunge:pop_stack1')
+        lines.append('function craftyfunge:pop_stack2')
+        
+        lines += varsDispatchTree('set_var', lambda indices: [f'execute if score $stack stack1 matches {i} run scoreboard players operation $var{i} vars = $stack stack2' for i in indices])
+        
+        # Reset
+        lines.append('scoreboard players set $stack stack1 0')
+        lines.append('scoreboard players set $stack stack2 0')
+        
+        writeFile(filename, lines)
+        return
+    
     # Calling function
     filename = os.path.join(START_PATH, 'set_var.mcfunction')
     lines = [f'execute as @e[{SETTER}] run function craftyfunge:wrapped/set_var']
@@ -1337,6 +1671,9 @@ def inputAscii():
     filename = os.path.join(START_PATH, 'input/input_ascii.mcfunction')
     lines = []
     
+    # End the tick in turbo mode
+    lines.append('scoreboard players set $ip yield 1')
+    
     # Default is -1 (for EOF)
     lines.append('scoreboard players set $stack stackin -1')
     
@@ -1435,6 +1772,9 @@ def inputNumber():
     filename = os.path.join(START_PATH, 'input/input_number.mcfunction')
     lines = []
     
+    # End the tick in turbo mode
+    lines.append('scoreboard players set $ip yield 1')
+    
     lines.append('data remove storage craftyfunge:io eatenBuffer')
     
     # Ignore spaces
@@ -1551,13 +1891,18 @@ def initScoreboard():
                       'numdirs', 'ten', 'minus',
                       'mode', 'can_change_mode', 
                       'went_to', 'stepping',
-                      'running', 'move_countdown', 'delay'] + list(AXIS_NAMES):
+                      'running', 'move_countdown', 'delay',
+                      'vars', 'turbo', 'budget', 'yield'] + list(AXIS_NAMES):
         lines.append(f'scoreboard objectives add {objective} dummy')
     
     lines.append('scoreboard players set $constants numdirs 6')
     lines.append('scoreboard players set $constants ten 10')
     lines.append('scoreboard players set $constants minus -1')
     lines.append('scoreboard players set $ip delay 6')
+    lines.append(f'scoreboard players set $ip turbo {TURBO_STEPS}')
+    
+    if PROFILE:
+        lines.append('scoreboard objectives add profile dummy')
 
     # Teams
     for mode in Modes:
@@ -1582,6 +1927,9 @@ def runStep():
     # Reset changed mode
     lines.append('scoreboard players set $ip can_change_mode 1')
     
+    if PROFILE:
+        lines.append('scoreboard players add $steps profile 1')
+    
     # Execute each mode
     for mode in Modes:
         # Only evalute if not stopped and mode hasn't already been changed
@@ -1606,12 +1954,33 @@ def runStep():
         filename = os.path.join(START_PATH, 'steps/run_step_default.mcfunction')
         lines = []
         
-        lines.append('execute as @s at @s if block ~ ~ ~ #craftyfunge:numbers run function craftyfunge:push_number')
-        lines.append(f'execute as @s run function craftyfunge:arithmetic')
-        lines.append(f'execute as @s run function craftyfunge:comparisons')
-        
-        for block, functionName in BLOCKS_TO_FN_NAMES:
-            lines.append(f'execute as @s at @s if block ~ ~ ~ minecraft:{block} run function craftyfunge:{functionName}')
+        # Every opcode as its index, its blocks, and its function.
+        # Profiling calls a function counting the opcode first, since instruction functions are also called by others
+        opcodes = []
+        for i, (blocks, functionName) in enumerate(getOpcodes()):
+            if PROFILE:
+                name = getProfileName(blocks)
+                writeFile(os.path.join(START_PATH, f'profile/count/{name}.mcfunction'), [
+                    f'scoreboard players add {name} profile 1',
+                    f'function craftyfunge:{functionName}',
+                ])
+                functionName = f'profile/count/{name}'
+            opcodes.append((i, blocks, functionName))
+        
+        # Each branch gets a tag of its opcodes' blocks
+        def getBranch(items):
+            name = f'run_step/{items[0][0]}_{items[-1][0]}'
+            writeTag(name, [blocks for _, blocks, _ in items])
+            return name.split('/')[1], f'if block ~ ~ ~ #craftyfunge:{name}'
+        
+        def getLeafLines(items):
+            return [f'execute if block ~ ~ ~ {blocks} run function craftyfunge:{functionName}' for _, blocks, functionName in items]
+        
+        # Blocks are tested at the position the step started at, not at @s, so only one opcode runs even if it moves the IP
+        clearGenerated(os.path.join(START_PATH, 'steps/run_step_default'))
+        clearGenerated(os.path.join(TAG_START_PATH, 'run_step'))
+        clearGenerated(os.path.join(START_PATH, 'profile'))
+        lines += dispatchTree('steps/run_step_default', opcodes, getBranch, getLeafLines)
         
         writeFile(filename, lines)
     runStepDefault()
@@ -1656,19 +2025,74 @@ def run():
     filename = os.path.join(START_PATH, 'run.mcfunction')
     lines = []
     
-    lines.append('execute if score $ip move_countdown matches 1.. run scoreboard players remove $ip move_countdown 1')
-    lines.append('execute if score $ip running matches 1 if score $ip move_countdown matches 0 run function craftyfunge:run_step')
+    # Turbo mode runs $ip turbo steps each tick instead
+    lines.append('execute if score $ip running matches 1 if score $ip turbo matches 1.. run function craftyfunge:turbo/run')
+    
+    lines.append('execute unless score $ip turbo matches 1.. if score $ip move_countdown matches 1.. run scoreboard players remove $ip move_countdown 1')
+    lines.append('execute unless score $ip turbo matches 1.. if score $ip running matches 1 if score $ip move_countdown matches 0 run function craftyfunge:run_step')
+    
+    writeFile(filename, lines)
+    
+    def turboRun():
+        filename = os.path.join(START_PATH, 'turbo/run.mcfunction')
+        lines = []
+        
+        lines.append('scoreboard players operation $ip budget = $ip turbo')
+        lines.append('scoreboard players set $ip yield 0')
+        lines.append('function craftyfunge:turbo/step')
+        
+        writeFile(filename, lines)
+    turboRun()
+    
+    # Steps until the budget runs out, the program stops, or it outputs or inputs
+    def turboStep():
+        filename = os.path.join(START_PATH, 'turbo/step.mcfunction')
+        lines = []
+        
+        lines.append('function craftyfunge:run_step')
+        lines.append('scoreboard players remove $ip budget 1')
+        lines.append('execute if score $ip budget matches 1.. if score $ip running matches 1 if score $ip yield matches 0 run function craftyfunge:turbo/step')
+        
+        writeFile(filename, lines)
+    turboStep()
+
+
+# Prints how many times each opcode ran, and the steps run in every mode
+def profileReport():
+    if not PROFILE:
+        return
+    
+    filename = os.path.join(START_PATH, 'profile/report.mcfunction')
+    lines = []
+    
+    lines.append('tellraw @a {"text":"Steps by instruction:","color":"gold"}')
+    for blocks, _ in getOpcodes():
+        name = getProfileName(blocks)
+        lines.append('execute if score %s profile matches 1.. run tellraw @a ["",{"score":{"name":"%s","objective":"profile"}},{"text":" %s"}]' % (name, name, name))
+    lines.append('tellraw @a ["",{"score":{"name":"$steps","objective":"profile"}},{"text":" steps in total","color":"gold"}]')
+    
+    writeFile(filename, lines)
+    
+    filename = os.path.join(START_PATH, 'profile/reset.mcfunction')
+    lines = []
+    
+    lines.append('scoreboard players reset * profile')
+    lines.append('scoreboard players set $steps profile 0')
     
     writeFile(filename, lines)
 
 
+# Generates every file by calling each function in this module that writes some. It's only run through generateFiles,
+# which both __main__ and commandcost.py use. badFuncs are the functions that don't write files on their own:
+# helpers that take arguments, the writing and profiling machinery, and the entry points. getBadFuncs() adds everything
+# brought in from common
 def runEverything():
-    # Haven't run it yet, if it's bad then manually change badFuncs back to evything not a function
     import types
     funcs = [f for f in globals().values() if type(f) == types.FunctionType]
-    badFuncs = [getSelector, writeFile, getBlockPredicate,
+    badFuncs = [getSelector, writeFile, writeTag, clearGenerated, getOpcodes, getProfileName, dispatchTree, getBlockPredicate,
                 binaryTeleport, binaryEncode, binaryDecode,
-                toggleMode, runEverything] + getBadFuncs()
+                toggleMode, varsDispatchTree, runEverything, generateFiles, hashText, writeGenerated,
+                parseArgs] + getBadFuncs()
     for func in badFuncs:
         funcs.remove(func)
     
@@ -1676,5 +2100,101 @@ def runEverything():
         func()
 
 
-setBlock()
-pushCurrBlock()
\ No newline at end of file
+# Generates every file, giving them by their path in the datapack
+def generateFiles():
+    GENERATED.clear()
+    GENERATED_DIRS.clear()
+    runEverything()
+    return dict(GENERATED)
+
+
+def hashText(s):
+    return hashlib.sha256(s.encode('utf-8')).hexdigest()
+
+
+# Writes the files that changed since the manifest was last written, and removes ones that aren't generated anymore.
+# Returns the paths added, changed, and removed
+def writeGenerated(packPath, files):
+    manifestFile = os.path.join(packPath, MANIFEST_NAME)
+    try:
+        with open(manifestFile, 'r') as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, ValueError):
+        manifest = dict()
+    
+    # Files missing from the world are written again, even if they haven't changed
+    hashes = {path: hashText(s) for path, s in files.items()}
+    added, changed = [], []
+    for path in sorted(files):
+        filename = os.path.join(packPath, path)
+        if manifest.get(path) == hashes[path] and os.path.isfile(filename):
+            continue
+        
+        (changed if path in manifest else added).append(path)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        with open(filename, 'w') as f:
+            f.write(files[path])
+    
+    # Stale files were generated last time, or are in a generated folder without being generated now
+    stale = set(manifest) - set(files)
+    for folder in GENERATED_DIRS:
+        for root, _, names in os.walk(os.path.join(packPath, folder)):
+            for name in names:
+                path = os.path.relpath(os.path.join(root, name), packPath).replace(os.sep, '/')
+                if path not in files:
+                    stale.add(path)
+    
+    removed = []
+    packPath = os.path.normpath(packPath)
+    for path in sorted(stale):
+        filename = os.path.join(packPath, path)
+        if not os.path.isfile(filename):
+            continue
+        
+        os.remove(filename)
+        removed.append(path)
+        
+        # Remove folders left empty
+        folder = os.path.dirname(filename)
+        while folder != packPath and not os.listdir(folder):
+            os.rmdir(folder)
+            folder = os.path.dirname(folder)
+    
+    with open(manifestFile, 'w') as f:
+        json.dump(hashes, f, indent=4, sort_keys=True)
+    
+    return added, changed, removed
+
+
+def parseArgs():
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='Generate the Minecraft functions for the in-game interpreter into the world in world.cfg.')
+    parser.add_argument('-s', '--stack', dest='stackBackend', choices=STACK_BACKENDS, default=STACK_BACKEND, help=f'Where the stack is kept. "storage" is an NBT list, which pushes and pops with a few commands. "blocks" is the visual stack of iron blocks, for demos. Defaults to {STACK_BACKEND}.')
+    parser.add_argument('-t', '--turbo', dest='turboSteps', metavar='STEPS', type=int, default=TURBO_STEPS, help=f'Run up to STEPS steps each tick by default, stopping early on output, input, or the end of the program. 0 steps every $ip delay ticks instead. Defaults to {TURBO_STEPS}.')
+    parser.add_argument('-p', '--profile', dest='profile', action='store_true', help='Count how many times each instruction runs, and the steps run, shown with "function craftyfunge:profile/report". Each step takes a few more commands.')
+    parser.add_argument('-q', '--quiet', dest='quiet', action='store_true', help='Only print how many files changed, not which ones.')
+    parser.add_argument('-v', '--vars', dest='varsBackend', choices=VARS_BACKENDS, default=VARS_BACKEND, help=f'Where variables are kept. "scoreboard" gives each index a fake player, found without moving any entities. "blocks" is iron blocks, for demos. Defaults to {VARS_BACKEND}.')
+    
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parseArgs()
+    STACK_BACKEND = args.stackBackend
+    VARS_BACKEND = args.varsBackend
+    TURBO_STEPS = args.turboSteps
+    PROFILE = args.profile
+    
+    # Make sure the path exists before trying to write to it
+    packPath = os.path.join(readConfig(), PACK_PATH)
+    if not os.path.exists(os.path.join(packPath, START_PATH)):
+        raise OSError('Function folder does not exist. Change world.cfg to match the path to your world.')
+    
+    files = generateFiles()
+    added, changed, removed = writeGenerated(packPath, files)
+    if not args.quiet:
+        for label, paths in (('Added', added), ('Changed', changed), ('Removed', removed)):
+            for path in paths:
+                print(f'{label} {path}')
+    print(f'{len(added)} added, {len(changed)} changed, {len(removed)} removed, {len(files) - len(added) - len(changed)} unchanged')
\ No newline at end of file
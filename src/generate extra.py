@@ -88,6 +88,10 @@ def writeBlockValues():
 
 writeBlockValues()
 
+# Keep the tables the interpreter loads in step with the csv
+from maketables import writeBlockTables
+writeBlockTables()
+
 
 # Make a markdown table of all block values
 def writeBlockValueTableDoc(VALUE_TO_BLOCK):
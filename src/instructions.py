@@ -28,17 +28,25 @@ class ModeIsr(object):
         
         self.stack.append(n)
     
-    # Push the block at the pos (x, y, z)
-    def pushBlockAtPos(self, x, y, z):
+    # Gets the value of the block at the pos (x, y, z), or None if it doesn't have one
+    def blockValAtPos(self, x, y, z):
         block = self.interp.getBlock(x, y, z)
         if block in BLOCKS_WITH_EXTRA_DATA:
             if block in ['piston', 'observer']:
                 extra = (('facing', self.interp.getFacing(x, y, z)), )
                 block = (block, extra)
         
-        # Only push if possible to, otherwise do nothing
         if block in BLOCK_TO_VALUE:
-            self.push(self.interp.getBlockVal(block))
+            return self.interp.getBlockVal(block)
+        return None
+    
+    # Push the block at the pos (x, y, z)
+    def pushBlockAtPos(self, x, y, z):
+        val = self.blockValAtPos(x, y, z)
+        
+        # Only push if possible to, otherwise do nothing
+        if val is not None:
+            self.push(val)
     
     # Push the current block's value to the stack
     def pushCurrBlock(self):
@@ -516,12 +524,17 @@ class ModeIsrDefault(ModeIsr):
     
     def setVar(self):
         index, val = self.popN(2)
+        # Keep the incremental hash of all vars up to date
+        if index in self.interp.vars:
+            self.interp.varsHash ^= hash((index, self.interp.vars[index]))
+        
         # Setting a variable to 0 deletes it
         if val == 0:
             if index in self.interp.vars:
                 del self.interp.vars[index]
         else:
             self.interp.vars[index] = val
+            self.interp.varsHash ^= hash((index, val))
     
     # Push pos and Goto
     def pushPos(self):
@@ -611,4 +624,13 @@ class ModeIsrInStrLiteral(ModeIsr):
         if block == IN_STR_LITERAL:
             self.inStrLiteral()
         else:
-            self.pushCurrBlock()
\ No newline at end of file
+            self.pushCurrBlock()
+
+
+# Which instruction set runs in each mode
+MODE_ISRS = {
+    Modes.DEFAULT           : ModeIsrDefault,
+    Modes.TUNNEL            : ModeIsrTunnel,
+    Modes.IN_NUM_LITERAL    : ModeIsrInNumLiteral,
+    Modes.IN_STR_LITERAL    : ModeIsrInStrLiteral,
+}
\ No newline at end of file
@@ -0,0 +1,153 @@
+# Detects programs stuck repeating the same state forever
+# Copyright 2022 Eli Fox
+
+from common import *
+from tracers import HookedStack
+
+# Every cycle has to turn around, so it passes through at least one of these
+LOOP_CHECK_BLOCKS = {DIR, IF, SKIP, SKIP_COND, RANDOM_DIR, GOTO}
+
+# Forget old states past this many, so long computations don't eat memory
+MAX_SEEN_STATES = 2**17
+
+# The stack is hashed as a polynomial in HASH_BASE, with the bottom value as the constant term
+HASH_MOD = 2**61 - 1
+HASH_BASE = 1_000_003
+HASH_BASE_INV = pow(HASH_BASE, -1, HASH_MOD)
+
+
+# Hash contribution of a cell changed by setBlock
+def cellHash(pos, block):
+    return hash((pos, block['Name'], tuple(sorted(block.get('Properties', {}).items()))))
+
+
+# A stack keeping a hash of its values in order, like varsHash and cellsHash. Pushing and popping at
+# either end update it, and anything in the middle hashes the whole stack again
+class HashedStack(HookedStack):
+    def __init__(self, iterable, onPush, onPop):
+        super().__init__(iterable, onPush, onPop)
+        self.rehash()
+
+    def rehash(self):
+        self.hash = 0
+        self.power = 1 # HASH_BASE to the length
+        for n in self:
+            self.hash = (self.hash + hash(n) * self.power) % HASH_MOD
+            self.power = self.power * HASH_BASE % HASH_MOD
+
+    def append(self, n):
+        self.hash = (self.hash + hash(n) * self.power) % HASH_MOD
+        self.power = self.power * HASH_BASE % HASH_MOD
+        super().append(n)
+
+    def pop(self):
+        n = super().pop()
+        self.power = self.power * HASH_BASE_INV % HASH_MOD
+        self.hash = (self.hash - hash(n) * self.power) % HASH_MOD
+        return n
+
+    def appendleft(self, n):
+        self.hash = (hash(n) + self.hash * HASH_BASE) % HASH_MOD
+        self.power = self.power * HASH_BASE % HASH_MOD
+        super().appendleft(n)
+
+    def popleft(self):
+        n = super().popleft()
+        self.hash = (self.hash - hash(n)) * HASH_BASE_INV % HASH_MOD
+        self.power = self.power * HASH_BASE_INV % HASH_MOD
+        return n
+
+    # Like deque, extending doesn't call the push hooks
+    def extend(self, iterable):
+        values = list(iterable)
+        for n in values:
+            self.hash = (self.hash + hash(n) * self.power) % HASH_MOD
+            self.power = self.power * HASH_BASE % HASH_MOD
+        super().extend(values)
+
+    def extendleft(self, iterable):
+        for n in iterable:
+            self.appendleft(n)
+
+    def clear(self):
+        super().clear()
+        self.rehash()
+
+    def insert(self, i, n):
+        super().insert(i, n)
+        self.rehash()
+
+    def __delitem__(self, i):
+        super().__delitem__(i)
+        self.rehash()
+
+    def __setitem__(self, i, n):
+        super().__setitem__(i, n)
+        self.rehash()
+
+
+class LoopDetector():
+    def __init__(self, interp):
+        self.interp = interp
+        self.seen = dict()
+        self.ioMark = None
+
+        # A possible loop waiting to be confirmed: (first step, period, exact state)
+        self.candidate = None
+
+
+    # Input consumed and output produced so far. A loop only counts if these don't change
+    def getIoMark(self):
+        interp = self.interp
+        return (interp.inputLine, len(interp.inputBuffer), interp.outputLen)
+
+
+    def clear(self):
+        self.seen.clear()
+        self.candidate = None
+
+
+    # Hook called before executing every block
+    def onStep(self, block):
+        if block in LOOP_CHECK_BLOCKS:
+            self.check(block)
+
+
+    # Called before executing a block in LOOP_CHECK_BLOCKS
+    def check(self, block):
+        interp = self.interp
+
+        # Random choices mean a repeat proves nothing
+        if block == RANDOM_DIR:
+            self.clear()
+            return
+
+        ioMark = self.getIoMark()
+        if ioMark != self.ioMark:
+            self.ioMark = ioMark
+            self.clear()
+
+        # Confirm a candidate by seeing the exact same state again one period later
+        if self.candidate is not None:
+            firstStep, period, state = self.candidate
+            if interp.steps - state['steps'] < period:
+                return
+
+            newState = interp.getState()
+            newState['steps'] = state['steps']
+            if newState == state:
+                interp.raiseError(f'Infinite loop at step {firstStep}, period {period}.')
+            self.candidate = None
+
+        # The stack, vars, and changed cells are hashed as they change, so a repeat is only a likely one
+        # until the exact state is seen again
+        key = (tuple(interp.pos), interp.dir, interp.mode, getattr(interp.isr, 'sign', +1),
+               len(interp.stack), interp.stack.hash, interp.varsHash, interp.cellsHash)
+
+        firstStep = self.seen.get(key)
+        if firstStep is None:
+            if len(self.seen) >= MAX_SEEN_STATES:
+                self.seen.clear()
+            self.seen[key] = interp.steps
+        else:
+            self.candidate = (firstStep, interp.steps - firstStep, interp.getState())
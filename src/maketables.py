@@ -0,0 +1,68 @@
+# Generates blocktables.py from data/block_to_value.csv, so the interpreter doesn't parse it at startup
+# Copyright 2022 Eli Fox
+
+import hashlib, sys
+
+from common import *
+
+TABLES_PATH = resourcePath('blocktables.py')
+CSV_PATH = resourcePath('data/block_to_value.csv')
+
+
+# Writes a dict as a literal, one item per line in the given order
+def dictSource(name, items):
+    lines = [f'{name} = {{']
+    for key, value in items:
+        lines.append(f'    {key!r}: {value!r},')
+    lines.append('}')
+    return '\n'.join(lines)
+
+
+# Gets the source of blocktables.py from the csv and the number colors
+def makeBlockTables():
+    valueToBlock, blockToValue = readBlockValues()
+    blockToPushNum = findNumColors()
+
+    with open(CSV_PATH, 'rb') as f:
+        csvHash = hashlib.sha256(f.read()).hexdigest()
+
+    sections = [
+        '# Block value tables for CraftyFunge, generated by maketables.py from data/block_to_value.csv',
+        '# Don\'t edit by hand. Run "python maketables.py" after changing the csv',
+        '',
+        f'CSV_HASH = {csvHash!r}',
+        '',
+        '# Value to block. Blocks with extra data are (name, ((key, value), ...))',
+        dictSource('VALUE_TO_BLOCK', sorted(valueToBlock.items())),
+        '',
+        dictSource('BLOCK_TO_VALUE', sorted(blockToValue.items(), key=lambda item: item[1])),
+        '',
+        '# Blocks that push a number, in the order their colors and types are listed',
+        dictSource('BLOCK_TO_PUSHNUM', blockToPushNum.items()),
+        '',
+    ]
+    return '\n'.join(sections)
+
+
+def writeBlockTables():
+    with open(TABLES_PATH, 'w', newline='\n') as f:
+        f.write(makeBlockTables())
+
+
+# Sees if blocktables.py is what the csv would generate now
+def checkBlockTables():
+    try:
+        with open(TABLES_PATH, 'r') as f:
+            return f.read() == makeBlockTables()
+    except FileNotFoundError:
+        return False
+
+
+if __name__ == '__main__':
+    if '--check' in sys.argv[1:]:
+        if not checkBlockTables():
+            print('blocktables.py is out of date with data/block_to_value.csv. Run "python maketables.py" to regenerate it.', file=sys.stderr)
+            sys.exit(1)
+        print('blocktables.py is up to date.')
+    else:
+        writeBlockTables()
@@ -0,0 +1,1358 @@
+# Runs the in-game interpreter's functions outside of Minecraft, counting the commands they take
+# Copyright 2022 Eli Fox
+#
+# Only the commands "function generator.py" writes are understood: scoreboard, execute, setblock,
+# fill, clone, tp, summon, kill, data, function, schedule, and tellraw, with team and playsound
+# doing nothing. Functions run the way Minecraft 1.19 runs them, from a queue where a called
+# function's commands go in front of the rest, and a tick function stops after
+# maxCommandChainLength of them. The parts of the world that aren't generated are stood in for:
+# the number block tags, the suso.str string library, and the datapack's load and tick functions.
+
+import collections, copy, io, json, math, os, random, re, sys
+
+from common import *
+
+DATAPACK_PATH = 'datapacks/craftyfunge'
+CHAIN_LENGTH = 65536 # The maxCommandChainLength game rule's default
+
+START_FUNCTION = 'craftyfunge:start'
+STEP_FUNCTION = 'craftyfunge:run_step'
+
+# Stand-ins for the datapack's own load and tick functions, used if no loaded pack has any
+LOAD_FUNCTION = 'craftyfunge:init_scoreboard'
+TICK_FUNCTION = 'craftyfunge:run'
+
+# Where the program goes, and the entities with books of input and stack values two blocks above them
+PROGRAM_ORIGIN = (0, 100, 0)
+BOOK_POSITIONS = {'Input': (-20, 100, -20), 'Prepop': (-22, 100, -20)}
+
+MAX_TICKS = 1000000
+
+Context = collections.namedtuple('Context', ['executor', 'pos'])
+
+
+# A command failing in game, which only stops that command
+class CommandError(Exception):
+    pass
+
+
+def int32(n):
+    return (n + 2**31) % 2**32 - 2**31
+
+
+def bareName(name):
+    return name[10:] if name.startswith('minecraft:') else name
+
+
+# Splits a command into arguments at spaces, keeping anything quoted or in brackets together
+def splitCommand(line):
+    args = []
+    start = 0
+    depth = 0
+    quote = None
+    i = 0
+    while i < len(line):
+        c = line[i]
+        if quote is not None:
+            if c == '\\':
+                i += 1
+            elif c == quote:
+                quote = None
+        elif c in '"\'':
+            quote = c
+        elif c in '[{':
+            depth += 1
+        elif c in ']}':
+            depth -= 1
+        elif c == ' ' and depth == 0:
+            if i > start:
+                args.append(line[start:i])
+            start = i + 1
+        i += 1
+
+    if start < len(line):
+        args.append(line[start:])
+    return args
+
+
+# Reads SNBT, the text form of NBT, into dicts, lists, strings, and numbers. Number types are dropped
+class SnbtReader():
+    NUMBER = re.compile(r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?([bBsSlLfFdD]?)')
+
+    def __init__(self, s, i=0):
+        self.s = s
+        self.i = i
+
+
+    def skipSpaces(self):
+        while self.i < len(self.s) and self.s[self.i] == ' ':
+            self.i += 1
+
+
+    def expect(self, c):
+        self.skipSpaces()
+        if self.s[self.i:self.i+1] != c:
+            raise ValueError(f'Expected "{c}" at {self.i} in {self.s}')
+        self.i += 1
+
+
+    def peek(self):
+        self.skipSpaces()
+        return self.s[self.i:self.i+1]
+
+
+    def read(self):
+        c = self.peek()
+        if c == '{':
+            self.i += 1
+            compound = dict()
+            while self.peek() != '}':
+                key = self.readString()
+                self.expect(':')
+                compound[key] = self.read()
+                if self.peek() == ',':
+                    self.i += 1
+            self.i += 1
+            return compound
+
+        if c == '[':
+            self.i += 1
+            # Arrays like [I;1,2,3] read as lists
+            if self.s[self.i+1:self.i+2] == ';':
+                self.i += 2
+            items = []
+            while self.peek() != ']':
+                items.append(self.read())
+                if self.peek() == ',':
+                    self.i += 1
+            self.i += 1
+            return items
+
+        if c in '"\'':
+            return self.readString()
+
+        word = self.readString()
+        match = SnbtReader.NUMBER.fullmatch(word)
+        if match is not None:
+            suffix = match.group(1).lower()
+            number = word[:len(word)-len(suffix)]
+            if suffix in ('f', 'd') or '.' in number or 'e' in number.lower():
+                return float(number)
+            return int(number)
+        if word in ('true', 'false'):
+            return int(word == 'true')
+        return word
+
+
+    def readString(self):
+        self.skipSpaces()
+        quote = self.s[self.i]
+        if quote not in '"\'':
+            start = self.i
+            while self.i < len(self.s) and (self.s[self.i].isalnum() or self.s[self.i] in '_-.+'):
+                self.i += 1
+            return self.s[start:self.i]
+
+        chars = []
+        self.i += 1
+        while self.s[self.i] != quote:
+            if self.s[self.i] == '\\':
+                self.i += 1
+            chars.append(self.s[self.i])
+            self.i += 1
+        self.i += 1
+        return ''.join(chars)
+
+
+def parseSnbt(s):
+    return SnbtReader(s).read()
+
+
+# Splits an NBT path like "Items[0].tag.pages[0]" into its nodes. A compound at the start matches the root against it
+def parsePath(path):
+    nodes = []
+    i = 0
+    while i < len(path):
+        c = path[i]
+        if c == '.':
+            i += 1
+        elif c == '{':
+            reader = SnbtReader(path, i)
+            nodes.append(('match', reader.read()))
+            i = reader.i
+        elif c == '[':
+            end = path.index(']', i)
+            nodes.append(('all', None) if end == i+1 else ('index', int(path[i+1:end])))
+            i = end + 1
+        elif c in '"\'':
+            reader = SnbtReader(path, i)
+            nodes.append(('key', reader.readString()))
+            i = reader.i
+        else:
+            start = i
+            while i < len(path) and path[i] not in '.[{':
+                i += 1
+            nodes.append(('key', path[start:i]))
+    return nodes
+
+
+# Whether a value has everything a pattern does, like Minecraft matches NBT
+def matchesNbt(value, pattern):
+    if isinstance(pattern, dict):
+        return isinstance(value, dict) and all(key in value and matchesNbt(value[key], item) for key, item in pattern.items())
+    return value == pattern
+
+
+def stepPath(values, node):
+    kind, arg = node
+    found = []
+    for value in values:
+        if kind == 'key':
+            if isinstance(value, dict) and arg in value:
+                found.append(value[arg])
+        elif kind == 'index':
+            if isinstance(value, list) and -len(value) <= arg < len(value):
+                found.append(value[arg])
+        elif kind == 'all':
+            if isinstance(value, list):
+                found.extend(value)
+        elif matchesNbt(value, arg):
+            found.append(value)
+    return found
+
+
+def getPath(root, path):
+    values = [root]
+    for node in path:
+        values = stepPath(values, node)
+    return values
+
+
+# What holds the values a path points to, making any missing compounds and lists on the way
+def getParents(root, path):
+    parents = [root]
+    for node, nextNode in zip(path, path[1:]):
+        if node[0] == 'key':
+            for parent in parents:
+                if isinstance(parent, dict) and node[1] not in parent:
+                    parent[node[1]] = [] if nextNode[0] in ('index', 'all') else dict()
+        parents = stepPath(parents, node)
+    return parents
+
+
+# Sets what a path points to, giving how many values changed
+def setPath(root, path, value):
+    kind, arg = path[-1]
+    changed = 0
+    for parent in getParents(root, path):
+        if kind == 'key' and isinstance(parent, dict):
+            if arg not in parent or parent[arg] != value:
+                parent[arg] = copy.deepcopy(value)
+                changed += 1
+        elif kind == 'index' and isinstance(parent, list) and -len(parent) <= arg < len(parent):
+            if parent[arg] != value:
+                parent[arg] = copy.deepcopy(value)
+                changed += 1
+    return changed
+
+
+# The lists a path points to, making the list if it's missing from a compound
+def getLists(root, path):
+    kind, arg = path[-1]
+    if kind == 'key':
+        for parent in getParents(root, path):
+            if isinstance(parent, dict):
+                parent.setdefault(arg, [])
+    return [value for value in getPath(root, path) if isinstance(value, list)]
+
+
+def removePath(root, path):
+    kind, arg = path[-1]
+    removed = 0
+    for parent in getPath(root, path[:-1]):
+        if kind == 'key' and isinstance(parent, dict) and arg in parent:
+            del parent[arg]
+            removed += 1
+        elif kind == 'index' and isinstance(parent, list) and -len(parent) <= arg < len(parent):
+            del parent[arg]
+            removed += 1
+    return removed
+
+
+# Reads a block like "minecraft:piston[facing=north]", giving its name, states, and NBT. Tags keep their #
+def parseBlock(arg):
+    nbt = None
+    if arg.endswith('}'):
+        start = arg.index('{')
+        nbt = parseSnbt(arg[start:])
+        arg = arg[:start]
+
+    states = dict()
+    if arg.endswith(']'):
+        start = arg.index('[')
+        states = dict(pair.split('=') for pair in arg[start+1:-1].split(',') if pair)
+        arg = arg[:start]
+
+    name = '#' + arg[1:] if arg.startswith('#') else bareName(arg)
+    return name, states, nbt
+
+
+# Number block tags, which are written by hand in the world's datapack
+def getNumberTags():
+    tags = dict()
+    for exp, blockType in NUM_TYPES:
+        tags[f'craftyfunge:{blockType}'] = (['white_concrete'] if exp == 0 else []) + [f'{color}_{blockType}' for color in COLORS]
+    tags['craftyfunge:numbers'] = [f'#{name}' for name in tags]
+    return tags
+
+
+# Schedule times like 0.1s, 20t, or 1d in ticks
+def parseTime(arg):
+    units = {'t': 1, 's': 20, 'd': 24000}
+    if arg[-1] in units:
+        return max(1, round(float(arg[:-1]) * units[arg[-1]]))
+    return max(1, int(arg))
+
+
+def parseRange(arg):
+    if '..' not in arg:
+        return int(arg), int(arg)
+    low, high = arg.split('..')
+    return (int(low) if low else None), (int(high) if high else None)
+
+
+# Reads a datapack folder's files by their path in the pack
+def readDatapack(path):
+    files = dict()
+    for root, _, names in os.walk(os.path.join(path, 'data')):
+        for name in names:
+            filename = os.path.join(root, name)
+            with open(filename, 'r', encoding='utf-8') as f:
+                files[os.path.relpath(filename, path).replace(os.sep, '/')] = f.read()
+    return files
+
+
+# Functions in datapack files by name, without blank lines or comments
+def getFunctions(files):
+    functions = dict()
+    for path, text in files.items():
+        parts = path.split('/', 3)
+        if len(parts) == 4 and parts[0] == 'data' and parts[2] == 'functions' and parts[3].endswith('.mcfunction'):
+            lines = [line.strip() for line in text.splitlines()]
+            functions[f'{parts[1]}:{parts[3][:-11]}'] = [line for line in lines if line and not line.startswith('#')]
+    return functions
+
+
+class Entity():
+    def __init__(self, type, pos, tags, uuid):
+        self.type = type
+        self.data = {'Pos': list(pos), 'Tags': list(tags), 'UUID': uuid}
+
+
+    @property
+    def pos(self):
+        return tuple(self.data['Pos'])
+
+
+    @property
+    def tags(self):
+        return self.data['Tags']
+
+
+class McSim():
+    def __init__(self, seed=None, chainLength=CHAIN_LENGTH):
+        self.random = random.Random(seed)
+        self.chainLength = chainLength
+
+        # Datapacks
+        self.functions = dict() # Name to its lines
+        self.blockTags = getNumberTags()
+        self.functionTags = dict()
+        self.tagCache = dict()
+        self.compiled = dict()  # Command line to the function that runs it
+        self.builtins = {
+            'suso.str:call'             : self.susoCall,
+            'suso.str:charsets/ascii'   : self.susoCharsets,
+        }
+
+        # World
+        self.objectives = dict() # Objective to player to score
+        self.storage = dict()
+        self.blocks = dict()     # Position to (name, states). Missing positions are air
+        self.blockData = dict()
+        self.entities = []
+        self.scheduled = dict()  # Tick to functions run then
+        self.chat = []
+
+        # Running functions
+        self.queue = collections.deque()
+        self.nested = []
+        self.step = None
+        self.ticks = 0
+
+        # Counts
+        self.commands = 0
+        self.functionCommands = collections.Counter()
+        self.stepLabels = []    # Block and mode each step started on
+        self.stepCommands = []
+        self.tickCommands = []
+        self.truncated = 0      # Times a function hit the chain length
+        self.missing = set()    # Functions and objectives used without being there
+
+
+    def loadDatapack(self, path):
+        self.loadFiles(readDatapack(path))
+
+
+    # Takes a datapack's files by their path in the pack, like "data/craftyfunge/functions/move.mcfunction"
+    def loadFiles(self, files):
+        self.functions.update(getFunctions(files))
+        for path, text in files.items():
+            parts = path.split('/')
+            if len(parts) < 4 or parts[0] != 'data':
+                continue
+
+            namespace, kind, rest = parts[1], parts[2], '/'.join(parts[3:])
+            if kind == 'tags' and rest.endswith('.json') and '/' in rest:
+                category, name = rest[:-5].split('/', 1)
+                table = {'blocks': self.blockTags, 'functions': self.functionTags}.get(category)
+                if table is not None:
+                    tag = json.loads(text)
+                    name = f'{namespace}:{name}'
+                    table[name] = ([] if tag.get('replace') else table.get(name, [])) + tag['values']
+
+        self.tagCache.clear()
+
+
+    # Blocks in a block tag, without minecraft:
+    def getTagBlocks(self, name):
+        if name not in self.tagCache:
+            blocks = set()
+            for value in self.blockTags.get(name, []):
+                if value.startswith('#'):
+                    blocks |= self.getTagBlocks(value[1:])
+                else:
+                    blocks.add(bareName(value))
+            self.tagCache[name] = blocks
+        return self.tagCache[name]
+
+
+    # Functions run on load or each tick, standing in for the datapack's own if nothing gives any
+    def getTagFunctions(self, tag, standIn):
+        functions = list(self.functionTags.get(tag, []))
+        if not any(function.startswith('craftyfunge:') for function in functions):
+            functions.insert(0, standIn)
+        return functions
+
+
+    # Scores
+    def getObjective(self, objective):
+        if objective not in self.objectives:
+            self.missing.add(f'objective {objective}')
+            raise CommandError(f'Unknown scoreboard objective "{objective}"')
+        return self.objectives[objective]
+
+
+    def getScore(self, player, objective):
+        scores = self.getObjective(objective)
+        if player not in scores:
+            raise CommandError(f'No score for {player} in {objective}')
+        return scores[player]
+
+
+    def hasScore(self, player, objective, value):
+        return self.objectives.get(objective, dict()).get(player) == value
+
+
+    def setScore(self, player, objective, value):
+        self.getObjective(objective)[player] = int32(value)
+        return self.objectives[objective][player]
+
+
+    # Blocks
+    def getBlock(self, pos):
+        return self.blocks.get(pos, ('air', dict()))
+
+
+    def setBlock(self, pos, name, states=dict(), nbt=None):
+        if name == 'air':
+            self.blocks.pop(pos, None)
+        else:
+            self.blocks[pos] = (name, states)
+
+        self.blockData.pop(pos, None)
+        if nbt is not None:
+            self.blockData[pos] = copy.deepcopy(nbt)
+
+
+    def summon(self, type, pos, tags=()):
+        entity = Entity(f'minecraft:{bareName(type)}', pos, tags, [int32(self.random.getrandbits(32)) for _ in range(4)])
+        self.entities.append(entity)
+        return entity
+
+
+    def getTagged(self, tag):
+        for entity in self.entities:
+            if tag in entity.tags:
+                return entity
+
+
+    # Commands are turned into functions of the context once, the first time they run
+    def getCommand(self, line):
+        command = self.compiled.get(line)
+        if command is None:
+            command = self.compile(splitCommand(line))
+            self.compiled[line] = command
+        return command
+
+
+    def compile(self, args):
+        compilers = {
+            'execute'   : self.compileExecute,
+            'scoreboard': self.compileScoreboard,
+            'function'  : self.compileFunction,
+            'schedule'  : self.compileSchedule,
+            'data'      : self.compileData,
+            'setblock'  : self.compileSetblock,
+            'fill'      : self.compileFill,
+            'clone'     : self.compileClone,
+            'tp'        : self.compileTp,
+            'teleport'  : self.compileTp,
+            'summon'    : self.compileSummon,
+            'kill'      : self.compileKill,
+            'tellraw'   : self.compileTellraw,
+        }
+        if args[0] in ('team', 'playsound'):
+            return lambda ctx: 1
+        if args[0] not in compilers:
+            raise ValueError(f'Unsupported command "{" ".join(args)}"')
+        return compilers[args[0]](args[1:])
+
+
+    # Selectors are functions of the context giving entities. There are no players
+    def compileSelector(self, arg):
+        if arg == '@s':
+            return lambda ctx: [ctx.executor] if ctx.executor is not None else []
+        if arg[:2] in ('@a', '@p', '@r'):
+            return lambda ctx: []
+        if not arg.startswith('@e'):
+            raise ValueError(f'Unsupported selector "{arg}"')
+
+        checks = []
+        limit = None
+        for option in (arg[3:-1].split(',') if arg.endswith(']') else []):
+            key, value = option.split('=')
+            inverted = value.startswith('!')
+            value = value.lstrip('!')
+            if key == 'type':
+                value = f'minecraft:{bareName(value)}'
+                checks.append(lambda entity, value=value, inverted=inverted: (entity.type == value) != inverted)
+            elif key == 'tag':
+                checks.append(lambda entity, value=value, inverted=inverted: (value in entity.tags) != inverted)
+            elif key == 'limit':
+                limit = int(value)
+            elif key != 'sort':
+                raise ValueError(f'Unsupported selector option "{option}"')
+
+        def select(ctx):
+            found = [entity for entity in self.entities if all(check(entity) for check in checks)]
+            return found if limit is None else found[:limit]
+        return select
+
+
+    # Positions are functions of the context. Whole numbers are put in the middle of their block, like tp and summon do
+    def compileCoords(self, args, center=False):
+        axes = []
+        for axis, arg in enumerate(args):
+            if arg.startswith('~'):
+                axes.append((True, float(arg[1:] or 0)))
+            else:
+                value = float(arg)
+                if center and axis != 1 and '.' not in arg:
+                    value += 0.5
+                axes.append((False, value))
+        return lambda ctx: tuple(ctx.pos[axis] + value if relative else value for axis, (relative, value) in enumerate(axes))
+
+
+    def compileBlockPos(self, args):
+        getPos = self.compileCoords(args)
+        return lambda ctx: tuple(math.floor(n) for n in getPos(ctx))
+
+
+    def compileBlockTest(self, arg):
+        name, states, nbt = parseBlock(arg)
+
+        def test(pos):
+            blockName, blockStates = self.getBlock(pos)
+            if name.startswith('#'):
+                if blockName not in self.getTagBlocks(name[1:]):
+                    return False
+            elif blockName != name:
+                return False
+            if any(blockStates.get(key) != value for key, value in states.items()):
+                return False
+            return nbt is None or matchesNbt(self.blockData.get(pos), nbt)
+        return test
+
+
+    # Where data commands read and write, as a function of the context giving the root compound, and the arguments used
+    def compileDataTarget(self, args):
+        kind = args[0]
+        if kind == 'storage':
+            name = args[1]
+            return (lambda ctx: self.storage.setdefault(name, dict())), 2
+        if kind == 'entity':
+            select = self.compileSelector(args[1])
+            def getEntity(ctx):
+                entities = select(ctx)
+                if len(entities) != 1:
+                    raise CommandError(f'Expected one entity, found {len(entities)}')
+                return entities[0].data
+            return getEntity, 2
+        if kind == 'block':
+            getPos = self.compileBlockPos(args[1:4])
+            def getBlockData(ctx):
+                data = self.blockData.get(getPos(ctx))
+                if data is None:
+                    raise CommandError('Not a block entity')
+                return data
+            return getBlockData, 4
+        raise ValueError(f'Unsupported data target "{kind}"')
+
+
+    # Execute conditions give how many things matched, and how many arguments they used
+    def compileCondition(self, args):
+        kind = args[0]
+        if kind == 'score':
+            player, objective = args[1], args[2]
+            if args[3] == 'matches':
+                low, high = parseRange(args[4])
+                def testRange(ctx):
+                    value = self.objectives.get(objective, dict()).get(player)
+                    return int(value is not None and (low is None or value >= low) and (high is None or value <= high))
+                return testRange, 5
+
+            op, otherPlayer, otherObjective = args[3], args[4], args[5]
+            compare = {'<': int.__lt__, '<=': int.__le__, '=': int.__eq__, '>=': int.__ge__, '>': int.__gt__}[op]
+            def testCompare(ctx):
+                value = self.objectives.get(objective, dict()).get(player)
+                other = self.objectives.get(otherObjective, dict()).get(otherPlayer)
+                return int(value is not None and other is not None and compare(value, other))
+            return testCompare, 6
+
+        if kind == 'block':
+            getPos = self.compileBlockPos(args[1:4])
+            test = self.compileBlockTest(args[4])
+            return (lambda ctx: int(test(getPos(ctx)))), 5
+
+        if kind == 'blocks':
+            getStart, getEnd, getDest = (self.compileBlockPos(args[i:i+3]) for i in (1, 4, 7))
+            masked = args[10] == 'masked'
+            def testBlocks(ctx):
+                low, high, dest = self.getRegion(getStart(ctx), getEnd(ctx), getDest(ctx))
+                count = 0
+                for offset in self.regionOffsets(low, high):
+                    source = self.getBlock(tuple(l + o for l, o in zip(low, offset)))
+                    if masked and source[0] == 'air':
+                        continue
+                    if source != self.getBlock(tuple(d + o for d, o in zip(dest, offset))):
+                        return 0
+                    count += 1
+                return count
+            return testBlocks, 11
+
+        if kind == 'data':
+            getRoot, used = self.compileDataTarget(args[1:])
+            path = parsePath(args[1+used])
+            def testData(ctx):
+                try:
+                    return len(getPath(getRoot(ctx), path))
+                except CommandError:
+                    return 0
+            return testData, 2+used
+
+        if kind == 'entity':
+            select = self.compileSelector(args[1])
+            return (lambda ctx: len(select(ctx))), 2
+
+        raise ValueError(f'Unsupported execute condition "{kind}"')
+
+
+    # Where execute store puts a result, as a function of the context and the result
+    def compileStore(self, args):
+        kind = args[0]
+        if kind == 'score':
+            player, objective = args[1], args[2]
+            return (lambda ctx, result: self.setScore(player, objective, result)), 3
+
+        getRoot, used = self.compileDataTarget(args)
+        path = parsePath(args[used])
+        type, scale = args[used+1], float(args[used+2])
+        def store(ctx, result):
+            value = result * scale
+            setPath(getRoot(ctx), path, value if type in ('float', 'double') else int(value))
+        return store, used+3
+
+
+    def compileExecute(self, args):
+        steps = []
+        run = None
+        i = 0
+        while i < len(args):
+            sub = args[i]
+            if sub == 'run':
+                run = self.compile(args[i+1:])
+                break
+            elif sub == 'as':
+                select = self.compileSelector(args[i+1])
+                steps.append(('fork', lambda ctx, select=select: [ctx._replace(executor=entity) for entity in select(ctx)]))
+                i += 2
+            elif sub == 'at':
+                select = self.compileSelector(args[i+1])
+                steps.append(('fork', lambda ctx, select=select: [ctx._replace(pos=entity.pos) for entity in select(ctx)]))
+                i += 2
+            elif sub == 'positioned':
+                getPos = self.compileCoords(args[i+1:i+4])
+                steps.append(('fork', lambda ctx, getPos=getPos: [ctx._replace(pos=getPos(ctx))]))
+                i += 4
+            elif sub in ('if', 'unless'):
+                test, used = self.compileCondition(args[i+1:])
+                steps.append((sub, test))
+                i += 1 + used
+            elif sub == 'store':
+                store, used = self.compileStore(args[i+2:])
+                steps.append(('store_' + args[i+1], store))
+                i += 2 + used
+            else:
+                raise ValueError(f'Unsupported execute subcommand "{sub}"')
+
+        # Without run, the last condition is the result
+        last = None
+        if run is None:
+            last = steps.pop()
+
+        def execute(ctx):
+            branches = [(ctx, ())]
+            for kind, fn in steps:
+                if kind == 'fork':
+                    branches = [(newCtx, stores) for branchCtx, stores in branches for newCtx in fn(branchCtx)]
+                elif kind == 'if':
+                    branches = [branch for branch in branches if fn(branch[0])]
+                elif kind == 'unless':
+                    branches = [branch for branch in branches if not fn(branch[0])]
+                else:
+                    branches = [(branchCtx, stores + ((kind, fn),)) for branchCtx, stores in branches]
+
+            successes = 0
+            for branchCtx, stores in branches:
+                if last is None:
+                    try:
+                        result = run(branchCtx)
+                        success = 1
+                    except CommandError:
+                        result = success = 0
+                else:
+                    kind, test = last
+                    count = test(branchCtx)
+                    success = int(bool(count) == (kind == 'if'))
+                    result = (count if kind == 'if' else 1) if success else 0
+
+                successes += success
+                for kind, store in stores:
+                    store(branchCtx, success if kind == 'store_success' else result)
+
+            if last is not None and not successes:
+                raise CommandError('Test failed')
+            return successes
+        return execute
+
+
+    def compileScoreboard(self, args):
+        if args[0] == 'objectives':
+            if args[1] == 'add':
+                name = args[2]
+                return lambda ctx: self.objectives.setdefault(name, dict()) is not None
+            return lambda ctx: 1
+
+        action, player = args[1], args[2]
+        objective = args[3] if len(args) > 3 else None
+        if action == 'set':
+            value = int(args[4])
+            return lambda ctx: self.setScore(player, objective, value)
+        if action in ('add', 'remove'):
+            value = int(args[4]) * (1 if action == 'add' else -1)
+            return lambda ctx: self.setScore(player, objective, self.getObjective(objective).get(player, 0) + value)
+        if action == 'get':
+            return lambda ctx: self.getScore(player, objective)
+        if action == 'reset':
+            def reset(ctx):
+                for name, scores in self.objectives.items():
+                    if objective in (None, name):
+                        if player == '*':
+                            scores.clear()
+                        else:
+                            scores.pop(player, None)
+                return 1
+            return reset
+        if action == 'operation':
+            op, otherPlayer, otherObjective = args[4], args[5], args[6]
+            if op == '><':
+                def swap(ctx):
+                    scores, otherScores = self.getObjective(objective), self.getObjective(otherObjective)
+                    scores[player], otherScores[otherPlayer] = otherScores.get(otherPlayer, 0), scores.get(player, 0)
+                    return 1
+                return swap
+
+            # Division and modulo round down, and do nothing when dividing by zero
+            operations = {
+                '='     : lambda a, b: b,
+                '+='    : lambda a, b: a + b,
+                '-='    : lambda a, b: a - b,
+                '*='    : lambda a, b: a * b,
+                '/='    : lambda a, b: a // b if b else a,
+                '%='    : lambda a, b: a % b if b else a,
+                '<'     : min,
+                '>'     : max,
+            }
+            operation = operations[op]
+            def operate(ctx):
+                scores, otherScores = self.getObjective(objective), self.getObjective(otherObjective)
+                return self.setScore(player, objective, operation(scores.get(player, 0), otherScores.setdefault(otherPlayer, 0)))
+            return operate
+        raise ValueError(f'Unsupported scoreboard command "{action}"')
+
+
+    # Calls go in front of the queue once the command that made them is done
+    def compileFunction(self, args):
+        name = args[0]
+        def call(ctx):
+            self.nested.append((name, None, ctx, self.step))
+            return 1
+        return call
+
+
+    def compileSchedule(self, args):
+        name, delay = args[1], parseTime(args[2])
+        def schedule(ctx):
+            for functions in self.scheduled.values():
+                if name in functions:
+                    functions.remove(name)
+            self.scheduled.setdefault(self.ticks + delay, []).append(name)
+            return 1
+        return schedule
+
+
+    def compileData(self, args):
+        action = args[0]
+        getRoot, used = self.compileDataTarget(args[1:])
+        rest = args[1+used:]
+
+        if action == 'get':
+            path = parsePath(rest[0])
+            scale = float(rest[1]) if len(rest) > 1 else None
+            def get(ctx):
+                values = getPath(getRoot(ctx), path)
+                if len(values) != 1:
+                    raise CommandError(f'Found {len(values)} elements')
+                value = values[0]
+                if isinstance(value, (int, float)):
+                    return math.floor(value * (1 if scale is None else scale))
+                return len(value)
+            return get
+
+        if action == 'remove':
+            path = parsePath(rest[0])
+            def remove(ctx):
+                removed = removePath(getRoot(ctx), path)
+                if not removed:
+                    raise CommandError('Nothing removed')
+                return removed
+            return remove
+
+        if action != 'modify':
+            raise ValueError(f'Unsupported data command "{action}"')
+
+        path = parsePath(rest[0])
+        op = rest[1]
+        rest = rest[2:]
+        index = None
+        if op == 'insert':
+            index = int(rest[0])
+            rest = rest[1:]
+
+        # The new value, either written out or copied from somewhere
+        if rest[0] == 'value':
+            constant = parseSnbt(' '.join(rest[1:]))
+            getSource = lambda ctx: [constant]
+        else:
+            getSourceRoot, sourceUsed = self.compileDataTarget(rest[1:])
+            sourcePath = parsePath(rest[1+sourceUsed])
+            def getSource(ctx):
+                values = getPath(getSourceRoot(ctx), sourcePath)
+                if not values:
+                    raise CommandError('Found no elements')
+                return values
+
+        def modify(ctx):
+            values = getSource(ctx)
+            root = getRoot(ctx)
+            changed = 0
+            if op == 'set':
+                changed = setPath(root, path, values[-1])
+            else:
+                for target in getLists(root, path):
+                    # Negative indices count from after the end, so -1 appends
+                    at = {'append': len(target), 'prepend': 0}.get(op, index if index is None or index >= 0 else len(target) + index + 1)
+                    if not 0 <= at <= len(target):
+                        raise CommandError('Index out of bounds')
+                    target[at:at] = copy.deepcopy(values)
+                    changed += len(values)
+            if not changed:
+                raise CommandError('Nothing changed')
+            return changed
+        return modify
+
+
+    def compileSetblock(self, args):
+        getPos = self.compileBlockPos(args[:3])
+        name, states, nbt = parseBlock(args[3])
+        def setblock(ctx):
+            pos = getPos(ctx)
+            if nbt is None and self.getBlock(pos) == (name, states):
+                raise CommandError('Could not set the block')
+            self.setBlock(pos, name, states, nbt)
+            return 1
+        return setblock
+
+
+    @staticmethod
+    def getRegion(start, end, dest=None):
+        low = tuple(map(min, start, end))
+        high = tuple(map(max, start, end))
+        return low, high, dest
+
+
+    @staticmethod
+    def regionOffsets(low, high):
+        for dx in range(high[0] - low[0] + 1):
+            for dy in range(high[1] - low[1] + 1):
+                for dz in range(high[2] - low[2] + 1):
+                    yield (dx, dy, dz)
+
+
+    def compileFill(self, args):
+        getStart, getEnd = self.compileBlockPos(args[:3]), self.compileBlockPos(args[3:6])
+        name, states, nbt = parseBlock(args[6])
+        def fill(ctx):
+            low, high, _ = self.getRegion(getStart(ctx), getEnd(ctx))
+            changed = 0
+            for offset in self.regionOffsets(low, high):
+                pos = tuple(l + o for l, o in zip(low, offset))
+                if nbt is not None or self.getBlock(pos) != (name, states):
+                    self.setBlock(pos, name, states, nbt)
+                    changed += 1
+            if not changed:
+                raise CommandError('No blocks were filled')
+            return changed
+        return fill
+
+
+    # Moving clears the source before placing, so the source and destination can overlap
+    def compileClone(self, args):
+        getStart, getEnd, getDest = (self.compileBlockPos(args[i:i+3]) for i in (0, 3, 6))
+        masked = 'masked' in args[9:]
+        move = 'move' in args[9:]
+        def clone(ctx):
+            low, high, dest = self.getRegion(getStart(ctx), getEnd(ctx), getDest(ctx))
+            copied = []
+            for offset in self.regionOffsets(low, high):
+                pos = tuple(l + o for l, o in zip(low, offset))
+                block = self.getBlock(pos)
+                if not (masked and block[0] == 'air'):
+                    copied.append((offset, pos, block, self.blockData.get(pos)))
+
+            if move:
+                for _, pos, _, _ in copied:
+                    self.setBlock(pos, 'air')
+            for offset, _, (name, states), nbt in copied:
+                self.setBlock(tuple(d + o for d, o in zip(dest, offset)), name, states, nbt)
+
+            if not copied:
+                raise CommandError('No blocks were cloned')
+            return len(copied)
+        return clone
+
+
+    def compileTp(self, args):
+        if len(args) in (1, 3):
+            args = ['@s'] + args
+        select = self.compileSelector(args[0])
+
+        if len(args) == 2:
+            getDest = self.compileSelector(args[1])
+            def getPos(ctx):
+                dest = getDest(ctx)
+                if len(dest) != 1:
+                    raise CommandError('Expected one entity to teleport to')
+                return dest[0].pos
+        else:
+            getPos = self.compileCoords(args[1:4], center=True)
+
+        def tp(ctx):
+            entities = select(ctx)
+            if not entities:
+                raise CommandError('No entity was found')
+            pos = getPos(ctx)
+            for entity in entities:
+                entity.data['Pos'] = list(pos)
+            return len(entities)
+        return tp
+
+
+    def compileSummon(self, args):
+        getPos = self.compileCoords(args[1:4] if len(args) >= 4 else ['~', '~', '~'], center=True)
+        nbt = parseSnbt(args[4]) if len(args) > 4 else dict()
+        return lambda ctx: self.summon(args[0], getPos(ctx), nbt.get('Tags', [])) and 1
+
+
+    def compileKill(self, args):
+        select = self.compileSelector(args[0] if args else '@s')
+        def kill(ctx):
+            entities = select(ctx)
+            if not entities:
+                raise CommandError('No entity was found')
+            self.entities = [entity for entity in self.entities if entity not in entities]
+            return len(entities)
+        return kill
+
+
+    def compileTellraw(self, args):
+        component = json.loads(' '.join(args[1:]))
+        def tellraw(ctx):
+            self.chat.append(self.renderText(component))
+            return 1
+        return tellraw
+
+
+    # Text components as plain text. Interpreted NBT lists are read as lists of components
+    def renderText(self, component):
+        if isinstance(component, str):
+            return component
+        if isinstance(component, list):
+            return ''.join(self.renderText(part) for part in component)
+        if not isinstance(component, dict):
+            return str(component)
+
+        text = component.get('text', '')
+        if 'score' in component:
+            score = self.objectives.get(component['score']['objective'], dict()).get(component['score']['name'])
+            text += '' if score is None else str(score)
+        if 'nbt' in component and 'storage' in component:
+            for value in getPath(self.storage.get(component['storage'], dict()), parsePath(component['nbt'])):
+                if component.get('interpret') in (True, 'true'):
+                    if isinstance(value, str):
+                        try:
+                            value = json.loads(value)
+                        except ValueError:
+                            pass
+                    text += self.renderText(value)
+                else:
+                    text += json.dumps(value)
+        return text + ''.join(self.renderText(part) for part in component.get('extra', []))
+
+
+    # Stand-ins for suso.str. Calling it splits in.string into characters in out, then runs in.callback
+    def susoCall(self, ctx):
+        io = self.storage.setdefault('suso.str:io', dict())
+        inputs = io.get('in', dict())
+        io['out'] = list(inputs.get('string', ''))
+        if inputs.get('callback'):
+            self.nested.append(('suso.str:call', inputs['callback'], ctx, self.step))
+
+
+    def susoCharsets(self, ctx):
+        self.storage.setdefault('suso.str:internal', dict())['newline'] = '\n'
+
+
+    # Starts a function from nothing, like a tick or a command block does, running until the queue empties or hits the chain length
+    def runFunction(self, name, ctx=None):
+        if ctx is None:
+            ctx = Context(None, (0.0, 0.0, 0.0))
+
+        self.queue.append((name, None, ctx, None))
+        run = 0
+        while self.queue:
+            if run >= self.chainLength:
+                self.truncated += 1
+                self.queue.clear()
+                break
+
+            function, line, ctx, self.step = self.queue.popleft()
+            run += 1
+            if line is None:
+                self.callFunction(function, ctx)
+            else:
+                self.commands += 1
+                self.functionCommands[function] += 1
+                if self.step is not None:
+                    self.stepCommands[self.step] += 1
+                try:
+                    self.getCommand(line)(ctx)
+                except CommandError:
+                    pass
+
+            if self.nested:
+                self.queue.extendleft(reversed(self.nested))
+                self.nested.clear()
+
+
+    def callFunction(self, name, ctx):
+        if name in self.builtins:
+            self.builtins[name](ctx)
+            return
+        if name not in self.functions:
+            self.missing.add(f'function {name}')
+            return
+
+        # Each step is counted from when run_step is called
+        if name == STEP_FUNCTION:
+            self.step = len(self.stepCommands)
+            self.stepLabels.append(self.getStepLabel())
+            self.stepCommands.append(0)
+
+        self.queue.extendleft((name, line, ctx, self.step) for line in reversed(self.functions[name]))
+
+
+    # The block the IP is on, and its mode if it isn't the default
+    def getStepLabel(self):
+        fungie = self.getTagged('Fungie')
+        if fungie is None:
+            return 'none'
+        label = self.getBlock(tuple(math.floor(n) for n in fungie.pos))[0]
+        mode = self.objectives.get('mode', dict()).get('$ip')
+        if mode not in (None, Modes.DEFAULT):
+            label += f' ({MODE_NAMES[Modes(mode)]})'
+        return label
+
+
+    def tick(self):
+        self.ticks += 1
+        start = self.commands
+        for name in self.scheduled.pop(self.ticks, []):
+            self.runFunction(name)
+        for name in self.tickFunctions:
+            self.runFunction(name)
+        self.tickCommands.append(self.commands - start)
+
+
+    # Puts blocks laid out like CraftyFunge.blocks in the world, giving where their (0, 0, 0) went
+    def placeProgram(self, blocks, origin=PROGRAM_ORIGIN):
+        for x, plane in enumerate(blocks):
+            for y, column in enumerate(plane):
+                for z, block in enumerate(column):
+                    if block is not None:
+                        self.setBlock((origin[0]+x, origin[1]+y, origin[2]+z), bareName(block['Name']), dict(block.get('Properties', {})))
+        return origin
+
+
+    # Puts text in the book an Input or Prepop entity reads from
+    def setBook(self, tag, text):
+        x, y, z = BOOK_POSITIONS[tag]
+        if self.getTagged(tag) is None:
+            self.summon('armor_stand', (x+0.5, y, z+0.5), [tag])
+        self.setBlock((x, y+2, z), 'chest', nbt={'Items': [{'tag': {'pages': [text]}}]})
+
+
+    # Sets up the world and runs a program until it stops or hits a limit. Returns why it stopped early, if it did.
+    # Limits are checked between ticks, so with turbo running several steps a tick it can go past maxSteps
+    def runProgram(self, interp, inputText='', stack=(), turbo=None, maxSteps=None, maxTicks=MAX_TICKS, startFunction=START_FUNCTION):
+        origin = self.placeProgram(interp.blocks)
+        startPos = tuple(o + n for o, n in zip(origin, interp.offset))
+        self.setBook('Input', inputText)
+        self.setBook('Prepop', ' '.join(str(n) for n in stack))
+        for entityType, tag in (('magma_cube', 'Fungie'), ('armor_stand', 'Stacker'), ('armor_stand', 'VarSetter')):
+            if self.getTagged(tag) is None:
+                self.summon(entityType, (0.5, 0, 0.5), [tag])
+
+        self.tickFunctions = self.getTagFunctions('minecraft:tick', TICK_FUNCTION)
+        for name in self.getTagFunctions('minecraft:load', LOAD_FUNCTION):
+            self.runFunction(name)
+        if turbo is not None:
+            self.setScore('$ip', 'turbo', turbo)
+
+        # Run from the command block, at its middle
+        self.runFunction(startFunction, Context(None, tuple(n + 0.5 for n in startPos)))
+        while not self.hasScore('$ip', 'mode', Modes.STOPPED):
+            if maxSteps is not None and len(self.stepCommands) >= maxSteps:
+                return 'maxSteps'
+            if self.ticks >= maxTicks:
+                return 'maxTicks'
+            self.tick()
+
+
+    # What's been output, which is everything in the text buffer
+    def getOutput(self):
+        return self.renderText({'nbt': 'textBuffer', 'storage': 'craftyfunge:io', 'interpret': 'true'})
+
+
+    def getErrors(self):
+        return [message for message in self.chat if message.startswith('Error:')]
+
+
+    # The stack from bottom to top, from storage or decoded from the blocks under the Stacker
+    def getStack(self):
+        values = self.storage.get('craftyfunge:stack', dict()).get('values')
+        if values is not None:
+            return list(values)
+
+        stacker = self.getTagged('Stacker')
+        length = self.objectives.get('stacklen', dict()).get('$stack', 0)
+        if stacker is None:
+            return []
+        x, y, z = (math.floor(n) for n in stacker.pos)
+        stack = []
+        for depth in range(length-1, -1, -1):
+            value = sum(2**exp for exp in range(MAX_NUMBER_HEIGHT) if self.getBlock((x, y+exp, z-depth))[0] == 'iron_block')
+            if self.getBlock((x, y-1, z-depth))[0] == 'obsidian':
+                value = -value if value else MIN_VAL
+            stack.append(value)
+        return stack
+
+
+    def getSummary(self):
+        steps = len(self.stepCommands)
+        byLabel = dict()
+        for label, commands in zip(self.stepLabels, self.stepCommands):
+            byLabel.setdefault(label, []).append(commands)
+
+        return {
+            'steps'             : steps,
+            'ticks'             : self.ticks,
+            'commands'          : self.commands,
+            'commandsPerStep'   : {'mean': self.commands / steps if steps else 0, 'max': max(self.stepCommands, default=0)},
+            'commandsPerTick'   : {'mean': sum(self.tickCommands) / len(self.tickCommands) if self.tickCommands else 0, 'max': max(self.tickCommands, default=0)},
+            'truncated'         : self.truncated,
+            'blocks'            : {label: {'steps': len(counts), 'mean': sum(counts) / len(counts), 'max': max(counts)} for label, counts in sorted(byLabel.items())},
+            'functions'         : dict(self.functionCommands.most_common()),
+            'missing'           : sorted(self.missing),
+        }
+
+
+    def report(self, top=15):
+        summary = self.getSummary()
+        print(f'Ran {summary["steps"]} steps in {summary["ticks"]} ticks with {summary["commands"]} commands')
+        print(f'Commands per step: {summary["commandsPerStep"]["mean"]:.1f} on average, {summary["commandsPerStep"]["max"]} at most')
+        print(f'Commands per tick: {summary["commandsPerTick"]["mean"]:.1f} on average, {summary["commandsPerTick"]["max"]} at most')
+        if summary['truncated']:
+            print(f'A function stopped at the {self.chainLength} command chain length {summary["truncated"]} times')
+
+        if summary['blocks']:
+            print('\nCommands per step by block:')
+            width = max(len(label) for label in summary['blocks'])
+            print(f'  {"Block":<{width}}  {"Steps":>7}  {"Mean":>7}  {"Max":>5}')
+            for label, counts in sorted(summary['blocks'].items(), key=lambda item: -item[1]['mean'] * item[1]['steps']):
+                print(f'  {label:<{width}}  {counts["steps"]:>7}  {counts["mean"]:>7.1f}  {counts["max"]:>5}')
+
+        print(f'\nMost commands by function:')
+        for name, commands in list(summary['functions'].items())[:top]:
+            print(f'  {commands:>9}  {name}')
+
+        if summary['missing']:
+            print('\nUsed but not in any datapack: ' + ', '.join(summary['missing']), file=sys.stderr)
+
+
+# Runs a program in the interpreter and the simulator, giving what differs. Ints wrap at 32 bits in game
+def compare(sim, interp, inputText='', stack=(), maxSteps=None, **options):
+    from craftyfunge import CraftyFunge
+
+    stopped = sim.runProgram(interp, inputText, stack, maxSteps=maxSteps, **options)
+
+    # If the game stopped at a limit, the interpreter goes exactly as far
+    if stopped is not None:
+        maxSteps = len(sim.stepCommands)
+
+    reference = CraftyFunge(interp.programFile, False, input=io.StringIO(inputText), output=io.StringIO(), stack=list(stack), blocks=interp.blocks)
+    error = None
+    try:
+        while reference.running and (maxSteps is None or reference.steps < maxSteps):
+            reference.step()
+    except CraftyFungeError as e:
+        error = e.msg
+    except ValueError as e:
+        error = str(e)
+
+    # Double quotes are output as two single quotes in game
+    differences = []
+    expected = reference.output.getvalue().replace('"', "''")
+    if sim.getOutput() != expected:
+        differences.append(f'Output is {sim.getOutput()!r} in game and {expected!r} in the interpreter')
+    if options.get('startFunction', START_FUNCTION) == START_FUNCTION and len(sim.stepCommands) != reference.steps:
+        differences.append(f'Took {len(sim.stepCommands)} steps in game and {reference.steps} in the interpreter')
+    if sim.getStack() != [int32(n) for n in reference.stack]:
+        differences.append(f'Stack is {sim.getStack()} in game and {list(reference.stack)} in the interpreter')
+    if bool(sim.getErrors()) != (error is not None):
+        differences.append(f'Errors are {sim.getErrors()} in game and {error!r} in the interpreter')
+    if stopped is not None and reference.running != (stopped is not None):
+        differences.append(f'Stopped at {stopped} in game, but the interpreter finished')
+    return differences
+
+
+def parseArgs():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Run a CraftyFunge program on the generated datapack outside of Minecraft, counting the commands each step and tick take.')
+    parser.add_argument('filename', metavar='FILE', help='Which file to run. Must be an nbt file exported from a structure block.')
+    parser.add_argument('-w', dest='useWorldPath', action='store_true', help='Run a file from the configured structure block export location.')
+    parser.add_argument('-d', dest='datapacks', metavar='DATAPACK', action='append', default=[], help='Load the datapack folder DATAPACK. Can be given more than once. Defaults to the craftyfunge datapack of the world in world.cfg.')
+    parser.add_argument('-f', dest='startFunction', metavar='FUNCTION', default=START_FUNCTION, help=f'Start the program by running FUNCTION from its command block. Defaults to {START_FUNCTION}.')
+    parser.add_argument('-i', dest='input', metavar='INFILE', type=argparse.FileType('r'), default=None, help='Take input from INFILE. The program gets no input if not given.')
+    parser.add_argument('-s', '--stack', dest='stack', metavar='STACK', default='[]', help='Pre-populate the stack, like [1,2,3].')
+    parser.add_argument('-t', dest='turbo', metavar='STEPS', type=int, default=None, help='Set $ip turbo to STEPS after loading.')
+    parser.add_argument('-n', dest='maxSteps', metavar='STEPS', type=int, default=None, help='Stop after STEPS steps.')
+    parser.add_argument('-c', dest='compare', action='store_true', help='Also run the program in the interpreter, and exit with an error if the output, steps, stack, or errors differ.')
+    parser.add_argument('-j', dest='jsonOut', metavar='JSONFILE', default=None, help='Write the counts to JSONFILE.')
+    parser.add_argument('--seed', dest='seed', type=int, default=0, help='Seed for random directions. Defaults to 0.')
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    import craftyfunge
+    from craftyfunge import CraftyFunge
+
+    args = parseArgs()
+    if args.useWorldPath:
+        craftyfunge.WORLD_PATH = readConfig()
+
+    sim = McSim(args.seed)
+    for path in args.datapacks or [os.path.join(readConfig(), DATAPACK_PATH)]:
+        sim.loadDatapack(path)
+
+    interp = CraftyFunge(args.filename, args.useWorldPath, input=io.StringIO(), output=io.StringIO())
+    inputText = args.input.read() if args.input is not None else ''
+    stack = json.loads(args.stack)
+    options = {'turbo': args.turbo, 'startFunction': args.startFunction}
+
+    if args.compare:
+        differences = compare(sim, interp, inputText, stack, args.maxSteps, **options)
+    else:
+        stopped = sim.runProgram(interp, inputText, stack, maxSteps=args.maxSteps, **options)
+        if stopped is not None:
+            print(f'Stopped early at the {stopped} limit', file=sys.stderr)
+
+    print(sim.getOutput())
+    for message in sim.getErrors():
+        print(message, file=sys.stderr)
+    print()
+    sim.report()
+
+    if args.jsonOut is not None:
+        with open(args.jsonOut, 'w') as f:
+            json.dump(sim.getSummary(), f, indent=4)
+
+    if args.compare:
+        for difference in differences:
+            print(difference, file=sys.stderr)
+        if differences:
+            sys.exit(1)
+        print('\nMatches the interpreter')
@@ -0,0 +1,134 @@
+# Counts what a program did while running, for capacity planning
+# Copyright 2022 Eli Fox
+
+import collections, json, time
+
+from common import *
+
+VAR_BLOCKS = {GET_VAR, SET_VAR}
+
+
+# Collects per-run counters through the interpreter's hooks. Everything that can be read off the
+# interpreter at the end is, so the only per-step work is a count and a stack depth check
+class MetricsTracer():
+    def __init__(self, interp):
+        self.interp = interp
+
+        # Steps by mode, then by block. Mode changes swap which one is counted into
+        self.counts = collections.defaultdict(lambda: collections.defaultdict(int))
+        self.current = self.counts[interp.mode]
+
+        # Time is only measured at mode changes. Whatever isn't spent in another mode is spent in default
+        self.modeTimes = collections.defaultdict(float)
+        self.modeStart = None
+
+        self.maxStackDepth = len(interp.stack)
+        self.maxVarIndex = None
+        self.setBlockWrites = 0
+        self.bytesOut = 0
+        self.error = None
+
+
+    def onStep(self, block):
+        self.current[block] += 1
+
+        stack = self.interp.stack
+        if len(stack) > self.maxStackDepth:
+            self.maxStackDepth = len(stack)
+
+        # The index is on top of the stack when a var block runs
+        if block in VAR_BLOCKS and self.current is self.counts[Modes.DEFAULT]:
+            index = stack[-1] if stack else 0
+            if self.maxVarIndex is None or index > self.maxVarIndex:
+                self.maxVarIndex = index
+
+
+    # Runs the interpreter with onStep inlined, for when nothing else needs to see each step
+    def run(self):
+        interp = self.interp
+        current = self.current
+        defaultCounts = self.counts[Modes.DEFAULT]
+        maxStackDepth = self.maxStackDepth
+
+        try:
+            while interp.running:
+                block = interp.block = interp.getBlock(*interp.pos)
+                current[block] += 1
+
+                stack = interp.stack
+                if len(stack) > maxStackDepth:
+                    maxStackDepth = len(stack)
+                if block in VAR_BLOCKS and current is defaultCounts:
+                    index = stack[-1] if stack else 0
+                    if self.maxVarIndex is None or index > self.maxVarIndex:
+                        self.maxVarIndex = index
+
+                mode = interp.mode
+                interp.steps += 1
+                interp.runStep()
+
+                if interp.mode != mode:
+                    self.onModeChange(mode, interp.mode)
+                    current = self.current
+
+                # We don't move if we immediately did a goto command
+                if not interp.wentTo:
+                    interp.move()
+                interp.wentTo = False
+        finally:
+            self.maxStackDepth = maxStackDepth
+
+
+    def onModeChange(self, old, new):
+        now = time.perf_counter()
+        if self.modeStart is not None:
+            self.modeTimes[old] += now - self.modeStart
+        self.modeStart = now
+        self.current = self.counts[new]
+
+
+    def onSetBlock(self, pos, block):
+        self.setBlockWrites += 1
+
+
+    def onOutput(self, s):
+        self.bytesOut += len(s.encode())
+
+
+    def onEnd(self):
+        if self.modeStart is not None:
+            self.modeTimes[self.interp.mode] += time.perf_counter() - self.modeStart
+            self.modeStart = None
+
+
+    # Gets the metrics as a dict ready for JSON
+    def getMetrics(self):
+        interp = self.interp
+
+        modes = dict()
+        for mode, counts in self.counts.items():
+            modes[mode.name] = {'steps': sum(counts.values()), 'time': self.modeTimes[mode]}
+        # The rest of the run was in default mode
+        otherTime = sum(time for mode, time in self.modeTimes.items() if mode != Modes.DEFAULT)
+        modes.setdefault(Modes.DEFAULT.name, {'steps': 0})['time'] = max(interp.runTime - otherTime, 0.0)
+
+        opcodes = self.counts[Modes.DEFAULT]
+        return {
+            'program'        : interp.programName,
+            'steps'          : interp.steps,
+            'opcodes'        : dict(sorted(opcodes.items(), key=lambda item: (-item[1], item[0]))),
+            'modes'          : modes,
+            'maxStackDepth'  : self.maxStackDepth,
+            'maxVarIndex'    : self.maxVarIndex,
+            'setBlockWrites' : self.setBlockWrites,
+            'bytesIn'        : interp.inputBytes,
+            'bytesOut'       : self.bytesOut,
+            'parseTime'      : interp.parseTime,
+            'executeTime'    : interp.runTime,
+            'error'          : self.error,
+        }
+
+
+    def write(self, file):
+        json.dump(self.getMetrics(), file, indent=4)
+        print(file=file)
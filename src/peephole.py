@@ -0,0 +1,338 @@
+# Decodes straight runs of stack instructions, optimises them, and compiles them to Python
+# Copyright 2022 Eli Fox
+#
+# A run starts at a position and direction in default mode and follows the path until a block
+# that branches or does anything besides change the stack. Literals, tunnels, turns and skips
+# along the way are decoded into plain pushes. The ops are then rewritten with peephole rules
+# and compiled into one function.
+#
+# Pushing zero onto an empty stack does nothing and popping an empty stack gives zero, so as
+# long as there's no zero at the bottom of the stack, it behaves exactly like a stack with
+# endless zeros underneath. Every instruction in a run keeps it that way, so rewrites only
+# need to be right for that simpler stack. Only rotate and a stack given through the API can
+# leave a zero at the bottom, so runs aren't used when there is one.
+
+from common import *
+from instructions import VALID_COLORS
+
+MAX_RUN_LENGTH = 1024
+
+# Compiling a run costs about as much as running a few hundred steps, so only hot ones are
+HOT_THRESHOLD = 8
+
+# Ops for blocks that only change the stack, in default mode
+BLOCK_OPS = {
+    ADD: 'add', SUB: 'sub', MULT: 'mult', DIV: 'div', MOD: 'mod', EXP: 'exp',
+    NEG: 'neg', NOT: 'not', GREATER: 'greater', LESS: 'less',
+    DUP: 'dup', POP: 'pop', SWAP: 'swap', CLEAR: 'clear', PUSH_LEN: 'len',
+}
+
+# Blocks a run goes straight through in default mode without an op
+PATH_BLOCKS = {DIR, SKIP, PUSH_NEXT_BLOCK, PUSH_POS, TUNNEL, IN_NUM_LITERAL, IN_STR_LITERAL}
+INSTRUCTION_BLOCKS = set(BLOCKS_FOR_VALUES) | {IN_STR_LITERAL}
+
+# Binary ops by what they do to (second, top)
+BINARY_OPS = {
+    'add'     : (lambda a, b: a + b,                  '{a} + {b}'),
+    'sub'     : (lambda a, b: a - b,                  '{a} - {b}'),
+    'mult'    : (lambda a, b: a * b,                  '{a} * {b}'),
+    'div'     : (lambda a, b: a // b,                 '{a} // {b}'),
+    'mod'     : (lambda a, b: a % b,                  '{a} % {b}'),
+    'exp'     : (lambda a, b: a ** b if b > 1 else 0, '({a} ** {b} if {b} > 1 else 0)'),
+    'greater' : (lambda a, b: int(a > b),             'int({a} > {b})'),
+    'less'    : (lambda a, b: int(a < b),             'int({a} < {b})'),
+}
+UNARY_OPS = {
+    'neg' : (lambda a: -a,         '-{a}'),
+    'not' : (lambda a: int(not a), 'int(not {a})'),
+}
+
+# Exponents past this aren't folded, so a run's source stays small
+MAX_FOLDED_EXPONENT = 64
+
+
+# A decoded run, and where it leaves off
+class Run():
+    def __init__(self, ops, length, endPos, endDir):
+        self.ops = ops
+        self.length = length
+        self.endPos = endPos
+        self.endDir = endDir
+        self.optimized = optimize(ops)
+        self.function = compileOps(self.optimized)
+
+
+# Value of the block at a world pos, or None if it doesn't have one
+def blockValue(interp, pos):
+    block = interp.getBlock(*pos)
+    if block in BLOCKS_WITH_EXTRA_DATA:
+        block = (block, (('facing', interp.getFacing(*pos)), ))
+    return BLOCK_TO_VALUE.get(block)
+
+
+def ahead(pos, dir, n=1):
+    delta = DIRS_DEL[dir]
+    return [pos[xyz] + n*delta[xyz] for xyz in range(3)]
+
+
+# Follows the path from a position in default mode, getting ops until something a run can't do.
+# Returns None if the run would be too short to be worth it
+def decodeRun(interp, pos, dir):
+    pos = list(pos)
+    ops = []
+    length = 0
+    mode = Modes.DEFAULT
+    end = None
+    visited = set()
+
+    while True:
+        # Runs can only end in default mode, between blocks
+        if mode == Modes.DEFAULT:
+            end = (len(ops), length, tuple(pos), dir)
+            if (tuple(pos), dir) in visited or length >= MAX_RUN_LENGTH:
+                break
+            visited.add((tuple(pos), dir))
+
+        try:
+            block = interp.getBlock(*pos)
+        except CraftyFungeError:
+            break
+        step = 1
+
+        if mode == Modes.DEFAULT:
+            if block in BLOCK_OPS:
+                # Only divide by a known divisor, so errors are left to the interpreter
+                if block in (DIV, MOD) and not (ops and ops[-1][0] == 'push' and ops[-1][1] != 0):
+                    break
+                ops.append((BLOCK_OPS[block], ))
+            elif block in PATH_BLOCKS:
+                if block == DIR:
+                    dir = interp.getFacing(*pos)
+                elif block == SKIP:
+                    step = 2
+                elif block == PUSH_NEXT_BLOCK:
+                    try:
+                        value = blockValue(interp, ahead(pos, dir))
+                    except CraftyFungeError:
+                        break
+                    if value is not None:
+                        ops.append(('push', value))
+                    step = 2
+                elif block == PUSH_POS:
+                    ops += [('push', n) for n in pos]
+                elif block == TUNNEL:
+                    mode = Modes.TUNNEL
+                elif block == IN_NUM_LITERAL:
+                    mode = Modes.IN_NUM_LITERAL
+                    n, sign = 0, +1
+                elif block == IN_STR_LITERAL:
+                    mode = Modes.IN_STR_LITERAL
+            elif block in VALID_COLORS:
+                ops.append(('push', BLOCK_TO_PUSHNUM[block]))
+            elif block in INSTRUCTION_BLOCKS:
+                break
+
+        elif mode == Modes.TUNNEL:
+            if block == TUNNEL:
+                mode = Modes.DEFAULT
+
+        # Pushing 0 then replacing it with each digit is the same as pushing the whole number
+        elif mode == Modes.IN_NUM_LITERAL:
+            if block == IN_NUM_LITERAL:
+                ops.append(('push', n))
+                mode = Modes.DEFAULT
+            elif block == DIR:
+                dir = interp.getFacing(*pos)
+            elif block == NEG:
+                sign = -1
+                n = -abs(n)
+            elif block in VALID_COLORS and not (block.startswith('white') and not block.endswith('concrete')):
+                digit = BLOCK_TO_PUSHNUM[block]
+                while digit // 10 > 0:
+                    digit //= 10
+                n = (abs(n)*10 + digit) * sign
+
+        elif mode == Modes.IN_STR_LITERAL:
+            if block == IN_STR_LITERAL:
+                mode = Modes.DEFAULT
+            else:
+                try:
+                    value = blockValue(interp, pos)
+                except CraftyFungeError:
+                    break
+                if value is not None:
+                    ops.append(('push', value))
+
+        length += 1
+        pos = ahead(pos, dir, step)
+
+    opCount, length, endPos, endDir = end
+    if length < 2:
+        return None
+    return Run(ops[:opCount], length, endPos, endDir)
+
+
+def isPush(op):
+    return op[0] == 'push'
+
+
+# Tries to rewrite the last few ops. Returns whether anything changed
+def rewriteTail(ops):
+    if len(ops) >= 3 and isPush(ops[-3]) and isPush(ops[-2]) and ops[-1][0] in BINARY_OPS:
+        a, b, name = ops[-3][1], ops[-2][1], ops[-1][0]
+        if not (name in ('div', 'mod') and b == 0) and not (name == 'exp' and b > MAX_FOLDED_EXPONENT):
+            ops[-3:] = [('push', BINARY_OPS[name][0](a, b))]
+            return True
+
+    if len(ops) >= 2:
+        first, second = ops[-2], ops[-1]
+        # Constant through a unary op
+        if isPush(first) and second[0] in UNARY_OPS:
+            ops[-2:] = [('push', UNARY_OPS[second[0]][0](first[1]))]
+            return True
+        # Pairs that undo each other
+        if (isPush(first) or first[0] == 'dup') and second[0] == 'pop':
+            del ops[-2:]
+            return True
+        if first[0] == second[0] and first[0] in ('swap', 'neg'):
+            del ops[-2:]
+            return True
+        # A result that's thrown away only needs its operands popped. Divisions here never fail
+        if first[0] in UNARY_OPS and second[0] == 'pop':
+            ops[-2:] = [('pop', )]
+            return True
+        if first[0] in BINARY_OPS and second[0] == 'pop':
+            ops[-2:] = [('pop', ), ('pop', )]
+            return True
+        if isPush(first) and second[0] == 'dup':
+            ops[-1] = first
+            return True
+        if first[0] == 'dup' and second[0] == 'swap':
+            del ops[-1]
+            return True
+
+    if len(ops) >= 3 and isPush(ops[-3]) and isPush(ops[-2]) and ops[-1][0] == 'swap':
+        ops[-3:] = [ops[-2], ops[-3]]
+        return True
+
+    return False
+
+
+# Combines common sequences into single ops
+def fuse(ops):
+    fused = []
+    for op in ops:
+        last = fused[-1] if fused else (None, )
+        if op[0] in BINARY_OPS and isPush(last):
+            fused[-1] = ('binConst', op[0], last[1])
+        elif op[0] in BINARY_OPS and last[0] == 'dup':
+            fused[-1] = ('dupOp', op[0])
+        elif isPush(op) and last[0] in ('push', 'pushN'):
+            values = (last[1], ) if isPush(last) else last[1]
+            fused[-1] = ('pushN', values + (op[1], ))
+        elif op[0] == 'pop' and last[0] in ('pop', 'popN'):
+            fused[-1] = ('popN', 2 if last[0] == 'pop' else last[1] + 1)
+        else:
+            fused.append(op)
+    return fused
+
+
+def optimize(ops):
+    optimized = []
+    for op in ops:
+        optimized.append(op)
+        while rewriteTail(optimized):
+            pass
+    return fuse(optimized)
+
+
+# Lines of Python for one op, on a deque named stack
+def opSource(op):
+    name = op[0]
+    popTop = 'pop() if stack else 0'
+
+    def pushConst(n):
+        return [f'append({n})'] if n != 0 else ['if stack: append(0)']
+
+    if name == 'push':
+        return pushConst(op[1])
+    if name == 'pushN':
+        return [line for n in op[1] for line in pushConst(n)]
+    if name == 'pop':
+        return ['if stack: pop()']
+    if name == 'popN':
+        return [f'for _ in range(min({op[1]}, len(stack))): pop()']
+    if name in UNARY_OPS:
+        return [f'a = {popTop}', f'r = {UNARY_OPS[name][1].format(a="a")}', 'if r or stack: append(r)']
+    if name in BINARY_OPS:
+        return [f'b = {popTop}', f'a = {popTop}', f'r = {BINARY_OPS[name][1].format(a="a", b="b")}', 'if r or stack: append(r)']
+    if name == 'binConst':
+        return [f'a = {popTop}', f'r = {BINARY_OPS[op[1]][1].format(a="a", b=op[2])}', 'if r or stack: append(r)']
+    if name == 'dupOp':
+        return [f'a = {popTop}', f'r = {BINARY_OPS[op[1]][1].format(a="a", b="a")}', 'if r or stack: append(r)']
+    if name == 'dup':
+        return [f'a = {popTop}', 'if a or stack: append(a)', 'if a or stack: append(a)']
+    if name == 'swap':
+        return [f'b = {popTop}', f'a = {popTop}', 'if b or stack: append(b)', 'if a or stack: append(a)']
+    if name == 'clear':
+        return ['stack.clear()']
+    if name == 'len':
+        return ['if stack: append(len(stack))']
+    raise ValueError(f'Unknown op "{name}".')
+
+
+def compileOps(ops):
+    source = 'def run(stack):\n'
+    source += '    pop = stack.pop\n'
+    source += '    append = stack.append\n'
+    source += ''.join(f'    {line}\n' for op in ops for line in opSource(op))
+
+    namespace = dict()
+    exec(compile(source, '<run>', 'exec'), namespace)
+    return namespace['run']
+
+
+# Runs an interpreter, doing straight runs of stack instructions all at once
+class RunOptimizer():
+    def __init__(self, interp):
+        self.interp = interp
+        self.runs = dict()
+        self.visits = dict()
+        self.cellsHash = interp.cellsHash
+
+
+    def run(self):
+        interp = self.interp
+        runs = self.runs
+
+        while interp.running:
+            stack = interp.stack
+            if interp.mode == Modes.DEFAULT and not (stack and stack[0] == 0):
+                # Runs read blocks along the path, so start over if the world changed
+                if interp.cellsHash != self.cellsHash:
+                    self.cellsHash = interp.cellsHash
+                    runs.clear()
+                    self.visits.clear()
+
+                key = (tuple(interp.pos), interp.dir)
+                run = runs.get(key)
+                if run is None and key not in runs:
+                    visits = self.visits.get(key, 0) + 1
+                    self.visits[key] = visits
+                    if visits >= HOT_THRESHOLD:
+                        run = runs[key] = decodeRun(interp, *key)
+
+                if run is not None:
+                    run.function(stack)
+                    interp.steps += run.length
+                    interp.pos = list(run.endPos)
+                    interp.dir = run.endDir
+                    continue
+
+            interp.block = interp.getBlock(*interp.pos)
+            interp.steps += 1
+            interp.runStep()
+
+            if not interp.wentTo:
+                interp.move()
+            interp.wentTo = False
@@ -0,0 +1,360 @@
+# Runs programs on request from a long-lived process, keeping them parsed between runs
+# Copyright 2022 Eli Fox
+
+import collections, concurrent.futures, hashlib, io, itertools, json
+import os, socket, socketserver, sys, threading, time
+
+from common import *
+import craftyfunge
+from craftyfunge import CraftyFunge
+
+# Steps run between checks of a run's limits and whether it was cancelled
+CHECK_INTERVAL = 1000
+DEFAULT_CACHE_MB = 256
+
+
+# Roughly how much memory parsed blocks take up, following lists, dicts, and strings
+def objectSize(obj):
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(objectSize(key) + objectSize(value) for key, value in obj.items())
+    elif isinstance(obj, list):
+        size += sum(objectSize(item) for item in obj)
+    return size
+
+
+# Parsed programs, keyed by a hash of the file, dropping the least recently used past a memory cap
+class ProgramCache():
+    def __init__(self, maxBytes):
+        self.maxBytes = maxBytes
+        self.entries = collections.OrderedDict() # Hash to (blocks, size in bytes)
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+
+    @staticmethod
+    def hashFile(programFile):
+        with open(programFile, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+
+
+    # Gets the parsed blocks of a program, the hash they're kept under, and if they were already parsed
+    def get(self, programFile):
+        key = ProgramCache.hashFile(programFile)
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key][0], key, True
+
+        # Parsing is slow, so it isn't done holding the lock. Two requests might both parse a new program
+        blocks = CraftyFunge(programFile, False, input=io.StringIO(), output=io.StringIO()).blocks
+        size = objectSize(blocks)
+        with self.lock:
+            self.misses += 1
+            if key not in self.entries:
+                self.entries[key] = (blocks, size)
+                self.bytes += size
+            self.entries.move_to_end(key)
+
+            # The newest program is kept even if it's bigger than the cap by itself
+            while self.bytes > self.maxBytes and len(self.entries) > 1:
+                _, (_, evictedSize) = self.entries.popitem(last=False)
+                self.bytes -= evictedSize
+
+        return blocks, key, False
+
+
+    def getStats(self):
+        with self.lock:
+            return {'programs': len(self.entries), 'bytes': self.bytes, 'hits': self.hits, 'misses': self.misses}
+
+
+# One client. Responses can come from any thread, and cancelling only reaches the client's own runs
+class Connection():
+    def __init__(self, output):
+        self.output = output
+        self.lock = threading.Lock()
+        self.active = dict() # Run request id to an event set to cancel it
+
+
+    def respond(self, response):
+        with self.lock:
+            self.output.write(json.dumps(response) + '\n')
+            self.output.flush()
+
+
+# Handles requests, one JSON object per line, with each response also on one line
+class Server():
+    def __init__(self, useWorldPath=False, maxSteps=None, timeout=None, cacheMb=DEFAULT_CACHE_MB, workers=4):
+        self.useWorldPath = useWorldPath
+        self.maxSteps = maxSteps
+        self.timeout = timeout
+        self.cache = ProgramCache(cacheMb * 2**20)
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+
+        self.ops = {
+            'load'      : self.load,
+            'run'       : self.run,
+            'cancel'    : self.cancel,
+            'stats'     : self.stats,
+        }
+
+
+    # Answers one request line. Runs are answered when they finish
+    def handle(self, connection, line):
+        if not line.strip():
+            return
+
+        requestId = None
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError('Request must be a JSON object.')
+
+            requestId = request.get('id')
+            op = self.ops.get(request.get('op'))
+            if op is None:
+                raise ValueError(f'Unknown op "{request.get("op")}". Must be one of {", ".join(self.ops)}.')
+
+            response = op(connection, request)
+        # Nothing one request does should stop the server
+        except Exception as e:
+            response = {'ok': False, 'message': str(e)}
+
+        if response is not None:
+            connection.respond({'id': requestId, **response})
+
+
+    def getProgramFile(self, request):
+        if 'program' not in request:
+            raise ValueError('Request is missing "program".')
+
+        useWorldPath = request.get('world', self.useWorldPath)
+        if not isinstance(request['program'], str) or not isinstance(useWorldPath, bool):
+            raise ValueError('"program" must be a string and "world" true or false.')
+
+        # The world path is only read at startup with -w, so it's read the first time a request asks for it otherwise
+        if useWorldPath and not hasattr(craftyfunge, 'WORLD_PATH'):
+            craftyfunge.WORLD_PATH = readConfig()
+
+        programFile = CraftyFunge.getProgramFile(request['program'], useWorldPath)
+        if not os.path.isfile(programFile):
+            raise ValueError(f'No such program "{programFile}".')
+        return programFile
+
+
+    # Parses a program ahead of time, so its first run is as fast as the rest
+    def load(self, connection, request):
+        blocks, key, cached = self.cache.get(self.getProgramFile(request))
+        return {'ok': True, 'hash': key, 'cached': cached}
+
+
+    # Checks the types of a run's fields, so a run never starts on values the interpreter can't use
+    @staticmethod
+    def checkRunRequest(request):
+        isInt = lambda value: isinstance(value, int) and not isinstance(value, bool)
+        stack = request.get('stack', [])
+        if not isinstance(stack, list) or not all(isInt(n) for n in stack):
+            raise ValueError('"stack" must be a list of integers.')
+        if not isinstance(request.get('input', ''), str):
+            raise ValueError('"input" must be a string.')
+        if request.get('maxSteps') is not None and not isInt(request['maxSteps']):
+            raise ValueError('"maxSteps" must be an integer.')
+        if request.get('timeout') is not None and (not isinstance(request['timeout'], (int, float)) or isinstance(request['timeout'], bool)):
+            raise ValueError('"timeout" must be a number.')
+
+
+    def run(self, connection, request):
+        Server.checkRunRequest(request)
+        programFile = self.getProgramFile(request)
+        cancelled = threading.Event()
+        if 'id' in request:
+            connection.active[request['id']] = cancelled
+
+        self.executor.submit(self.runRequest, connection, request, programFile, cancelled)
+
+
+    def cancel(self, connection, request):
+        cancelled = connection.active.get(request.get('target'))
+        if cancelled is not None:
+            cancelled.set()
+        return {'ok': True, 'cancelled': cancelled is not None}
+
+
+    def stats(self, connection, request):
+        return {'ok': True, 'cache': self.cache.getStats()}
+
+
+    # Runs a program on a worker thread and responds with how it went
+    def runRequest(self, connection, request, programFile, cancelled):
+        requestId = request.get('id')
+        try:
+            response = self.runProgram(request, programFile, cancelled)
+        except Exception as e:
+            response = {'ok': False, 'message': str(e)}
+        finally:
+            connection.active.pop(requestId, None)
+
+        connection.respond({'id': requestId, **response})
+
+
+    def runProgram(self, request, programFile, cancelled):
+        blocks, key, cached = self.cache.get(programFile)
+        interp = CraftyFunge(programFile, False, input=io.StringIO(request.get('input', '')), output=io.StringIO(),
+                             stack=request.get('stack', []), blocks=blocks)
+
+        maxSteps = request.get('maxSteps', self.maxSteps)
+        timeout = request.get('timeout', self.timeout)
+        runStart = time.perf_counter()
+        deadline = runStart + timeout if timeout is not None else None
+
+        # Steps are run in chunks, checking the limits in between
+        stopped = None
+        error = None
+        try:
+            while interp.running:
+                chunk = CHECK_INTERVAL if maxSteps is None else min(CHECK_INTERVAL, maxSteps - interp.steps)
+                for _ in range(chunk):
+                    if not interp.running:
+                        break
+                    interp.step()
+
+                if not interp.running:
+                    break
+                elif cancelled.is_set():
+                    stopped = 'cancelled'
+                elif maxSteps is not None and interp.steps >= maxSteps:
+                    stopped = 'maxSteps'
+                elif deadline is not None and time.perf_counter() >= deadline:
+                    stopped = 'timeout'
+
+                if stopped is not None:
+                    break
+        except CraftyFungeError as e:
+            error = {'pos': list(e.pos), 'msg': e.msg}
+        # Outputting a value that isn't a character
+        except ValueError as e:
+            error = {'pos': list(interp.pos), 'msg': str(e)}
+
+        return {
+            'ok'        : True,
+            'output'    : interp.output.getvalue(),
+            'steps'     : interp.steps,
+            'stack'     : list(interp.stack),
+            'error'     : error,
+            'stopped'   : stopped,
+            'hash'      : key,
+            'cached'    : cached,
+            'time'      : time.perf_counter() - runStart,
+        }
+
+
+    # Serves one client over a pair of files until the input ends, then waits for its runs to finish
+    def serveFiles(self, input, output):
+        connection = Connection(output)
+        for line in input:
+            self.handle(connection, line)
+        self.executor.shutdown(wait=True)
+
+
+    # Serves any number of clients over a Unix socket, until interrupted
+    def serveUnix(self, path):
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                connection = Connection(io.TextIOWrapper(self.wfile, encoding='utf-8', write_through=True))
+                for line in io.TextIOWrapper(self.rfile, encoding='utf-8'):
+                    server.handle(connection, line)
+
+        if os.path.exists(path):
+            os.unlink(path)
+        with socketserver.ThreadingUnixStreamServer(path, Handler) as unixServer:
+            try:
+                unixServer.serve_forever()
+            finally:
+                os.unlink(path)
+                self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Talks to a server over its Unix socket, one request at a time
+class Client():
+    def __init__(self, path):
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.connect(path)
+        self.file = self.socket.makefile('rw', encoding='utf-8')
+        self.ids = itertools.count()
+        self.responses = dict() # Responses that came while waiting for another
+
+
+    # Sends a request without waiting, giving its id
+    def send(self, op, **fields):
+        requestId = next(self.ids)
+        self.file.write(json.dumps({'id': requestId, 'op': op, **fields}) + '\n')
+        self.file.flush()
+        return requestId
+
+
+    # Waits for the response to a request
+    def receive(self, requestId):
+        if requestId in self.responses:
+            return self.responses.pop(requestId)
+        for line in self.file:
+            response = json.loads(line)
+            if response.get('id') == requestId:
+                return response
+            self.responses[response.get('id')] = response
+        raise ConnectionError('Server closed the connection.')
+
+
+    def request(self, op, **fields):
+        return self.receive(self.send(op, **fields))
+
+
+    def load(self, program):
+        return self.request('load', program=program)
+
+
+    def run(self, program, input='', **limits):
+        return self.request('run', program=program, input=input, **limits)
+
+
+    def close(self):
+        self.file.close()
+        self.socket.close()
+
+
+def parseArgs(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Serve CraftyFunge runs as JSON lines, keeping programs parsed between them.', prog='craftyfunge serve')
+    parser.add_argument('-u', dest='socketPath', metavar='SOCKET', default=None, help='Listen on a Unix socket at SOCKET. Uses stdin and stdout if not given.')
+    parser.add_argument('-w', dest='useWorldPath', action='store_true', help='Load programs from the configured structure block export location by default.')
+    parser.add_argument('-n', dest='maxSteps', metavar='STEPS', type=int, default=None, help='Stop runs after STEPS steps unless a request says otherwise.')
+    parser.add_argument('-t', dest='timeout', metavar='SECONDS', type=float, default=None, help='Stop runs after SECONDS seconds unless a request says otherwise.')
+    parser.add_argument('-c', dest='cacheMb', metavar='MB', type=float, default=DEFAULT_CACHE_MB, help=f'Keep at most about MB megabytes of parsed programs. Defaults to {DEFAULT_CACHE_MB}.')
+    parser.add_argument('-j', dest='workers', metavar='WORKERS', type=int, default=4, help='Run up to WORKERS programs at once. Defaults to 4.')
+
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parseArgs(argv)
+    if args.useWorldPath:
+        craftyfunge.WORLD_PATH = readConfig()
+
+    server = Server(args.useWorldPath, args.maxSteps, args.timeout, args.cacheMb, args.workers)
+    if args.socketPath is None:
+        server.serveFiles(sys.stdin, sys.stdout)
+    else:
+        try:
+            server.serveUnix(args.socketPath)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
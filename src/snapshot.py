@@ -0,0 +1,136 @@
+# Packs interpreter state into a compact binary blob and back
+# Copyright 2022 Eli Fox
+
+import json, zlib
+
+SNAPSHOT_MAGIC = b'CFSN'
+SNAPSHOT_VERSION = 1
+
+
+# Zigzag varint encoding, so arbitrarily large (and negative) numbers stay small
+def packInt(out, n):
+    n = (n << 1) if n >= 0 else ((-n << 1) - 1)
+    while n >= 0x80:
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def unpackInt(data, i):
+    n = 0
+    shift = 0
+    while True:
+        byte = data[i]
+        i += 1
+        n |= (byte & 0x7f) << shift
+        shift += 7
+        if byte < 0x80:
+            break
+
+    n = (n >> 1) if not (n & 1) else -((n + 1) >> 1)
+    return n, i
+
+
+def packStr(out, s):
+    encoded = s.encode('utf-8')
+    packInt(out, len(encoded))
+    out.extend(encoded)
+
+
+def unpackStr(data, i):
+    length, i = unpackInt(data, i)
+    return data[i:i+length].decode('utf-8'), i+length
+
+
+# Turns a state dict from CraftyFunge.getState into bytes
+def packState(state):
+    out = bytearray()
+
+    # Position and motion
+    for n in state['pos']:
+        packInt(out, n)
+    for n in (state['dir'], state['mode'], state['sign'],
+              state['running'], state['wentTo'], state['steps']):
+        packInt(out, n)
+
+    # Stack and vars
+    packInt(out, len(state['stack']))
+    for n in state['stack']:
+        packInt(out, n)
+
+    packInt(out, len(state['vars']))
+    for index, val in state['vars'].items():
+        packInt(out, index)
+        packInt(out, val)
+
+    # I/O cursors. The input buffer can hold None for a re-added EOF
+    packInt(out, state['inputLine'])
+    packInt(out, len(state['inputBuffer']))
+    for c in state['inputBuffer']:
+        packInt(out, 0 if c is None else ord(c)+1)
+    packInt(out, state['outputLen'])
+
+    # Cells changed by setBlock
+    packInt(out, len(state['cells']))
+    for (x, y, z), block in state['cells'].items():
+        for n in (x, y, z):
+            packInt(out, n)
+        packStr(out, json.dumps(block, separators=(',', ':')))
+
+    return SNAPSHOT_MAGIC + bytes([SNAPSHOT_VERSION]) + zlib.compress(bytes(out))
+
+
+# Turns bytes from packState back into a state dict
+def unpackState(blob):
+    if blob[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+        raise ValueError('Not a CraftyFunge snapshot.')
+    if blob[len(SNAPSHOT_MAGIC)] != SNAPSHOT_VERSION:
+        raise ValueError(f'Unsupported snapshot version {blob[len(SNAPSHOT_MAGIC)]}.')
+
+    data = zlib.decompress(blob[len(SNAPSHOT_MAGIC)+1:])
+    i = 0
+    state = dict()
+
+    pos = []
+    for _ in range(3):
+        n, i = unpackInt(data, i)
+        pos.append(n)
+    state['pos'] = pos
+    for key in ('dir', 'mode', 'sign', 'running', 'wentTo', 'steps'):
+        state[key], i = unpackInt(data, i)
+
+    length, i = unpackInt(data, i)
+    stack = []
+    for _ in range(length):
+        n, i = unpackInt(data, i)
+        stack.append(n)
+    state['stack'] = stack
+
+    length, i = unpackInt(data, i)
+    variables = dict()
+    for _ in range(length):
+        index, i = unpackInt(data, i)
+        variables[index], i = unpackInt(data, i)
+    state['vars'] = variables
+
+    state['inputLine'], i = unpackInt(data, i)
+    length, i = unpackInt(data, i)
+    inputBuffer = []
+    for _ in range(length):
+        n, i = unpackInt(data, i)
+        inputBuffer.append(None if n == 0 else chr(n-1))
+    state['inputBuffer'] = inputBuffer
+    state['outputLen'], i = unpackInt(data, i)
+
+    length, i = unpackInt(data, i)
+    cells = dict()
+    for _ in range(length):
+        pos = []
+        for _ in range(3):
+            n, i = unpackInt(data, i)
+            pos.append(n)
+        block, i = unpackStr(data, i)
+        cells[tuple(pos)] = json.loads(block)
+    state['cells'] = cells
+
+    return state
\ No newline at end of file
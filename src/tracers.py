@@ -0,0 +1,91 @@
+# Hooks for watching the interpreter run, and the tracers built on them
+# Copyright 2022 Eli Fox
+#
+# Hooks are registered with CraftyFunge.addHook, or all at once from an object's methods with
+# addPlugin. When nothing is registered the interpreter runs without checking for any.
+#
+#   onStep(block)               Before running a block
+#   onStepEnd(block)            After running a block, before moving
+#   onPush(n)                   After a value is pushed onto the stack
+#   onPop(n)                    After a value is popped off the stack. Popping an empty stack gives 0 without calling this
+#   onOutput(s)                 After text is output
+#   onSetBlock(pos, block)      After a block is set, with its world position and block dict
+#   onModeChange(old, new)      After a step changes the mode
+#   onEnd()                     After the program stops
+
+import collections, io
+
+HOOK_NAMES = ('onStep', 'onStepEnd', 'onPush', 'onPop', 'onOutput', 'onSetBlock', 'onModeChange', 'onEnd')
+
+# Hooks that need the instrumented run loop. The others are handled without touching the loop
+STEP_HOOK_NAMES = ('onStep', 'onStepEnd', 'onModeChange')
+
+
+# A stack that calls hooks when pushed to or popped from. Only used while something is listening
+class HookedStack(collections.deque):
+    def __init__(self, iterable, onPush, onPop):
+        super().__init__(iterable)
+        self.onPush = onPush
+        self.onPop = onPop
+
+    def append(self, n):
+        super().append(n)
+        for hook in self.onPush:
+            hook(n)
+
+    def pop(self):
+        n = super().pop()
+        for hook in self.onPop:
+            hook(n)
+        return n
+
+
+# Prints the position, block, stack, and vars after every step, holding the program's output until the end
+class DebugTracer():
+    def __init__(self, interp, debugOut):
+        self.interp = interp
+        self.debugOut = debugOut
+        self.debugBuffer = []
+
+        # Take over the output, to print it all at the end
+        self.output = interp.output
+        self.outputBuffer = io.StringIO()
+        interp.output = self.outputBuffer
+
+        self.initPos = None
+
+
+    def onStep(self, block):
+        self.initPos = self.interp.pos.copy()
+
+
+    def onOutput(self, s):
+        self.debugBuffer.append(f'  Out: {s}')
+
+
+    def onStepEnd(self, block):
+        interp = self.interp
+        stackAsText = ''.join([chr(n) for n in interp.stack if (n >= 32 and n < 127)])
+        self.debugBuffer.append(f' Step: {interp.steps}')
+        self.debugBuffer.append(f'  Pos: {self.initPos}')
+        self.debugBuffer.append(f'Block: {block}')
+        self.debugBuffer.append(f'Stack: {list(interp.stack)} {repr(stackAsText)}')
+        self.debugBuffer.append(f' Vars: {interp.vars}')
+
+        # See if we have any output
+        if len(self.debugBuffer) > 5:
+            out = self.debugBuffer.pop(0)
+            self.debugBuffer.append(out)
+
+        print('\n'.join(self.debugBuffer), file=self.debugOut)
+        self.debugBuffer = []
+
+        print(file=self.debugOut)
+
+
+    def onEnd(self):
+        print(f'Program terminated in {self.interp.steps} steps.', file=self.debugOut)
+        print('Final Output:', file=self.debugOut)
+        finalOut = self.outputBuffer.getvalue()
+        print(finalOut, file=self.output)
+        if self.debugOut != self.output: print(finalOut, file=self.debugOut)